@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+
+from huggingface_hub import hf_hub_download
+
+__all__ = ['ArtifactResolver', 'file_sha256']
+
+MANIFEST_FILENAME = 'manifest.json'
+OFFLINE_ENV = 'KOKORO_OFFLINE'  # Set to 1 to never contact the hub
+VERIFY_ENV = 'KOKORO_VERIFY_ARTIFACTS'  # Set to 1 to re-hash artifacts on every resolution
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _env_flag(name):
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes')
+
+class ArtifactResolver:
+    """Offline-first resolver for files of a hub repository.
+
+    The first time a file is resolved it is fetched through hf_hub_download (from the local
+    hub cache if it is already there, from the network otherwise) and recorded in a JSON
+    manifest with its path, size, mtime and SHA-256. Later resolutions are answered from the
+    manifest after a stat() of the file, without any hub call. A file whose size or mtime
+    changed is re-hashed: it is kept if the hash still matches and fetched again otherwise.
+
+    Args:
+        repo_id: Hub repository the files come from
+        cache_dir: hf_hub_download cache directory; the manifest is stored in it
+        offline: Never contact the hub; unrecorded files must already be in the hub cache
+            (default: the KOKORO_OFFLINE or HF_HUB_OFFLINE environment variable)
+        verify: Check the SHA-256 of a file on every resolution, not only when its size or
+            mtime changed (default: the KOKORO_VERIFY_ARTIFACTS environment variable)
+    """
+
+    def __init__(self, repo_id, cache_dir, offline=None, verify=None):
+        self.repo_id = repo_id
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_FILENAME)
+        self.offline = (_env_flag(OFFLINE_ENV) or _env_flag('HF_HUB_OFFLINE')) if offline is None else offline
+        self.verify = _env_flag(VERIFY_ENV) if verify is None else verify
+        self.network_calls = 0
+        self._lock = threading.Lock()
+        self._manifest = self._read_manifest()
+
+    def resolve(self, filename):
+        """Return the local path of filename, fetching and recording it if needed.
+
+        Raises:
+            FileNotFoundError: If the file is not available locally and the resolver is offline
+        """
+        with self._lock:
+            entry = self._manifest.get(filename)
+            if entry is not None and self._is_valid(entry):
+                return entry['path']
+            path = self._fetch(filename)
+            stat = os.stat(path)
+            self._manifest[filename] = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                        'sha256': file_sha256(path)}
+            self._write_manifest()
+            return path
+
+    def verify_all(self):
+        """Hash every recorded file; returns {filename: True if it still matches the manifest}."""
+        with self._lock:
+            return {filename: os.path.isfile(entry['path']) and file_sha256(entry['path']) == entry['sha256']
+                    for filename, entry in self._manifest.items()}
+
+    def entries(self):
+        """Copy of the manifest, filename -> {'path', 'size', 'mtime_ns', 'sha256'}."""
+        with self._lock:
+            return {filename: dict(entry) for filename, entry in self._manifest.items()}
+
+    def _is_valid(self, entry):
+        try:
+            stat = os.stat(entry['path'])
+        except OSError:
+            return False
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns == entry['mtime_ns'] and not self.verify:
+            return True
+        if file_sha256(entry['path']) != entry['sha256']:
+            return False
+        if stat.st_mtime_ns != entry['mtime_ns']:
+            # Same content under a new mtime (e.g. the cache was copied): skip the hash next time
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self._write_manifest()
+        return True
+
+    def _fetch(self, filename):
+        # The local hub cache is tried first, so a populated cache never waits on the network
+        try:
+            return hf_hub_download(repo_id=self.repo_id, filename=filename, cache_dir=self.cache_dir,
+                                   local_files_only=True)
+        except Exception as e:
+            if self.offline:
+                raise FileNotFoundError(f"{filename} is not in {self.cache_dir} and the hub is disabled "
+                                        f"({OFFLINE_ENV}/HF_HUB_OFFLINE)") from e
+        print(f"Downloading {filename} from {self.repo_id}...")
+        self.network_calls += 1
+        return hf_hub_download(repo_id=self.repo_id, filename=filename, cache_dir=self.cache_dir)
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('repo_id') == self.repo_id:
+                return manifest['files']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable artifact manifest {self.manifest_path}: {e}")
+        return {}
+
+    def _write_manifest(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'repo_id': self.repo_id, 'files': self._manifest}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
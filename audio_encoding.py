@@ -0,0 +1,80 @@
+import io
+import shutil
+import subprocess
+
+import numpy as np
+import soundfile as sf
+
+__all__ = ['available_formats', 'encode_audio', 'mime_type', 'register_encoder']
+
+# format -> (encode(audio, sample_rate) -> bytes, MIME type)
+_encoders = {}
+
+def register_encoder(format, encode, mime):
+    """Register (or replace) the encoder of an output format.
+
+    Args:
+        format: Format name, also used as the file extension (e.g. 'opus')
+        encode: Function taking a mono float waveform and its sample rate and returning
+            the encoded file as bytes
+        mime: MIME type of the encoded file
+    """
+    _encoders[format] = (encode, mime)
+
+def available_formats():
+    """Names of the formats encode_audio() supports here, in registration order."""
+    return list(_encoders)
+
+def mime_type(format):
+    return _encoders[format][1]
+
+def encode_audio(audio, sample_rate, format='wav'):
+    """Encode a waveform to an audio file in memory.
+
+    Args:
+        audio: Mono waveform, a float NumPy array in [-1, 1]
+        sample_rate: Sample rate in Hz
+        format: One of available_formats()
+
+    Returns:
+        The encoded file as bytes
+
+    Raises:
+        ValueError: If the format has no encoder
+    """
+    encoder = _encoders.get(format)
+    if encoder is None:
+        raise ValueError(f"Unsupported audio format '{format}'. Available formats: {', '.join(_encoders)}")
+    return encoder[0](audio, sample_rate)
+
+def _soundfile_encoder(format, subtype):
+    def encode(audio, sample_rate):
+        buffer = io.BytesIO()
+        sf.write(buffer, audio, sample_rate, format=format, subtype=subtype)
+        return buffer.getvalue()
+    return encode
+
+def _ffmpeg_encoder(ffmpeg, args):
+    # 16-bit PCM goes in on stdin and the encoded file comes back on stdout, without temp files
+    def encode(audio, sample_rate):
+        pcm = (np.clip(audio, -1, 1) * 32767).astype('<i2').tobytes()
+        command = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-f', 's16le', '-ar', str(sample_rate),
+                   '-ac', '1', '-i', 'pipe:0', *args, 'pipe:1']
+        return subprocess.run(command, input=pcm, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout
+    return encode
+
+def _register_builtin_encoders():
+    formats = sf.available_formats()
+    register_encoder('wav', _soundfile_encoder('WAV', 'PCM_16'), 'audio/wav')
+    register_encoder('flac', _soundfile_encoder('FLAC', 'PCM_16'), 'audio/flac')
+    register_encoder('ogg', _soundfile_encoder('OGG', 'VORBIS'), 'audio/ogg')
+    ffmpeg = shutil.which('ffmpeg')
+    # libsndfile encodes MP3 from version 1.1.0; older builds go through ffmpeg when it is installed
+    if 'MP3' in formats:
+        register_encoder('mp3', _soundfile_encoder('MP3', 'MPEG_LAYER_III'), 'audio/mpeg')
+    elif ffmpeg:
+        register_encoder('mp3', _ffmpeg_encoder(ffmpeg, ['-b:a', '192k', '-f', 'mp3']), 'audio/mpeg')
+    if ffmpeg:
+        register_encoder('aac', _ffmpeg_encoder(ffmpeg, ['-b:a', '192k', '-f', 'adts']), 'audio/aac')
+
+_register_builtin_encoders()
@@ -0,0 +1,232 @@
+"""Render book-length text files to audio with a pipeline of concurrent stages.
+
+Segmentation, phonemization, synthesis and writing each run on their own thread,
+connected by bounded queues: espeak and file I/O overlap with the model instead of
+waiting for it, and memory stays the same whatever the length of the book, since at
+most a few queued items exist between stages. Audio is written to the output file
+as it is produced, in reading order.
+
+Usage:
+    python audiobook.py book.txt book.flac --voice af_bella
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+
+import soundfile as sf
+import torch
+from tqdm.auto import tqdm
+
+from models import SAMPLE_RATE, KokoroEngine
+
+__all__ = ['render_audiobook']
+
+QUEUE_SIZE = 8  # Items waiting between two stages
+PHONEMIZE_BATCH = 32  # Queued sentences phonemized in one espeak call
+# Output extension -> (soundfile format, subtype); all of them can be written chunk by chunk
+OUTPUT_FORMATS = {
+    '.wav': ('WAV', 'PCM_16'),
+    '.flac': ('FLAC', 'PCM_16'),
+    '.ogg': ('OGG', 'VORBIS'),
+    '.mp3': ('MP3', 'MPEG_LAYER_III'),
+}
+
+_DONE = object()  # Sent down the queues after the last item
+
+class _Pipeline:
+    # Threads running one stage each. A failing stage stops the others, which would
+    # otherwise block forever on a queue nobody reads or fills any more.
+
+    def __init__(self):
+        self.stop = threading.Event()
+        self.error = None
+        self.busy = {}  # Seconds each stage spent working rather than waiting on a queue
+        self._threads = []
+
+    def put(self, q, item):
+        start = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                self._waited(start)
+                return
+            except queue.Full:
+                pass
+        raise _Stopped
+
+    def get(self, q):
+        start = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                item = q.get(timeout=0.1)
+                self._waited(start)
+                return item
+            except queue.Empty:
+                pass
+        raise _Stopped
+
+    def items(self, q):
+        # Items of q up to _DONE
+        while True:
+            item = self.get(q)
+            if item is _DONE:
+                return
+            yield item
+
+    def _waited(self, start):
+        name = threading.current_thread().name
+        self.busy[name] -= time.perf_counter() - start
+
+    def start(self, name, target, *args):
+        def run():
+            self.busy[name] = -time.perf_counter()
+            try:
+                target(*args)
+            except _Stopped:
+                pass
+            except BaseException as e:
+                self.error = self.error or e
+                self.stop.set()
+            self.busy[name] += time.perf_counter()
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def join(self):
+        try:
+            for thread in self._threads:
+                thread.join()
+        except BaseException:
+            # Interrupted (Ctrl+C): stop the stages, then let the interrupt through
+            self.stop.set()
+            for thread in self._threads:
+                thread.join()
+            raise
+        if self.error is not None:
+            raise self.error
+
+class _Stopped(Exception):
+    pass
+
+def _segment(pipeline, kokoro, input_path, out):
+    # Reads the book line by line: (sentence, input bytes read so far), in order
+    with open(input_path, 'rb') as f:
+        offset = 0
+        for raw in f:
+            offset += len(raw)
+            line = kokoro.normalizer(raw.decode('utf-8-sig' if offset == len(raw) else 'utf-8'))
+            for sentence in kokoro.split_sentences(line):
+                pipeline.put(out, (sentence, offset))
+    pipeline.put(out, _DONE)
+
+def _phonemize(pipeline, kokoro, lang, inp, out):
+    # Sentences queued up while the model was busy are phonemized in one espeak call,
+    # which fills the phoneme cache that sentence_chunks() then reads
+    sentences = []
+    for item in pipeline.items(inp):
+        sentences.append(item)
+        while len(sentences) < PHONEMIZE_BATCH:
+            try:
+                item = inp.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                inp.put(_DONE)
+                break
+            sentences.append(item)
+        kokoro.phonemize_batch([sentence for sentence, _ in sentences], lang, norm=False)
+        for sentence, offset in sentences:
+            for tokens, _ in kokoro.sentence_chunks(sentence, lang):
+                pipeline.put(out, (tokens, offset))
+        sentences = []
+    pipeline.put(out, _DONE)
+
+def _synthesize(pipeline, kokoro, model, voicepack, speed, inp, out):
+    for tokens, offset in pipeline.items(inp):
+        pipeline.put(out, (kokoro.forward(model, tokens, voicepack[len(tokens)], speed), offset))
+    pipeline.put(out, _DONE)
+
+def _write(pipeline, soundfile, inp, pbar, stats):
+    for audio, offset in pipeline.items(inp):
+        soundfile.write(audio)
+        stats['chunks'] += 1
+        stats['audio_seconds'] += len(audio) / SAMPLE_RATE
+        pbar.update(offset - pbar.n)
+        pbar.set_postfix(audio=time.strftime('%H:%M:%S', time.gmtime(stats['audio_seconds'])), refresh=False)
+
+def render_audiobook(engine, input_path, output_path, voice='af_bella', lang='a', speed=1,
+                     queue_size=QUEUE_SIZE, progress=True):
+    """Synthesize a UTF-8 text file of any length to an audio file.
+
+    Lines are normalized and split into sentences as they are read, and every sentence
+    is synthesized like generate_stream() does, so the audio matches synthesizing the
+    whole text with it. Progress and the ETA are reported in input bytes rendered.
+
+    Args:
+        engine: KokoroEngine to synthesize with
+        input_path: Text file to read
+        output_path: Audio file to write; its extension (.wav, .flac, .ogg or .mp3) sets the format
+        voice: Voice name
+        lang: Language code ('a' for American English, 'b' for British English)
+        speed: Speaking rate multiplier
+        queue_size: Items allowed to wait between two stages
+        progress: Show a progress bar
+
+    Returns:
+        Dict with the number of chunks, seconds of audio, seconds taken and the
+        seconds each stage spent working
+
+    Raises:
+        ValueError: If the output format is not supported
+    """
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension not in OUTPUT_FORMATS or OUTPUT_FORMATS[extension][0] not in sf.available_formats():
+        supported = [e for e, (format, _) in OUTPUT_FORMATS.items() if format in sf.available_formats()]
+        raise ValueError(f"Unsupported output format '{extension}'. Supported: {', '.join(supported)}")
+    format, subtype = OUTPUT_FORMATS[extension]
+    kokoro = engine.kokoro
+    voicepack = engine.load_voice(voice)
+
+    pipeline = _Pipeline()
+    sentences, chunks, audio = (queue.Queue(queue_size) for _ in range(3))
+    stats = {'chunks': 0, 'audio_seconds': 0.0}
+    start = time.perf_counter()
+    with sf.SoundFile(output_path, 'w', SAMPLE_RATE, 1, subtype, format=format) as soundfile, \
+            tqdm(total=os.path.getsize(input_path), unit='B', unit_scale=True, desc="Rendering",
+                 disable=not progress) as pbar:
+        pipeline.start('segment', _segment, pipeline, kokoro, input_path, sentences)
+        pipeline.start('phonemize', _phonemize, pipeline, kokoro, lang, sentences, chunks)
+        pipeline.start('synthesize', _synthesize, pipeline, kokoro, engine.model, voicepack, speed, chunks, audio)
+        pipeline.start('write', _write, pipeline, soundfile, audio, pbar, stats)
+        pipeline.join()
+    stats['seconds'] = time.perf_counter() - start
+    stats['stage_seconds'] = dict(pipeline.busy)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a text file to audio with Kokoro TTS')
+    parser.add_argument('input', type=str, help='UTF-8 text file to read')
+    parser.add_argument('output', type=str, help=f"Audio file to write ({', '.join(OUTPUT_FORMATS)})")
+    parser.add_argument('--voice', type=str, default='af_bella', help='Voice to use (default: af_bella)')
+    parser.add_argument('--lang', type=str, default='a', help='Language code (default: a)')
+    parser.add_argument('--speed', type=float, default=1, help='Speaking rate multiplier (default: 1)')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help='Device to run on (default: cuda if available)')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                        help=f'Items allowed to wait between two stages (default: {QUEUE_SIZE})')
+    args = parser.parse_args()
+
+    engine = KokoroEngine("kokoro-v0_19.pth", args.device)
+    try:
+        stats = render_audiobook(engine, args.input, args.output, args.voice, args.lang, args.speed, args.queue_size)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; {args.output} holds the audio rendered so far")
+        return
+    print(f"\n{stats['audio_seconds']:.0f}s of audio in {stats['seconds']:.1f}s "
+          f"({stats['audio_seconds'] / stats['seconds']:.1f}x realtime), saved to {args.output}")
+    print("Busy seconds per stage: " + ', '.join(f"{name} {seconds:.1f}" for name, seconds in stats['stage_seconds'].items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+"""Micro-benchmarks for the Kokoro inference hot paths.
+
+Each subcommand times an optimized code path against the implementation it replaced.
+Equivalence checks that need no model weights are in tests/ (run `python -m pytest tests`);
+the others are made here before timing. Run `python benchmark.py --help` for the list.
+"""
+import argparse
+import multiprocessing
+import re
+import time
+
+import numpy as np
+import torch
+
+from models import SAMPLE_RATE, setup_espeak
+
+setup_espeak()  # kokoro queries the espeak version on import
+import frontend
+import kokoro
+
+DEFAULT_TOKEN_LENGTHS = [16, 64, 128, 256, 510]
+DEFAULT_LONG_TEXT = (
+    "The old lighthouse keeper climbed the spiral stairs every evening, counting each of the "
+    "one hundred and twelve steps, pausing at the narrow window halfway up to watch the fishing "
+    "boats return, and when he finally reached the lamp room he polished the great lens with a "
+    "soft cloth, checked the oil, trimmed the wick and lit the flame that would sweep across the "
+    "dark water until morning, just as his father and his grandfather had done before him."
+)
+
+def timeit(fn, repeat):
+    """Return the best wall time of fn() over repeat runs, in milliseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def dense_alignment(d, t_en, pred_dur):
+    """Reference: the dense tokens x frames alignment previously built in kokoro.forward."""
+    pred_aln_trg = torch.zeros(pred_dur.shape[-1], pred_dur.sum().item())
+    c_frame = 0
+    for i in range(pred_aln_trg.size(0)):
+        pred_aln_trg[i, c_frame:c_frame + pred_dur[i].item()] = 1
+        c_frame += pred_dur[i].item()
+    en = d.transpose(-1, -2) @ pred_aln_trg.unsqueeze(0)
+    asr = t_en @ pred_aln_trg.unsqueeze(0)
+    return en, asr
+
+def gather_alignment(d, t_en, pred_dur):
+    frame_idx = kokoro.alignment_indices(pred_dur)
+    return d.transpose(-1, -2).index_select(-1, frame_idx), t_en.index_select(-1, frame_idx)
+
+def bench_alignment(args):
+    """Dense alignment matmuls vs. repeat_interleave gather, per token length (checked in tests/)."""
+    print(f"{'tokens':>8} {'frames':>8} {'dense ms':>10} {'gather ms':>10} {'speedup':>8}")
+    for n in args.lengths:
+        n += 2  # forward() pads every sequence with a boundary token on each side
+        d = torch.randn(1, n, 640)
+        t_en = torch.randn(1, 512, n)
+        pred_dur = torch.randint(1, 12, (n,))
+        dense_ms = timeit(lambda: dense_alignment(d, t_en, pred_dur), args.repeat)
+        gather_ms = timeit(lambda: gather_alignment(d, t_en, pred_dur), args.repeat)
+        print(f"{n:>8} {pred_dur.sum().item():>8} {dense_ms:>10.2f} {gather_ms:>10.2f} {dense_ms / gather_ms:>7.1f}x")
+
+def phonemize_corpus(n):
+    """n distinct English sentences with numbers, money and abbreviations to normalize."""
+    subjects = ['The committee', 'Dr. Smith', 'Our support team', 'The new release', 'A customer']
+    verbs = ['approved', 'reviewed', 'rejected', 'shipped', 'paid for']
+    objects = ['the budget of $1,250.50', 'version 2.4', 'the order placed in 1995', 'the 3-5 day plan',
+               'twelve boxes at 10:30']
+    return [f'{subjects[i % 5]} {verbs[i // 5 % 5]} {objects[i // 25 % 5]} on attempt {i}.' for i in range(n)]
+
+def bench_phonemize(args):
+    """Per-sentence phonemize() loop vs. phonemize_batch(), with the phoneme cache disabled."""
+    from phoneme_cache import PhonemeCache
+    kokoro.phoneme_cache = PhonemeCache()  # memory only, cleared before every run
+    print(f"{'texts':>8} {'loop ms':>10} {'batch ms':>10} {'speedup':>8}")
+    for n in args.sizes:
+        texts = phonemize_corpus(n)
+        kokoro.phoneme_cache.clear()
+        expected = [kokoro.phonemize(t, args.lang) for t in texts]
+        kokoro.phoneme_cache.clear()
+        assert kokoro.phonemize_batch(texts, args.lang, njobs=args.njobs) == expected, \
+            'phonemize_batch differs from phonemize'
+
+        def loop():
+            kokoro.phoneme_cache.clear()
+            for t in texts:
+                kokoro.phonemize(t, args.lang)
+
+        def batch():
+            kokoro.phoneme_cache.clear()
+            kokoro.phonemize_batch(texts, args.lang, njobs=args.njobs)
+
+        loop_ms = timeit(loop, args.repeat)
+        batch_ms = timeit(batch, args.repeat)
+        print(f"{n:>8} {loop_ms:>10.1f} {batch_ms:>10.1f} {loop_ms / batch_ms:>7.1f}x")
+
+def bench_phonemize_pool(args):
+    """Single-process phonemize_batch() vs. a PhonemizerPool fed by concurrent requests."""
+    from concurrent.futures import ThreadPoolExecutor
+    from phoneme_cache import PhonemeCache
+    from phonemizer_pool import PhonemizerPool
+    kokoro.phoneme_cache = PhonemeCache()
+    texts = phonemize_corpus(args.texts)
+    requests = [[(t, args.lang) for t in texts[i:i + args.request_size]] for i in range(0, len(texts), args.request_size)]
+    kokoro.phoneme_cache.clear()
+    expected = kokoro.phonemize_batch(texts, args.lang)
+
+    def single():
+        kokoro.phoneme_cache.clear()
+        kokoro.phonemize_batch(texts, args.lang)
+
+    single_ms = timeit(single, args.repeat)
+    print(f"{'processes':>10} {'ms':>10} {'texts/s':>10} {'speedup':>8}")
+    print(f"{'single':>10} {single_ms:>10.1f} {len(texts) / single_ms * 1000:>10.0f} {1:>7.1f}x")
+    for processes in args.processes:
+        with PhonemizerPool(processes) as pool, ThreadPoolExecutor(len(requests)) as clients:
+            # one request per worker, so that every worker has started before the timing
+            for future in [pool.submit([('warm up', args.lang)]) for _ in range(processes)]:
+                future.result()
+            run = lambda: [ps for result in clients.map(pool.phonemize, requests) for ps in result]
+            assert run() == expected, 'PhonemizerPool differs from phonemize_batch'
+            pool_ms = timeit(run, args.repeat)
+            throughput = ', '.join(f"{w['texts_per_second']:.0f}" for w in pool.stats())
+        print(f"{processes:>10} {pool_ms:>10.1f} {len(texts) / pool_ms * 1000:>10.0f} {single_ms / pool_ms:>7.1f}x"
+              f"  per worker texts/s: {throughput}")
+
+# Words that espeak pronounces the same whatever their neighbours, so that the lexicon
+# cannot change the output: no function words ("the", "a", "to"), whose stress depends on
+# the sentence, and no words ending in a schwa ("cluster", "kafka"), which take a linking r
+DOMAIN_WORDS = ('deploy rollback latency throughput gateway ingress shard kubernetes postgres nginx redis '
+                'terraform release canary service backend frontend region metrics alert dashboard').split()
+OTHER_WORDS = 'yesterday morning somebody quietly noticed several unusual spikes during lunch'.split()
+
+def lexicon_corpus(n, coverage, words_per_text=12):
+    """n texts whose words are from DOMAIN_WORDS with probability coverage, else from OTHER_WORDS."""
+    rng = np.random.default_rng(0)
+    return [' '.join(rng.choice(DOMAIN_WORDS) if rng.random() < coverage else rng.choice(OTHER_WORDS)
+                     for _ in range(words_per_text)).capitalize() + '.' for _ in range(n)]
+
+def bench_lexicon(args):
+    """Per-text G2P through espeak only vs. through a lexicon of the corpus' domain vocabulary.
+
+    The speedup is only reported for coverages where both give identical phonemes.
+    """
+    from lexicon import DEFAULT_ENTRIES, Lexicon
+    espeak_only = Lexicon()
+    domain = Lexicon(DEFAULT_ENTRIES)
+    for word, ps in zip(DOMAIN_WORDS, kokoro.espeak_phonemize_batch(DOMAIN_WORDS, args.lang)):
+        domain.add(word, ps, args.lang)
+    print(f"{'coverage':>8} {'texts':>6} {'espeak ms':>10} {'lexicon ms':>10} {'speedup':>8} {'identical':>9}")
+    for coverage in args.coverage:
+        texts = lexicon_corpus(args.texts, coverage)
+
+        def run(lexicon):
+            frontend.lexicon = lexicon  # read by g2p_batch(), which kokoro re-exports
+            return [kokoro.g2p_batch([t], args.lang)[0] for t in texts]
+
+        # Lexicon words lose the cross-word context espeak would use; where that changes the
+        # output, the two runs do not do the same work and no speedup is given
+        identical = np.mean([a == b for a, b in zip(run(espeak_only), run(domain))])
+        espeak_ms = timeit(lambda: run(espeak_only), args.repeat)
+        lexicon_ms = timeit(lambda: run(domain), args.repeat)
+        speedup = f"{espeak_ms / lexicon_ms:>7.1f}x" if identical == 1 else f"{'-':>8}"
+        print(f"{coverage:>8.0%} {len(texts):>6} {espeak_ms:>10.1f} {lexicon_ms:>10.1f} {speedup} {identical:>9.0%}")
+
+def reference_normalize_text(text):
+    """Reference: the sequential normalize_text previously in kokoro."""
+    text = text.replace(chr(8216), "'").replace(chr(8217), "'")
+    text = text.replace('«', chr(8220)).replace('»', chr(8221))
+    text = text.replace(chr(8220), '"').replace(chr(8221), '"')
+    text = text.replace('(', '«').replace(')', '»')
+    for a, b in zip('、。！，：；？', ',.!,:;?'):
+        text = text.replace(a, b+' ')
+    text = re.sub(r'[^\S \n]', ' ', text)
+    text = re.sub(r'  +', ' ', text)
+    text = re.sub(r'(?<=\n) +(?=\n)', '', text)
+    text = re.sub(r'\bD[Rr]\.(?= [A-Z])', 'Doctor', text)
+    text = re.sub(r'\b(?:Mr\.|MR\.(?= [A-Z]))', 'Mister', text)
+    text = re.sub(r'\b(?:Ms\.|MS\.(?= [A-Z]))', 'Miss', text)
+    text = re.sub(r'\b(?:Mrs\.|MRS\.(?= [A-Z]))', 'Mrs', text)
+    text = re.sub(r'\betc\.(?! [A-Z])', 'etc', text)
+    text = re.sub(r'(?i)\b(y)eah?\b', r"\1e'a", text)
+    text = re.sub(r'\d*\.\d+|\b\d{4}s?\b|(?<!:)\b(?:[1-9]|1[0-2]):[0-5]\d\b(?!:)', kokoro.split_num, text)
+    text = re.sub(r'(?<=\d),(?=\d)', '', text)
+    text = re.sub(r'(?i)[$£]\d+(?:\.\d+)?(?: hundred| thousand| (?:[bm]|tr)illion)*\b|[$£]\d+\.\d\d?\b', kokoro.flip_money, text)
+    text = re.sub(r'\d*\.\d+', kokoro.point_num, text)
+    text = re.sub(r'(?<=\d)-(?=\d)', ' to ', text)
+    text = re.sub(r'(?<=\d)S', ' S', text)
+    text = re.sub(r"(?<=[BCDFGHJ-NP-TV-Z])'?s\b", "'S", text)
+    text = re.sub(r"(?<=X')S\b", 's', text)
+    text = re.sub(r'(?:[A-Za-z]\.){2,} [a-z]', lambda m: m.group().replace('.', '-'), text)
+    text = re.sub(r'(?i)(?<=[A-Z])\.(?=[A-Z])', '-', text)
+    return text.strip()
+
+# Fragments covering every normalization rule, glued together with and without separators
+NORMALIZE_FRAGMENTS = [
+    'Dr. Smith', 'DR. Jones', 'dr. who', 'Mr. Brown', 'MR. X', 'Mr.', 'Ms.', 'MS. Y', 'Mrs.', 'MRS. Z', 'etc.', 'etc. And',
+    'yeah', 'Yea', 'YEAH', 'yeahs', '1995', '1990s', '2000', '1905', '1066', '10:30', '12:00', '9:05', '13:45', '1:2:3',
+    '3.14', '.5', '1,000,000', '$5', '$1.50', '£2.05', '$3 million', '$1', '£1.1', '$10.5 billion', '3-5', '1990S',
+    "BBC's", 'CDs', "X's", 'Xs', "X'S", 'U.S.A. is', 'e.g. this', 'a.b.c', 'A.B', '‘quoted’', '“double”', '«guillemets»',
+    '(aside)', '、', '。', '！', '，', '：', '；', '？', '\t', '\r\n', '\u3000', '\xa0', '  ', '\n \n', '\n\n\n', ' \n  \n ',
+    'plain words', 'Hello', '.', ',', "'", '-', 's', 'S',
+]
+
+def normalize_corpus(n, rng):
+    """n texts of random normalization fragments, plus every fragment on its own."""
+    texts = list(NORMALIZE_FRAGMENTS)
+    for _ in range(n):
+        parts = rng.choice(NORMALIZE_FRAGMENTS, size=rng.integers(1, 12))
+        texts.append(''.join(p + rng.choice(['', ' ', '  ', '\n', ', ']) for p in parts))
+    return texts
+
+def bench_normalize(args):
+    """Single-pass Normalizer vs. the sequential rules on an audiobook-sized input (checked in tests/)."""
+    rng = np.random.default_rng(0)
+    texts = normalize_corpus(args.texts, rng) + phonemize_corpus(200)
+    book = '\n'.join(texts * args.book_copies)
+    lines = book.split('\n')
+    print(f"{'input':>26} {'sequential ms':>14} {'normalizer ms':>14} {'speedup':>8}")
+    for name, reference, optimized in [
+        (f'one text of {len(book) // 1000}k chars', lambda: reference_normalize_text(book), lambda: kokoro.normalize_text(book)),
+        (f'{len(lines)} lines', lambda: [reference_normalize_text(l) for l in lines], lambda: kokoro.normalize_batch(lines)),
+    ]:
+        reference_ms = timeit(reference, args.repeat)
+        optimized_ms = timeit(optimized, args.repeat)
+        print(f"{name:>26} {reference_ms:>14.1f} {optimized_ms:>14.1f} {reference_ms / optimized_ms:>7.1f}x")
+
+def bench_voices(args):
+    """Voice switches: torch.load of each .pt file vs. the memory-mapped voice bank registry."""
+    import os
+    from models import get_voices_path
+    from voice_bank import VoiceRegistry
+    voices_dir = get_voices_path()
+    registry = VoiceRegistry(voices_dir, max_loaded=args.max_loaded)
+    names = registry.names()
+    for name in names:
+        expected = torch.load(os.path.join(voices_dir, f"{name}.pt"), weights_only=True)
+        assert torch.equal(registry.get(name), expected), f'voice bank differs from {name}.pt'
+    switches = [names[i % len(names)] for i in range(args.switches)]
+    load_ms = timeit(lambda: [torch.load(os.path.join(voices_dir, f"{n}.pt"), weights_only=True) for n in switches],
+                     args.repeat)
+    bank_ms = timeit(lambda: [registry.get(n) for n in switches], args.repeat)
+    print(f"{len(names)} voices, {len(switches)} switches, {args.max_loaded} kept loaded")
+    print(f"{'torch.load ms':>14} {'bank ms':>10} {'speedup':>8}")
+    print(f"{load_ms:>14.2f} {bank_ms:>10.2f} {load_ms / bank_ms:>7.1f}x")
+
+def bench_encode(args):
+    """Audio encoding latency per format, in memory, against the former temporary WAV file round trip."""
+    import os
+    import tempfile
+    import soundfile as sf
+    from audio_encoding import available_formats, encode_audio
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal(int(args.seconds * args.sample_rate)) * 0.1).astype(np.float32)
+
+    def temp_wav():
+        # What every request paid before encoding: write output.wav, read it back, delete it
+        fd, path = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+        sf.write(path, audio, args.sample_rate)
+        with open(path, 'rb') as f:
+            f.read()
+        os.remove(path)
+
+    print(f"{args.seconds:.0f} s of audio at {args.sample_rate} Hz")
+    print(f"{'format':>10} {'ms':>8} {'KB':>8} {'x realtime':>11}")
+    for name, fn in [('temp wav', temp_wav)] + [
+            (format, lambda format=format: encode_audio(audio, args.sample_rate, format))
+            for format in available_formats()]:
+        ms = timeit(fn, args.repeat)
+        size = f"{len(fn()) / 1024:.0f}" if name != 'temp wav' else '-'
+        print(f"{name:>10} {ms:>8.2f} {size:>8} {args.seconds * 1000 / ms:>10.0f}x")
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    import sys
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+def memory_mb():
+    """Resident, proportional (shared pages split between processes) and anonymous memory
+    of this process in MB, or None where /proc is unavailable (Windows, macOS)."""
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f.read().splitlines()[1:])
+    except OSError:
+        return None
+    return tuple(int(fields[name].split()[0]) / 2**10 for name in ('Rss', 'Pss', 'Anonymous'))
+
+def build_worker(mode, results, done):
+    """Build the model in a fresh process, report (seconds, memory) and hold it until done is set.
+
+    mode 'checkpoint' loads the hub checkpoint into private memory, mode 'mmap' maps the
+    prepared safetensors weights.
+    """
+    import models
+    start = time.perf_counter()
+    if mode == 'checkpoint':
+        model = models.resolve_modules()['models'].build_model(models.artifacts.resolve("kokoro-v0_19.pth"), 'cpu')
+        models.prepare_for_inference(model, verify=False)
+    else:
+        model = models.build_model(None)
+    seconds = time.perf_counter() - start
+    # Read every weight once so that mapped pages are resident, as after the first synthesis
+    for component in model.values():
+        for tensor in component.state_dict().values():
+            tensor.sum()
+    results.put((seconds, memory_mb()))
+    done.wait()
+
+def bench_weights(args):
+    """Model build time and memory per worker: private checkpoint load vs. memory-mapped weights."""
+    spawn = multiprocessing.get_context('spawn')
+    # A first build writes the prepared weights if they are missing or stale
+    results, done = spawn.Queue(), spawn.Event()
+    done.set()
+    worker = spawn.Process(target=build_worker, args=('mmap', results, done))
+    worker.start()
+    results.get()
+    worker.join()
+    print(f"{'weights':>10} {'build s':>8} {'RSS MB':>8} {'PSS MB':>8} {'anon MB':>8}  (mean of {args.workers} workers)")
+    for mode in ('checkpoint', 'mmap'):
+        results, done = spawn.Queue(), spawn.Event()
+        workers = [spawn.Process(target=build_worker, args=(mode, results, done)) for _ in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        reports = [results.get() for _ in workers]
+        done.set()
+        for worker in workers:
+            worker.join()
+        seconds = sum(report[0] for report in reports) / len(reports)
+        if reports[0][1] is None:
+            print(f"{mode:>10} {seconds:>8.2f} {'n/a':>8} {'n/a':>8} {'n/a':>8}")
+            continue
+        rss, pss, anonymous = (sum(report[1][i] for report in reports) / len(reports) for i in range(3))
+        print(f"{mode:>10} {seconds:>8.2f} {rss:>8.0f} {pss:>8.0f} {anonymous:>8.0f}")
+
+def bench_audiobook(args):
+    """Sequential generate_stream() into a file vs. the pipelined audiobook renderer: output and time."""
+    import os
+    import tempfile
+    import soundfile as sf
+    from audiobook import render_audiobook
+    from models import KokoroEngine
+    engine = KokoroEngine(device='cpu')
+    engine.warmup([64, 128])
+    directory = tempfile.mkdtemp()
+    book, sequential, pipelined = (os.path.join(directory, name) for name in ('book.txt', 'sequential.wav', 'pipelined.wav'))
+    with open(book, 'w', encoding='utf-8') as f:
+        f.write('\n'.join([DEFAULT_LONG_TEXT] * args.paragraphs))
+
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    with open(book, encoding='utf-8') as f, sf.SoundFile(sequential, 'w', SAMPLE_RATE, 1, 'PCM_16') as out:
+        for audio, _ in engine.stream(f.read(), args.voice):
+            out.write(audio)
+    sequential_seconds = time.perf_counter() - start
+
+    torch.manual_seed(0)
+    stats = render_audiobook(engine, book, pipelined, args.voice, progress=False)
+    difference = np.abs(sf.read(sequential)[0] - sf.read(pipelined)[0]).max()
+    print(f"{stats['audio_seconds']:.0f}s of audio in {stats['chunks']} chunks, max difference {difference:.1e}")
+    print(f"{'mode':>10} {'seconds':>8} {'x realtime':>11}")
+    for mode, seconds in [('sequential', sequential_seconds), ('pipelined', stats['seconds'])]:
+        print(f"{mode:>10} {seconds:>8.2f} {stats['audio_seconds'] / seconds:>10.1f}x")
+    print("Busy seconds per stage: " + ', '.join(f"{name} {seconds:.2f}" for name, seconds in stats['stage_seconds'].items()))
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f"Peak RSS {peak:.0f} MB")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Kokoro TTS micro-benchmarks')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs per measurement (default: 10)')
+    subparsers = parser.add_subparsers(dest='bench', required=True)
+
+    alignment = subparsers.add_parser('alignment', help=bench_alignment.__doc__)
+    alignment.add_argument('--lengths', type=int, nargs='+', default=DEFAULT_TOKEN_LENGTHS,
+                           help='Token lengths to benchmark')
+    alignment.set_defaults(func=bench_alignment)
+
+    phonemize = subparsers.add_parser('phonemize', help=bench_phonemize.__doc__)
+    phonemize.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                           help='Number of texts per run (default: 10 100 1000)')
+    phonemize.add_argument('--lang', type=str, default='a', help='Language code (default: a)')
+    phonemize.add_argument('--njobs', type=int, default=1, help='espeak processes for the batch (default: 1)')
+    phonemize.set_defaults(func=bench_phonemize)
+
+    pool = subparsers.add_parser('phonemize-pool', help=bench_phonemize_pool.__doc__)
+    pool.add_argument('--texts', type=int, default=2000, help='Number of texts (default: 2000)')
+    pool.add_argument('--request-size', type=int, default=50, help='Texts per request (default: 50)')
+    pool.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4],
+                      help='Pool sizes to compare (default: 1 2 4)')
+    pool.add_argument('--lang', type=str, default='a', help='Language code (default: a)')
+    pool.set_defaults(func=bench_phonemize_pool)
+
+    lexicon = subparsers.add_parser('lexicon', help=bench_lexicon.__doc__)
+    lexicon.add_argument('--texts', type=int, default=500, help='Number of texts (default: 500)')
+    lexicon.add_argument('--coverage', type=float, nargs='+', default=[0.5, 0.9, 1.0],
+                         help='Share of corpus words found in the lexicon (default: 0.5 0.9 1.0)')
+    lexicon.add_argument('--lang', type=str, default='a', help='Language code (default: a)')
+    lexicon.set_defaults(func=bench_lexicon)
+
+    normalize = subparsers.add_parser('normalize', help=bench_normalize.__doc__)
+    normalize.add_argument('--texts', type=int, default=5000, help='Random texts in the timed corpus (default: 5000)')
+    normalize.add_argument('--book-copies', type=int, default=20,
+                           help='Copies of the corpus in the timed audiobook-sized input (default: 20)')
+    normalize.set_defaults(func=bench_normalize)
+
+    voices = subparsers.add_parser('voices', help=bench_voices.__doc__)
+    voices.add_argument('--switches', type=int, default=100, help='Voice switches per run (default: 100)')
+    voices.add_argument('--max-loaded', type=int, default=8, help='Voicepacks kept loaded (default: 8)')
+    voices.set_defaults(func=bench_voices)
+
+    encode = subparsers.add_parser('encode', help=bench_encode.__doc__)
+    encode.add_argument('--seconds', type=float, default=10, help='Length of the waveform (default: 10)')
+    encode.add_argument('--sample-rate', type=int, default=SAMPLE_RATE, help=f'Sample rate (default: {SAMPLE_RATE})')
+    encode.set_defaults(func=bench_encode)
+
+    weights = subparsers.add_parser('weights', help=bench_weights.__doc__)
+    weights.add_argument('--workers', type=int, default=4, help='Worker processes alive at once (default: 4)')
+    weights.set_defaults(func=bench_weights)
+
+    audiobook = subparsers.add_parser('audiobook', help=bench_audiobook.__doc__)
+    audiobook.add_argument('--paragraphs', type=int, default=10, help='Paragraphs in the rendered text (default: 10)')
+    audiobook.add_argument('--voice', type=str, default='af_bella', help='Voice to use (default: af_bella)')
+    audiobook.set_defaults(func=bench_audiobook)
+
+    args = parser.parse_args()
+    torch.manual_seed(0)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Text front-end: normalization, the symbol vocabulary and grapheme-to-phoneme conversion.
+
+Free of torch, so that processes which only phonemize (PhonemizerPool workers) start
+quickly and stay small. kokoro re-exports everything here.
+"""
+from lexicon import DEFAULT_ENTRIES, Lexicon
+import phonemizer
+import re
+import threading
+import time
+import numpy as np
+
+def split_num(num):
+    num = num.group()
+    if '.' in num:
+        return num
+    elif ':' in num:
+        h, m = [int(n) for n in num.split(':')]
+        if m == 0:
+            return f"{h} o'clock"
+        elif m < 10:
+            return f'{h} oh {m}'
+        return f'{h} {m}'
+    year = int(num[:4])
+    if year < 1100 or year % 1000 < 10:
+        return num
+    left, right = num[:2], int(num[2:4])
+    s = 's' if num.endswith('s') else ''
+    if 100 <= year % 1000 <= 999:
+        if right == 0:
+            return f'{left} hundred{s}'
+        elif right < 10:
+            return f'{left} oh {right}{s}'
+    return f'{left} {right}{s}'
+
+def flip_money(m):
+    m = m.group()
+    bill = 'dollar' if m[0] == '$' else 'pound'
+    if m[-1].isalpha():
+        return f'{m[1:]} {bill}s'
+    elif '.' not in m:
+        s = '' if m[1:] == '1' else 's'
+        return f'{m[1:]} {bill}{s}'
+    b, c = m[1:].split('.')
+    s = '' if b == '1' else 's'
+    c = int(c.ljust(2, '0'))
+    coins = f"cent{'' if c == 1 else 's'}" if m[0] == '$' else ('penny' if c == 1 else 'pence')
+    return f'{b} {bill}{s} and {c} {coins}'
+
+def point_num(num):
+    a, b = num.group().split('.')
+    return ' point '.join([a, ' '.join(b)])
+
+class Normalizer:
+    # normalize_text() rules precompiled and run in fewer passes, with output identical to
+    # applying them one by one (benchmark.py normalize checks it against the sequential rules).
+    # Rules that cannot see each other's output share one alternation, written so that it
+    # starts with a character class and keeps the regex engine's fast prefix scan.
+    CHARACTERS = [(chr(8216), "'"), (chr(8217), "'"), ('«', '"'), ('»', '"'), (chr(8220), '"'), (chr(8221), '"'),
+                  ('(', '«'), (')', '»')] + [(a, b + ' ') for a, b in zip('、。！，：；？', ',.!,:;?')]
+    WHITESPACE = re.compile(r'[^\S \n]')
+    # Kept as two passes: merged, they would lose their literal prefixes and be slower
+    SPACE_RUNS = re.compile(r'  +')
+    BLANK_LINES = re.compile(r'(?<=\n) +(?=\n)')
+    # Titles, etc. and yeah; (?<!\w.) after the first letter is the \b in front of it
+    WORDS = re.compile(r'[DMeyY](?<!\w.)(?:(?<=D)[Rr]\.(?= [A-Z])|(?<=M)(?:r\.|R\.(?= [A-Z])|s\.|S\.(?= [A-Z])'
+                       r'|rs\.|RS\.(?= [A-Z]))|(?<=e)tc\.(?! [A-Z])|(?<=[yY])(?i:eah?)\b)')
+    # Replacement and position in the original rule order of every WORDS match but yeah
+    TITLES = {'Dr.': ('Doctor', 0), 'DR.': ('Doctor', 0), 'Mr.': ('Mister', 1), 'MR.': ('Mister', 1),
+              'Ms.': ('Miss', 2), 'MS.': ('Miss', 2), 'Mrs.': ('Mrs', 3), 'MRS.': ('Mrs', 3), 'etc.': ('etc', 4)}
+    DIGIT = re.compile(r'\d')
+    NUMBERS = re.compile(r'\d*\.\d+|\b\d{4}s?\b|(?<!:)\b(?:[1-9]|1[0-2]):[0-5]\d\b(?!:)')
+    THOUSANDS = re.compile(r'(?<=\d),(?=\d)')
+    MONEY = re.compile(r'(?i)[$£]\d+(?:\.\d+)?(?: hundred| thousand| (?:[bm]|tr)illion)*\b|[$£]\d+\.\d\d?\b')
+    DECIMALS = re.compile(r'\d*\.\d+')
+    RANGES = re.compile(r'[-S](?<=\d.)(?:(?<=-)(?=\d)|(?<=S))')
+    PLURAL_S = re.compile(r"(?<=[BCDFGHJ-NP-TV-Z])'?s\b")
+    X_S = re.compile(r"(?<=X')S\b")
+    INITIALS = re.compile(r'(?:[A-Za-z]\.){2,} [a-z]')
+    ACRONYM_DOTS = re.compile(r'(?i)(?<=[A-Z])\.(?=[A-Z])')
+    # Texts of a batch are joined with this character and normalized in one go
+    BATCH_SEPARATOR = '\ue000'
+
+    def __call__(self, text):
+        return self._normalize(text).strip()
+
+    def normalize_batch(self, texts):
+        # Same as [self(t) for t in texts], with one pass per rule over the whole batch
+        texts = list(texts)
+        if len(texts) < 2 or any(self.BATCH_SEPARATOR in t for t in texts):
+            return [self(t) for t in texts]
+        return [t.strip() for t in self._normalize(self.BATCH_SEPARATOR.join(texts)).split(self.BATCH_SEPARATOR)]
+
+    def stream(self, lines):
+        # Line-by-line mode for large inputs: lazily yields self(line) for every line, so
+        # that only one line is held and the first ones are ready before the rest is read
+        for line in lines:
+            yield self(line)
+
+    def _normalize(self, text):
+        for a, b in self.CHARACTERS:
+            if a in text:
+                text = text.replace(a, b)
+        text = self.WHITESPACE.sub(' ', text)
+        text = self.SPACE_RUNS.sub(' ', text)
+        text = self.BLANK_LINES.sub('', text)
+        text = self._words(text)
+        # Every number rule needs a digit, and none of the earlier rules adds one
+        if self.DIGIT.search(text):
+            text = self.NUMBERS.sub(split_num, text)
+            text = self.THOUSANDS.sub('', text)
+            text = self.MONEY.sub(flip_money, text)
+            text = self.DECIMALS.sub(point_num, text)
+            text = self.RANGES.sub(lambda m: ' to ' if m.group() == '-' else ' S', text)
+        text = self.PLURAL_S.sub("'S", text)
+        text = self.X_S.sub('s', text)
+        text = self.INITIALS.sub(lambda m: m.group().replace('.', '-'), text)
+        return self.ACRONYM_DOTS.sub('-', text)
+
+    def _words(self, text):
+        # Applied one rule after the other, a rule's leading \b sees the letters left by an
+        # earlier rule's replacement ending right where it starts (Mr.Ms.), and does not match
+        last_end, last_rule = -1, None
+        def replace(m):
+            nonlocal last_end, last_rule
+            word = m.group()
+            replacement, rule = self.TITLES.get(word) or (word[0] + "e'a", 5)
+            if m.start() == last_end and last_rule < rule:
+                return word
+            last_end, last_rule = m.end(), rule
+            return replacement
+        return self.WORDS.sub(replace, text)
+
+normalizer = Normalizer()
+
+def normalize_text(text):
+    return normalizer(text)
+
+def normalize_batch(texts):
+    return normalizer.normalize_batch(texts)
+
+def get_vocab():
+    _pad = "$"
+    _punctuation = ';:,.!?¡¿—…"«»“” '
+    _letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+    _letters_ipa = "ɑɐɒæɓʙβɔɕçɗɖðʤəɘɚɛɜɝɞɟʄɡɠɢʛɦɧħɥʜɨɪʝɭɬɫɮʟɱɯɰŋɳɲɴøɵɸθœɶʘɹɺɾɻʀʁɽʂʃʈʧʉʊʋⱱʌɣɤʍχʎʏʑʐʒʔʡʕʢǀǁǂǃˈˌːˑʼʴʰʱʲʷˠˤ˞↓↑→↗↘'̩'ᵻ"
+    symbols = [_pad] + list(_punctuation) + list(_letters) + list(_letters_ipa)
+    dicts = {}
+    for i in range(len((symbols))):
+        dicts[symbols[i]] = i
+    return dicts
+
+class Vocab:
+    # Array-backed vocabulary of single-character symbols. Encoding looks code points up in
+    # a NumPy table and drops unknown symbols; decoding goes through str.translate.
+    def __init__(self, vocab):
+        self.symbols = [''] * (max(vocab.values()) + 1)
+        for symbol, i in vocab.items():
+            self.symbols[i] = symbol
+        # one spare slot at the end: code points beyond the vocabulary are clipped onto it
+        self.table = np.full(max(map(ord, vocab)) + 2, -1, dtype=np.int64)
+        for symbol, i in vocab.items():
+            self.table[ord(symbol)] = i
+        self.decode_table = {i: symbol for i, symbol in enumerate(self.symbols)}
+
+    def _lookup(self, text):
+        cps = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        return self.table[np.minimum(cps, len(self.table) - 1)] if len(cps) else np.empty(0, dtype=np.int64)
+
+    def encode(self, text):
+        ids = self._lookup(text)
+        return ids[ids >= 0]
+
+    def encode_batch(self, texts):
+        if not texts:
+            return []
+        ids = self._lookup(''.join(texts))
+        keep = ids >= 0
+        # kept symbols before the end of each text give the split points of the filtered array
+        kept = np.concatenate([[0], np.cumsum(keep)])
+        ends = np.cumsum([len(t) for t in texts])
+        return np.split(ids[keep], kept[ends[:-1]])
+
+    def decode(self, ids):
+        return np.asarray(ids, dtype=np.uint32).tobytes().decode('utf-32-le').translate(self.decode_table)
+
+    def decode_batch(self, ids_list):
+        return [self.decode(ids) for ids in ids_list]
+
+    def filter(self, text):
+        return self.decode(self.encode(text))
+
+VOCAB = get_vocab()
+vocab = Vocab(VOCAB)
+def tokenize(ps):
+    # int64 NumPy array, converted to tensors without copying by torch.from_numpy
+    return vocab.encode(ps)
+
+class PhonemizerRegistry:
+    # espeak backends by language code, each created on first use. Every backend loads its
+    # own copy of the espeak library, so processes only pay for the languages they use.
+    def __init__(self, languages):
+        self.languages = languages
+        self.init_seconds = {}
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, lang):
+        backend = self._backends.get(lang)
+        if backend is None:
+            with self._lock:
+                backend = self._backends.get(lang)
+                if backend is None:
+                    if lang not in self.languages:
+                        raise KeyError(f'Unsupported language code {lang!r}, expected one of {list(self.languages)}')
+                    start = time.perf_counter()
+                    backend = phonemizer.backend.EspeakBackend(language=self.languages[lang], preserve_punctuation=True, with_stress=True)
+                    self.init_seconds[lang] = time.perf_counter() - start
+                    print(f'Loaded espeak {self.languages[lang]} phonemizer in {self.init_seconds[lang] * 1000:.1f} ms')
+                    self._backends[lang] = backend
+        return backend
+
+    def __contains__(self, lang):
+        return lang in self.languages
+
+    def loaded(self):
+        return list(self._backends)
+
+    def stats(self):
+        return {lang: {'language': language, 'loaded': lang in self._backends, 'init_seconds': self.init_seconds.get(lang)}
+                for lang, language in self.languages.items()}
+
+LANGUAGES = dict(a='en-us', b='en-gb')
+phonemizers = PhonemizerRegistry(LANGUAGES)
+# Pronunciations that bypass espeak: built-in entries, then the user's lexicon file
+LEXICON_PATH = 'lexicon.tsv'
+lexicon = Lexicon(DEFAULT_ENTRIES)
+lexicon.load(LEXICON_PATH)
+def g2p_batch(texts, lang, njobs=1):
+    # Words found in the lexicon get their phonemes directly; espeak only sees the spans
+    # between them, all in one call
+    pss = lexicon.phonemize_batch(texts, lang, lambda spans: espeak_phonemize_batch(spans, lang, njobs))
+    return [vocab.filter(ps).strip() for ps in pss]
+
+# espeak backends are not thread-safe, so threads phonemizing at once (e.g. server requests) take turns
+espeak_lock = threading.Lock()
+
+def espeak_phonemize_batch(texts, lang, njobs=1):
+    with espeak_lock:
+        pss = phonemizers[lang].phonemize(texts, njobs=njobs)
+    assert len(pss) == len(texts), f'espeak returned {len(pss)} results for {len(texts)} texts'
+    return [postprocess_phonemes(ps, lang) for ps in pss]
+
+# Bump when postprocess_phonemes() changes, to invalidate cached phonemes
+PHONEMIZE_VERSION = 4
+
+def postprocess_phonemes(ps, lang):
+    # The lexicon entries for kokoro only match the bare word; forms it leaves to espeak
+    # ("Kokoro's", "Kokoro-san") are fixed here, in what older (kəkˈoːɹoʊ) and newer
+    # (kəkˈɔːɹoʊ) espeak-ng releases say in en-us. https://en.wiktionary.org/wiki/kokoro#English
+    ps = ps.replace('kəkˈoːɹoʊ', 'kˈoʊkəɹoʊ').replace('kəkˈɔːɹoʊ', 'kˈoʊkəɹoʊ').replace('kəkˈɔːɹəʊ', 'kˈəʊkəɹəʊ')
+    ps = ps.replace('ʲ', 'j').replace('r', 'ɹ').replace('x', 'k').replace('ɬ', 'l')
+    ps = re.sub(r'(?<=[a-zɹː])(?=hˈʌndɹɪd)', ' ', ps)
+    ps = re.sub(r' z(?=[;:,.!?¡¿—…"«»“” ]|$)', 'z', ps)
+    if lang == 'a':
+        ps = re.sub(r'(?<=nˈaɪn)ti(?!ː)', 'di', ps)
+    ps = vocab.filter(ps)
+    return ps.strip()
@@ -14,24 +14,37 @@ import os
 import sys
 import platform
 from datetime import datetime
-import shutil
+import threading
+import uuid
 from pathlib import Path
-import soundfile as sf
-from pydub import AudioSegment
 import torch
-from models import (
-    list_available_voices, build_model, load_voice,
-    generate_speech, load_and_validate_voice
-)
+from audio_encoding import available_formats, encode_audio
+from models import list_available_voices, KokoroEngine, SAMPLE_RATE
+from preload import EnginePreloader
+from scheduler import BatchScheduler
 
 # Global configuration
 CONFIG_FILE = "tts_config.json"  # Stores user preferences and paths
 DEFAULT_OUTPUT_DIR = "outputs"    # Directory for generated audio files
-SAMPLE_RATE = 22050
+MAX_CONCURRENT_REQUESTS = 8       # Requests handled at once; the scheduler batches them together
 
-# Initialize model globally
+# The engine is built and warmed up in the background from launch; the scheduler is created once it is ready
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
-model = None
+preloader = EnginePreloader(lambda: KokoroEngine("kokoro-v0_19.pth", device))
+scheduler = None
+engine_lock = threading.Lock()
+
+def model_status():
+    """Describe the preload state of the model for the UI and the status API."""
+    status = preloader.status()
+    if status['state'] == 'ready':
+        return f"🟢 Model ready (loaded in {status['seconds']:.1f}s)"
+    if status['state'] == 'failed':
+        return f"🔴 Model failed to load: {status['error']}"
+    if status['state'] == 'warming':
+        return (f"🟡 Warming up ({len(status['warmup_seconds'])}/{len(preloader.warmup_lengths)} lengths, "
+                f"{status['seconds']:.0f}s)")
+    return f"🟡 Loading model ({status['seconds']:.0f}s)"
 
 def get_available_voices():
     """Get list of available voice models."""
@@ -43,44 +56,43 @@ def get_available_voices():
         print(f"Error retrieving voices: {e}")
         return []
 
-def convert_audio(input_path: str, output_path: str, format: str):
-    """Convert audio to specified format using pydub."""
+def save_audio(audio, output_path: Path, format: str):
+    """Encode audio in memory and write it to output_path in one go."""
     try:
-        audio = AudioSegment.from_wav(input_path)
-        if format == "mp3":
-            audio.export(output_path, format="mp3", bitrate="192k")
-        elif format == "aac":
-            audio.export(output_path, format="aac", bitrate="192k")
-        else:  # wav
-            shutil.copy2(input_path, output_path)
+        output_path.write_bytes(encode_audio(audio, SAMPLE_RATE, format))
         return True
     except Exception as e:
-        print(f"Error converting audio: {e}")
+        print(f"Error encoding audio: {e}")
         return False
 
 def generate_tts_with_logs(voice_name, text, format, speed):
     """Generate TTS audio with real-time logging and format conversion."""
-    global model
+    global scheduler
 
     if not text.strip():
         return "❌ Error: Text required", None
 
     logs_text = ""
     try:
-        # Initialize model if not done yet
-        if model is None:
-            logs_text += "Loading model...\n"
-            model = build_model("kokoro-v0_19.pth", device)
+        # Requests arriving before the preload is done wait for it instead of building the model
+        engine = preloader.wait(timeout=0)
+        while engine is None:
+            yield logs_text + model_status() + "\n", None
+            engine = preloader.wait(timeout=1)
+        with engine_lock:
+            if scheduler is None:
+                scheduler = BatchScheduler(engine)
 
         # Load voice
         logs_text += f"Loading voice: {voice_name}\n"
         yield logs_text, None
-        voice = load_and_validate_voice(voice_name, device)
+        voice = engine.load_voice(voice_name)
 
         # Generate speech
         logs_text += f"Generating speech for: '{text}'\n"
         yield logs_text, None
-        audio, phonemes = generate_speech(model, text, voice, lang='a', device=device, speed=speed)
+        audio, phonemes = scheduler.synthesize(text, voice, lang='a', speed=speed)
+        logs_text += f"Scheduler: {scheduler.stats()}\n"
 
         if audio is not None and phonemes:
             try:
@@ -88,22 +100,18 @@ def generate_tts_with_logs(voice_name, text, format, speed):
             except UnicodeEncodeError:
                 logs_text += "Generated phonemes: [Unicode display error]\n"
 
-            # Save temporary WAV file
-            temp_wav = "output.wav"
-            sf.write(temp_wav, audio, SAMPLE_RATE)
-
-            # Convert to desired format
+            # Output names are unique per request since requests run concurrently
+            request_id = uuid.uuid4().hex[:8]
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"output_{timestamp}.{format}"
+            filename = f"output_{timestamp}_{request_id}.{format}"
             os.makedirs(DEFAULT_OUTPUT_DIR, exist_ok=True)
             output_path = Path(DEFAULT_OUTPUT_DIR) / filename
 
-            if convert_audio(temp_wav, str(output_path), format):
+            if save_audio(audio, output_path, format):
                 logs_text += f"✅ Saved: {output_path}\n"
-                os.remove(temp_wav)
                 yield logs_text, str(output_path)
             else:
-                logs_text += "❌ Audio conversion failed\n"
+                logs_text += "❌ Audio encoding failed\n"
                 yield logs_text, None
         else:
             logs_text += "❌ Failed to generate audio\n"
@@ -119,7 +127,7 @@ def create_interface(server_name="0.0.0.0", server_port=7860):
     Creates a web interface with:
     - Text input area
     - Voice model selection
-    - Audio format selection (WAV/MP3/AAC)
+    - Audio format selection (WAV/FLAC/OGG/MP3, AAC with ffmpeg)
     - Real-time progress logging
     - Audio playback and download
     - Example inputs for testing
@@ -138,6 +146,8 @@ def create_interface(server_name="0.0.0.0", server_port=7860):
         font=gr.themes.GoogleFont("Inter")
     )
 
+    preloader.start()
+
     with gr.Blocks(theme=theme) as demo:
         gr.HTML(
             """
@@ -194,6 +204,8 @@ def create_interface(server_name="0.0.0.0", server_port=7860):
             """
         )
         
+        status_output = gr.Markdown(model_status())
+        
         text_input = gr.Textbox(
             label="✍️ Text to Synthesize",
             placeholder="Enter text here...",
@@ -211,7 +223,7 @@ def create_interface(server_name="0.0.0.0", server_port=7860):
                         value="af_bella"
                     )
                     format = gr.Radio(
-                        choices=["wav", "mp3", "aac"],
+                        choices=available_formats(),
                         label="🎵 Output Format",
                         value="wav"
                     )
@@ -235,8 +247,15 @@ def create_interface(server_name="0.0.0.0", server_port=7860):
         generate_button.click(
             fn=generate_tts_with_logs,
             inputs=[voice, text_input, format, speed],
-            outputs=[logs_output, audio_output]
+            outputs=[logs_output, audio_output],
+            concurrency_limit=MAX_CONCURRENT_REQUESTS
         )
+        
+        # Readiness is refreshed on page load and, where gr.Timer exists, every two seconds;
+        # it is also served as the "status" API endpoint
+        demo.load(fn=model_status, outputs=status_output, api_name="status")
+        if hasattr(gr, "Timer"):
+            gr.Timer(2).tick(fn=model_status, outputs=status_output, api_name=False)
 
     return demo
 
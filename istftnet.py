@@ -18,17 +18,59 @@ def get_padding(kernel_size, dilation=1):
 
 LRELU_SLOPE = 0.1
 
+def masked_instance_norm(x, mask, eps=1e-5):
+    """ InstanceNorm1d over the valid frames only
+    x: (batchsize, channels, length)
+    mask: (batchsize, 1, length), 1 for valid frames and 0 for padding
+    """
+    count = mask.sum(dim=-1, keepdim=True)
+    mean = (x * mask).sum(dim=-1, keepdim=True) / count
+    var = (((x - mean) * mask) ** 2).sum(dim=-1, keepdim=True) / count
+    return (x - mean) / torch.sqrt(var + eps)
+
 class AdaIN1d(nn.Module):
     def __init__(self, style_dim, num_features):
         super().__init__()
         self.norm = nn.InstanceNorm1d(num_features, affine=False)
         self.fc = nn.Linear(style_dim, num_features*2)
 
-    def forward(self, x, s):
+    def style(self, s):
         h = self.fc(s)
         h = h.view(h.size(0), h.size(1), 1)
-        gamma, beta = torch.chunk(h, chunks=2, dim=1)
-        return (1 + gamma) * self.norm(x) + beta
+        return torch.chunk(h, chunks=2, dim=1)
+
+    def forward(self, x, s, mask=None):
+        # s: style vectors, or a StyleConditioning holding this layer's gamma and beta
+        gamma, beta = s[self] if isinstance(s, StyleConditioning) else self.style(s)
+        if mask is None:
+            return (1 + gamma) * self.norm(x) + beta
+        # padded frames are zeroed so that following convolutions see them as zero padding
+        return ((1 + gamma) * masked_instance_norm(x, mask, self.norm.eps) + beta) * mask
+
+class StyleConditioning:
+    """ Precomputed gamma/beta of every AdaIN1d layer of a module for one batch of style vectors
+    Passed to the module in place of the style tensor s, its AdaIN1d layers read their gamma
+    and beta from it instead of projecting s again on every forward.
+    """
+    def __init__(self, module, s, params=None):
+        self.s = s
+        self.params = params if params is not None else {
+            layer: layer.style(s) for layer in module.modules() if isinstance(layer, AdaIN1d)}
+
+    def __getitem__(self, layer):
+        return self.params[layer]
+
+    @property
+    def nbytes(self):
+        return sum(t.nbytes for gamma_beta in self.params.values() for t in gamma_beta)
+
+    @staticmethod
+    def cat(conditionings):
+        # Batches per-item conditionings of the same module along the batch dimension
+        first = conditionings[0]
+        return StyleConditioning(None, torch.cat([c.s for c in conditionings]), {
+            layer: tuple(torch.cat([c.params[layer][i] for c in conditionings]) for i in range(2))
+            for layer in first.params})
 
 class AdaINResBlock1(torch.nn.Module):
     def __init__(self, channels, kernel_size=3, dilation=(1, 3, 5), style_dim=64):
@@ -69,12 +111,12 @@ class AdaINResBlock1(torch.nn.Module):
         self.alpha2 = nn.ParameterList([nn.Parameter(torch.ones(1, channels, 1)) for i in range(len(self.convs2))])
 
 
-    def forward(self, x, s):
+    def forward(self, x, s, mask=None):
         for c1, c2, n1, n2, a1, a2 in zip(self.convs1, self.convs2, self.adain1, self.adain2, self.alpha1, self.alpha2):
-            xt = n1(x, s)
+            xt = n1(x, s, mask)
             xt = xt + (1 / a1) * (torch.sin(a1 * xt) ** 2)  # Snake1D
             xt = c1(xt)
-            xt = n2(xt, s)
+            xt = n2(xt, s, mask)
             xt = xt + (1 / a2) * (torch.sin(a2 * xt) ** 2)  # Snake1D
             xt = c2(xt)
             x = xt + x
@@ -353,37 +395,63 @@ class Generator(torch.nn.Module):
         self.stft = TorchSTFT(filter_length=gen_istft_n_fft, hop_length=gen_istft_hop_size, win_length=gen_istft_n_fft)
         
         
-    def forward(self, x, s, f0):
+    def forward(self, x, s, f0, mask=None):
+        """ mask: optional (batchsize, 1, length) frame mask of x for padded batches """
         with torch.no_grad():
-            f0 = self.f0_upsamp(f0[:, None]).transpose(1, 2)  # bs,n,t
-
-            har_source, noi_source, uv = self.m_source(f0)
-            har_source = har_source.transpose(1, 2).squeeze(1)
-            har_spec, har_phase = self.stft.transform(har_source)
-            har = torch.cat([har_spec, har_phase], dim=1)
+            if mask is None:
+                har = self.harmonic_source(f0)
+            else:
+                # per item, so that each source and its STFT end where the item ends
+                lengths = mask.sum(dim=-1).flatten().long().tolist()
+                hars = [self.harmonic_source(f0[i:i+1, :l]) for i, l in enumerate(lengths)]
+                frames = int(f0.shape[-1] * self.f0_upsamp.scale_factor) // self.stft.hop_length + 1
+                har = torch.cat([F.pad(h, (0, frames - h.shape[-1])) for h in hars])
         
         for i in range(self.num_upsamples):
             x = F.leaky_relu(x, LRELU_SLOPE)
             x_source = self.noise_convs[i](har)
-            x_source = self.noise_res[i](x_source, s)
 
+            if mask is not None:
+                x = x * mask
             x = self.ups[i](x)
+            if mask is not None:
+                mask = F.interpolate(mask, size=x.shape[-1])
             if i == self.num_upsamples - 1:
                 x = self.reflection_pad(x)
+                if mask is not None:
+                    mask = self.reflection_pad(mask)
+            x_source = self.noise_res[i](x_source, s, mask)
 
             x = x + x_source
             xs = None
             for j in range(self.num_kernels):
                 if xs is None:
-                    xs = self.resblocks[i*self.num_kernels+j](x, s)
+                    xs = self.resblocks[i*self.num_kernels+j](x, s, mask)
                 else:
-                    xs += self.resblocks[i*self.num_kernels+j](x, s)
+                    xs += self.resblocks[i*self.num_kernels+j](x, s, mask)
             x = xs / self.num_kernels
         x = F.leaky_relu(x)
+        if mask is not None:
+            x = x * mask
         x = self.conv_post(x)
         spec = torch.exp(x[:,:self.post_n_fft // 2 + 1, :])
         phase = torch.sin(x[:, self.post_n_fft // 2 + 1:, :])
-        return self.stft.inverse(spec, phase)
+        if mask is None:
+            return self.stft.inverse(spec, phase)
+        # per item too: over the whole batch, the inverse STFT would normalize the last
+        # samples of shorter items by the windows of the padding frames that follow them
+        lengths = mask.sum(dim=-1).flatten().long().tolist()
+        audio = [self.stft.inverse(spec[i:i+1, :, :l], phase[i:i+1, :, :l]) for i, l in enumerate(lengths)]
+        samples = (spec.shape[-1] - 1) * self.stft.hop_length
+        return torch.cat([F.pad(a, (0, samples - a.shape[-1])) for a in audio])
+    
+    def harmonic_source(self, f0):
+        f0 = self.f0_upsamp(f0[:, None]).transpose(1, 2)  # bs,n,t
+
+        har_source, noi_source, uv = self.m_source(f0)
+        har_source = har_source.transpose(1, 2).squeeze(1)
+        har_spec, har_phase = self.stft.transform(har_source)
+        return torch.cat([har_spec, har_phase], dim=1)
     
     def fw_phase(self, x, s):
         for i in range(self.num_upsamples):
@@ -444,18 +512,21 @@ class AdainResBlk1d(nn.Module):
             x = self.conv1x1(x)
         return x
 
-    def _residual(self, x, s):
-        x = self.norm1(x, s)
+    def _residual(self, x, s, mask=None):
+        x = self.norm1(x, s, mask)
         x = self.actv(x)
         x = self.pool(x)
+        if mask is not None and self.upsample_type != 'none':
+            mask = self.upsample(mask)
+            x = x * mask
         x = self.conv1(self.dropout(x))
-        x = self.norm2(x, s)
+        x = self.norm2(x, s, mask)
         x = self.actv(x)
         x = self.conv2(self.dropout(x))
         return x
 
-    def forward(self, x, s):
-        out = self._residual(x, s)
+    def forward(self, x, s, mask=None):
+        out = self._residual(x, s, mask)
         out = (out + self._shortcut(x)) / np.sqrt(2)
         return out
     
@@ -502,12 +573,13 @@ class Decoder(nn.Module):
                                    upsample_initial_channel, resblock_dilation_sizes, 
                                    upsample_kernel_sizes, gen_istft_n_fft, gen_istft_hop_size)
         
-    def forward(self, asr, F0_curve, N, s):
+    def forward(self, asr, F0_curve, N, s, mask=None):
+        # mask: optional (batchsize, 1, frames) mask of asr when decoding a padded batch
         F0 = self.F0_conv(F0_curve.unsqueeze(1))
         N = self.N_conv(N.unsqueeze(1))
         
         x = torch.cat([asr, F0, N], axis=1)
-        x = self.encode(x, s)
+        x = self.encode(x, s, mask)
         
         asr_res = self.asr_res(asr)
         
@@ -515,9 +587,11 @@ class Decoder(nn.Module):
         for block in self.decode:
             if res:
                 x = torch.cat([x, asr_res, F0, N], axis=1)
-            x = block(x, s)
+            x = block(x, s, mask)
             if block.upsample_type != "none":
                 res = False
+                if mask is not None:
+                    mask = block.upsample(mask)
                 
-        x = self.generator(x, s, F0_curve)
+        x = self.generator(x, s, F0_curve, mask)
         return x
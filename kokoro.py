@@ -1,158 +1,222 @@
+from collections import OrderedDict
+from frontend import (LANGUAGES, LEXICON_PATH, PHONEMIZE_VERSION, VOCAB, Normalizer, PhonemizerRegistry, Vocab,
+                      espeak_lock, espeak_phonemize_batch, flip_money, g2p_batch, get_vocab, lexicon,
+                      normalize_batch, normalize_text, normalizer, phonemizers, point_num, postprocess_phonemes,
+                      split_num, tokenize, vocab)
+from istftnet import StyleConditioning
+from phoneme_cache import PhonemeCache
+import itertools
 import phonemizer
 import re
+import threading
 import torch
 import numpy as np
+import weakref
+
+PHONEME_CACHE_PATH = 'resources/phoneme_cache.sqlite'
+phoneme_cache = PhonemeCache(PHONEME_CACHE_PATH, version='{}-espeak-{}-lexicon-{}'.format(
+    PHONEMIZE_VERSION, '.'.join(map(str, phonemizer.backend.EspeakBackend.version())), lexicon.fingerprint()))
 
-def split_num(num):
-    num = num.group()
-    if '.' in num:
-        return num
-    elif ':' in num:
-        h, m = [int(n) for n in num.split(':')]
-        if m == 0:
-            return f"{h} o'clock"
-        elif m < 10:
-            return f'{h} oh {m}'
-        return f'{h} {m}'
-    year = int(num[:4])
-    if year < 1100 or year % 1000 < 10:
-        return num
-    left, right = num[:2], int(num[2:4])
-    s = 's' if num.endswith('s') else ''
-    if 100 <= year % 1000 <= 999:
-        if right == 0:
-            return f'{left} hundred{s}'
-        elif right < 10:
-            return f'{left} oh {right}{s}'
-    return f'{left} {right}{s}'
-
-def flip_money(m):
-    m = m.group()
-    bill = 'dollar' if m[0] == '$' else 'pound'
-    if m[-1].isalpha():
-        return f'{m[1:]} {bill}s'
-    elif '.' not in m:
-        s = '' if m[1:] == '1' else 's'
-        return f'{m[1:]} {bill}{s}'
-    b, c = m[1:].split('.')
-    s = '' if b == '1' else 's'
-    c = int(c.ljust(2, '0'))
-    coins = f"cent{'' if c == 1 else 's'}" if m[0] == '$' else ('penny' if c == 1 else 'pence')
-    return f'{b} {bill}{s} and {c} {coins}'
-
-def point_num(num):
-    a, b = num.group().split('.')
-    return ' point '.join([a, ' '.join(b)])
-
-def normalize_text(text):
-    text = text.replace(chr(8216), "'").replace(chr(8217), "'")
-    text = text.replace('«', chr(8220)).replace('»', chr(8221))
-    text = text.replace(chr(8220), '"').replace(chr(8221), '"')
-    text = text.replace('(', '«').replace(')', '»')
-    for a, b in zip('、。！，：；？', ',.!,:;?'):
-        text = text.replace(a, b+' ')
-    text = re.sub(r'[^\S \n]', ' ', text)
-    text = re.sub(r'  +', ' ', text)
-    text = re.sub(r'(?<=\n) +(?=\n)', '', text)
-    text = re.sub(r'\bD[Rr]\.(?= [A-Z])', 'Doctor', text)
-    text = re.sub(r'\b(?:Mr\.|MR\.(?= [A-Z]))', 'Mister', text)
-    text = re.sub(r'\b(?:Ms\.|MS\.(?= [A-Z]))', 'Miss', text)
-    text = re.sub(r'\b(?:Mrs\.|MRS\.(?= [A-Z]))', 'Mrs', text)
-    text = re.sub(r'\betc\.(?! [A-Z])', 'etc', text)
-    text = re.sub(r'(?i)\b(y)eah?\b', r"\1e'a", text)
-    text = re.sub(r'\d*\.\d+|\b\d{4}s?\b|(?<!:)\b(?:[1-9]|1[0-2]):[0-5]\d\b(?!:)', split_num, text)
-    text = re.sub(r'(?<=\d),(?=\d)', '', text)
-    text = re.sub(r'(?i)[$£]\d+(?:\.\d+)?(?: hundred| thousand| (?:[bm]|tr)illion)*\b|[$£]\d+\.\d\d?\b', flip_money, text)
-    text = re.sub(r'\d*\.\d+', point_num, text)
-    text = re.sub(r'(?<=\d)-(?=\d)', ' to ', text)
-    text = re.sub(r'(?<=\d)S', ' S', text)
-    text = re.sub(r"(?<=[BCDFGHJ-NP-TV-Z])'?s\b", "'S", text)
-    text = re.sub(r"(?<=X')S\b", 's', text)
-    text = re.sub(r'(?:[A-Za-z]\.){2,} [a-z]', lambda m: m.group().replace('.', '-'), text)
-    text = re.sub(r'(?i)(?<=[A-Z])\.(?=[A-Z])', '-', text)
-    return text.strip()
-
-def get_vocab():
-    _pad = "$"
-    _punctuation = ';:,.!?¡¿—…"«»“” '
-    _letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
-    _letters_ipa = "ɑɐɒæɓʙβɔɕçɗɖðʤəɘɚɛɜɝɞɟʄɡɠɢʛɦɧħɥʜɨɪʝɭɬɫɮʟɱɯɰŋɳɲɴøɵɸθœɶʘɹɺɾɻʀʁɽʂʃʈʧʉʊʋⱱʌɣɤʍχʎʏʑʐʒʔʡʕʢǀǁǂǃˈˌːˑʼʴʰʱʲʷˠˤ˞↓↑→↗↘'̩'ᵻ"
-    symbols = [_pad] + list(_punctuation) + list(_letters) + list(_letters_ipa)
-    dicts = {}
-    for i in range(len((symbols))):
-        dicts[symbols[i]] = i
-    return dicts
-
-VOCAB = get_vocab()
-def tokenize(ps):
-    return [i for i in map(VOCAB.get, ps) if i is not None]
-
-phonemizers = dict(
-    a=phonemizer.backend.EspeakBackend(language='en-us', preserve_punctuation=True, with_stress=True),
-    b=phonemizer.backend.EspeakBackend(language='en-gb', preserve_punctuation=True, with_stress=True),
-)
 def phonemize(text, lang, norm=True):
     if norm:
         text = normalize_text(text)
-    ps = phonemizers[lang].phonemize([text])
-    ps = ps[0] if ps else ''
-    # https://en.wiktionary.org/wiki/kokoro#English
-    ps = ps.replace('kəkˈoːɹoʊ', 'kˈoʊkəɹoʊ').replace('kəkˈɔːɹəʊ', 'kˈəʊkəɹəʊ')
-    ps = ps.replace('ʲ', 'j').replace('r', 'ɹ').replace('x', 'k').replace('ɬ', 'l')
-    ps = re.sub(r'(?<=[a-zɹː])(?=hˈʌndɹɪd)', ' ', ps)
-    ps = re.sub(r' z(?=[;:,.!?¡¿—…"«»“” ]|$)', 'z', ps)
-    if lang == 'a':
-        ps = re.sub(r'(?<=nˈaɪn)ti(?!ː)', 'di', ps)
-    ps = ''.join(filter(lambda p: p in VOCAB, ps))
-    return ps.strip()
+    ps = phoneme_cache.get(text, lang)
+    if ps is None:
+        ps = g2p_batch([text], lang)[0]
+        phoneme_cache.put(text, lang, ps)
+    return ps
+
+def phonemize_batch(texts, lang, norm=True, njobs=1):
+    # Like [phonemize(t, lang, norm) for t in texts], but every distinct text missing from
+    # the cache goes through the lexicon and espeak in a single call (spread over njobs processes)
+    if norm:
+        texts = normalize_batch(texts)
+    cached = {t: phoneme_cache.get(t, lang) for t in dict.fromkeys(texts)}
+    misses = [t for t, ps in cached.items() if ps is None and t]
+    if misses:
+        for t, ps in zip(misses, g2p_batch(misses, lang, njobs)):
+            cached[t] = ps
+            phoneme_cache.put(t, lang, ps)
+    return [cached[t] or '' for t in texts]
 
 def length_to_mask(lengths):
     mask = torch.arange(lengths.max()).unsqueeze(0).expand(lengths.shape[0], -1).type_as(lengths)
     mask = torch.gt(mask+1, lengths.unsqueeze(1))
     return mask
 
+def alignment_indices(pred_dur):
+    # Token index of every output frame: gathering features with it is equivalent to
+    # multiplying by the dense tokens x frames alignment matrix, without building it
+    return torch.repeat_interleave(torch.arange(pred_dur.shape[-1], device=pred_dur.device), pred_dur)
+
+class EncoderCache:
+    # Bounded LRU of the voice- and speed-independent encoder outputs (PL-BERT projected
+    # by bert_encoder, and text_encoder) keyed by model and token sequence
+    def __init__(self, max_bytes=64 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = sum(t.nbytes for t in value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= sum(t.nbytes for t in evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, entries=len(self._entries), nbytes=self.nbytes)
+
+encoder_cache = EncoderCache()
+# Cache keys identify modules by a number given on first use rather than by id(), which
+# a module built after another one was freed can get again
+_cache_tokens = weakref.WeakKeyDictionary()
+_cache_token_counter = itertools.count()
+_cache_token_lock = threading.Lock()
+
+def cache_token(module):
+    with _cache_token_lock:
+        token = _cache_tokens.get(module)
+        if token is None:
+            token = _cache_tokens[module] = next(_cache_token_counter)
+        return token
+
+# AdaIN gamma/beta of the predictor and decoder, per style vector (voice and length index)
+style_cache = EncoderCache(max_bytes=32 * 2**20)
+
+def style_conditioning(module, s):
+    key = (cache_token(module), s.device, s.detach().cpu().numpy().tobytes())
+    cached = style_cache.get(key)
+    if cached is None:
+        cached = (StyleConditioning(module, s),)
+        style_cache.put(key, cached)
+    return cached[0]
+
 @torch.no_grad()
-def forward(model, tokens, ref_s, speed):
+def predict_features(model, tokens, ref_s, speed):
+    # Everything up to the decoder: returns the aligned text features, F0 and energy curves
     device = ref_s.device
-    tokens = torch.LongTensor([[0, *tokens, 0]]).to(device)
+    tokens = np.asarray(tokens, dtype=np.int64)
+    # model is a Munch (a dict, so not weakly referenceable): its bert module stands for it
+    cache_key = (cache_token(model.bert), device, tokens.tobytes())
+    tokens = torch.from_numpy(np.pad(tokens, 1)).unsqueeze(0).to(device)
     input_lengths = torch.LongTensor([tokens.shape[-1]]).to(device)
     text_mask = length_to_mask(input_lengths).to(device)
+    cached = encoder_cache.get(cache_key)
+    if cached is None:
+        bert_dur = model.bert(tokens, attention_mask=(~text_mask).int())
+        d_en = model.bert_encoder(bert_dur).transpose(-1, -2)
+        t_en = model.text_encoder(tokens, input_lengths, text_mask)
+        encoder_cache.put(cache_key, (d_en, t_en))
+    else:
+        d_en, t_en = cached
+    s = ref_s[:, 128:]
+    d = model.predictor.text_encoder(d_en, s, input_lengths, text_mask)
+    x, _ = model.predictor.lstm(d)
+    duration = model.predictor.duration_proj(x)
+    duration = torch.sigmoid(duration).sum(axis=-1) / speed
+    pred_dur = torch.round(duration).clamp(min=1).long()
+    frame_idx = alignment_indices(pred_dur[0])
+    en = d.transpose(-1, -2).index_select(-1, frame_idx)
+    F0_pred, N_pred = model.predictor.F0Ntrain(en, style_conditioning(model.predictor, s))
+    asr = t_en.index_select(-1, frame_idx)
+    return asr, F0_pred, N_pred
+
+@torch.no_grad()
+def forward(model, tokens, ref_s, speed):
+    asr, F0_pred, N_pred = predict_features(model, tokens, ref_s, speed)
+    s = style_conditioning(model.decoder, ref_s[:, :128])
+    return model.decoder(asr, F0_pred, N_pred, s).squeeze().cpu().numpy()
+
+@torch.no_grad()
+def forward_batch(model, tokens_list, ref_s, speed=1):
+    # tokens_list: N token lists of any lengths
+    # ref_s: (N, 256) style vectors, one per item (or (1, 256) shared by all)
+    # speed: a float or a sequence of N floats
+    # Returns N waveforms, each trimmed to its own length
+    device = ref_s.device
+    n = len(tokens_list)
+    ref_s = ref_s.expand(n, -1)
+    speed = torch.tensor(speed if isinstance(speed, (list, tuple)) else [speed] * n, device=device).unsqueeze(-1)
+    input_lengths = torch.LongTensor([len(t) + 2 for t in tokens_list]).to(device)
+    tokens = np.zeros((n, input_lengths.max().item()), dtype=np.int64)
+    for i, t in enumerate(tokens_list):
+        tokens[i, 1:len(t) + 1] = t
+    tokens = torch.from_numpy(tokens).to(device)
+    text_mask = length_to_mask(input_lengths).to(device)
     bert_dur = model.bert(tokens, attention_mask=(~text_mask).int())
     d_en = model.bert_encoder(bert_dur).transpose(-1, -2)
     s = ref_s[:, 128:]
     d = model.predictor.text_encoder(d_en, s, input_lengths, text_mask)
-    x, _ = model.predictor.lstm(d)
+    # packed so the backward direction of the LSTM starts at each item's own last token
+    x = torch.nn.utils.rnn.pack_padded_sequence(d, input_lengths.cpu(), batch_first=True, enforce_sorted=False)
+    x, _ = model.predictor.lstm(x)
+    x, _ = torch.nn.utils.rnn.pad_packed_sequence(x, batch_first=True, total_length=d.shape[1])
     duration = model.predictor.duration_proj(x)
     duration = torch.sigmoid(duration).sum(axis=-1) / speed
     pred_dur = torch.round(duration).clamp(min=1).long()
-    pred_aln_trg = torch.zeros(input_lengths, pred_dur.sum().item())
-    c_frame = 0
-    for i in range(pred_aln_trg.size(0)):
-        pred_aln_trg[i, c_frame:c_frame + pred_dur[0,i].item()] = 1
-        c_frame += pred_dur[0,i].item()
-    en = d.transpose(-1, -2) @ pred_aln_trg.unsqueeze(0).to(device)
-    F0_pred, N_pred = model.predictor.F0Ntrain(en, s)
     t_en = model.text_encoder(tokens, input_lengths, text_mask)
-    asr = t_en @ pred_aln_trg.unsqueeze(0).to(device)
-    return model.decoder(asr, F0_pred, N_pred, ref_s[:, :128]).squeeze().cpu().numpy()
+    # F0/N prediction normalizes over time, so it runs per item on the unpadded frames
+    asrs, F0s, Ns = [], [], []
+    for i, length in enumerate(input_lengths.tolist()):
+        frame_idx = alignment_indices(pred_dur[i, :length])
+        en = d[i:i + 1, :length].transpose(-1, -2).index_select(-1, frame_idx)
+        F0_pred, N_pred = model.predictor.F0Ntrain(en, style_conditioning(model.predictor, s[i:i + 1]))
+        asrs.append(t_en[i, :, :length].index_select(-1, frame_idx))
+        F0s.append(F0_pred[0])
+        Ns.append(N_pred[0])
+    frame_lengths = torch.LongTensor([a.shape[-1] for a in asrs]).to(device)
+    asr = torch.nn.utils.rnn.pad_sequence([a.T for a in asrs], batch_first=True).transpose(-1, -2)
+    F0_pred = torch.nn.utils.rnn.pad_sequence(F0s, batch_first=True)
+    N_pred = torch.nn.utils.rnn.pad_sequence(Ns, batch_first=True)
+    frame_mask = (~length_to_mask(frame_lengths)).unsqueeze(1).float()
+    s = StyleConditioning.cat([style_conditioning(model.decoder, ref_s[i:i + 1, :128]) for i in range(n)])
+    audio = model.decoder(asr, F0_pred, N_pred, s, mask=frame_mask).squeeze(1).cpu().numpy()
+    samples_per_frame = audio.shape[-1] // asr.shape[-1]
+    return [audio[i, :frames * samples_per_frame] for i, frames in enumerate(frame_lengths.tolist())]
 
 def generate(model, text, voicepack, lang='a', speed=1, ps=None):
     ps = ps or phonemize(text, lang)
     tokens = tokenize(ps)
-    if not tokens:
+    if not len(tokens):
         return None
     elif len(tokens) > 510:
         tokens = tokens[:510]
         print('Truncated to 510 tokens')
     ref_s = voicepack[len(tokens)]
     out = forward(model, tokens, ref_s, speed)
-    ps = ''.join(next(k for k, v in VOCAB.items() if i == v) for i in tokens)
+    ps = vocab.decode(tokens)
     return out, ps
 
 def generate_full(model, text, voicepack, lang='a', speed=1, ps=None):
     ps = ps or phonemize(text, lang)
     tokens = tokenize(ps)
-    if not tokens:
+    if not len(tokens):
         return None
     outs = []
     loop_count = len(tokens)//510 + (1 if len(tokens) % 510 != 0 else 0)
@@ -161,5 +225,91 @@ def generate_full(model, text, voicepack, lang='a', speed=1, ps=None):
         out = forward(model, tokens[i*510:(i+1)*510], ref_s, speed)
         outs.append(out)
     outs = np.concatenate(outs)
-    ps = ''.join(next(k for k, v in VOCAB.items() if i == v) for i in tokens)
-    return outs, ps
\ No newline at end of file
+    ps = vocab.decode(tokens)
+    return outs, ps
+
+# Boundaries in normalized text: sentence ends (optionally followed by a closing quote) and line breaks
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])[^\S\n]+|(?<=[.!?]["»])[^\S\n]+|\s*\n\s*')
+CLAUSE_BOUNDARY = re.compile(r'(?<=[,;:—…])\s+')
+
+def split_sentences(text):
+    return [s for s in SENTENCE_BOUNDARY.split(text) if s.strip()]
+
+class ClauseSegmenter:
+    # Cuts text arriving in fragments (e.g. the tokens of a language model) into segments that
+    # can be synthesized before the rest has arrived. A segment ends at a sentence end once the
+    # whitespace after it has arrived (so the "3." of "3.5" never ends one), at a line break,
+    # at a clause boundary once the segment is at least min_chars long, or at the last space
+    # before max_chars when none of these comes. Titles and initials such as "Dr." or "J." do
+    # not end sentences. Segments are raw text: generate_stream() normalizes them.
+    ABBREVIATION = re.compile(r'(?:\b(?:[DdSsJj]r|[Mm]rs?|[Mm]s|[Ss]t|vs|[A-Za-z])\.)["»]?$')
+
+    def __init__(self, min_chars=40, max_chars=300):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ''
+
+    def feed(self, fragment):
+        # Returns the segments completed by this fragment
+        self.buffer += fragment
+        segments = []
+        while True:
+            end = self._boundary()
+            if end is None:
+                return segments
+            segment, self.buffer = self.buffer[:end].strip(), self.buffer[end:]
+            if segment:
+                segments.append(segment)
+
+    def flush(self):
+        # Returns every remaining segment, cutting the buffered text wherever it stops
+        segments = self.feed('')
+        rest, self.buffer = self.buffer.strip(), ''
+        return segments + [rest] if rest else segments
+
+    def _boundary(self):
+        # End of the first complete segment in the buffer, or None
+        for m in SENTENCE_BOUNDARY.finditer(self.buffer):
+            if '\n' in m.group() or not self.ABBREVIATION.search(self.buffer, 0, m.start()):
+                sentence_end = m.end()
+                break
+        else:
+            sentence_end = None
+        for m in CLAUSE_BOUNDARY.finditer(self.buffer, self.min_chars):
+            if sentence_end is None or m.end() < sentence_end:
+                return m.end()
+            break
+        if sentence_end is not None:
+            return sentence_end
+        if len(self.buffer) > self.max_chars:
+            space = self.buffer.rfind(' ', 0, self.max_chars)
+            return space + 1 if space > 0 else self.max_chars
+        return None
+
+def sentence_chunks(sentence, lang, max_tokens=510):
+    # Yields (tokens, ps) chunks of at most max_tokens for one normalized sentence. Long
+    # sentences are split at clause boundaries, and at hard token boundaries only as a last
+    # resort. phonemize() only keeps vocabulary symbols, so len(ps) == len(tokenize(ps)).
+    pieces = [phonemize(sentence, lang, norm=False)]
+    if len(pieces[0]) > max_tokens:
+        pieces = []
+        for clause in CLAUSE_BOUNDARY.split(sentence):
+            ps = phonemize(clause, lang, norm=False)
+            pieces.extend(ps[i:i+max_tokens] for i in range(0, len(ps), max_tokens))
+    pending = ''
+    for ps in filter(None, pieces):
+        if pending and len(pending) + 1 + len(ps) > max_tokens:
+            yield tokenize(pending), pending
+            pending = ps
+        else:
+            pending = f'{pending} {ps}' if pending else ps
+    if pending:
+        yield tokenize(pending), pending
+
+def generate_stream(model, text, voicepack, lang='a', speed=1):
+    # Yields (audio, ps) chunk by chunk as soon as each one is decoded, so that time to first
+    # audio does not depend on the length of the text and only one chunk is held at a time.
+    # Lines are normalized as they are reached, so the first sentence does not wait for the rest
+    for sentence in (sentence for line in normalizer.stream(text.split('\n')) for sentence in split_sentences(line)):
+        for tokens, ps in sentence_chunks(sentence, lang):
+            yield forward(model, tokens, voicepack[len(tokens)], speed), ps
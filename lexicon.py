@@ -0,0 +1,166 @@
+import hashlib
+import os
+import re
+
+__all__ = ['Lexicon', 'DEFAULT_ENTRIES']
+
+# (languages, words, phonemes) shipped with the project; user entries override them
+DEFAULT_ENTRIES = [
+    # https://en.wiktionary.org/wiki/kokoro#English
+    ('a', 'kokoro', 'kˈoʊkəɹoʊ'),
+    ('b', 'kokoro', 'kˈəʊkəɹəʊ'),
+]
+
+WORD = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*")
+# Characters a lexicon match may border on; anything else (hyphens, digits, apostrophes)
+# joins the word to its neighbours and leaves the whole span to espeak
+BOUNDARY_PUNCTUATION = set(';:,.!?¡¿—…"«»“”()')
+END = ''  # Trie key holding the phonemes of the entry ending at a node (words are never empty)
+
+class Lexicon:
+    """User-extensible pronunciation lexicon consulted before espeak.
+
+    Entries map a word, or a sequence of words such as a brand name, to phonemes for
+    one language. They are held in a per-language trie keyed by lower-cased word, so a
+    text is matched longest entry first in a single pass over its words. Matched words
+    get their phonemes directly; only the spans in between go to espeak.
+
+    Args:
+        entries: Iterable of (languages, words, phonemes), languages being a
+            comma-separated list of language codes
+    """
+
+    def __init__(self, entries=()):
+        self._entries = {}
+        self._tries = {}
+        for langs, words, ps in entries:
+            self.add(words, ps, langs)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, words, ps, langs):
+        """Add or replace the pronunciation of words (a string or a list of words)."""
+        if isinstance(words, str):
+            words = WORD.findall(words)
+        words = tuple(w.lower() for w in words)
+        if not words:
+            raise ValueError(f"Lexicon entry for {ps!r} has no words")
+        for lang in langs.split(','):
+            lang = lang.strip()
+            self._entries[lang, words] = ps
+            node = self._tries.setdefault(lang, {})
+            for word in words:
+                node = node.setdefault(word, {})
+            node[END] = ps
+
+    def load(self, path):
+        """Add the entries of a tab-separated file of `languages<TAB>words<TAB>phonemes` lines.
+
+        Blank lines and lines starting with # are skipped. A missing file is not an error.
+
+        Returns:
+            Number of entries loaded
+        """
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                fields = [field.strip() for field in line.split('\t')]
+                try:
+                    if len(fields) != 3 or not all(fields):
+                        raise ValueError("expected languages, words and phonemes separated by tabs")
+                    self.add(fields[1], fields[2], fields[0])
+                    count += 1
+                except ValueError as e:
+                    print(f"Skipping lexicon entry {path}:{number}: {e}")
+        print(f"Loaded {count} lexicon entries from {path}")
+        return count
+
+    def fingerprint(self):
+        """Short hash of every entry, for invalidating caches when the lexicon changes."""
+        digest = hashlib.sha1(repr(sorted(self._entries.items())).encode('utf-8'))
+        return digest.hexdigest()[:12]
+
+    def split(self, text, lang):
+        """Split text into (span, phonemes) pieces covering it in order.
+
+        phonemes is the lexicon pronunciation for matched words, and None for spans left
+        to espeak.
+        """
+        trie = self._tries.get(lang)
+        if not trie:
+            return [(text, None)]
+        words = list(WORD.finditer(text))
+        pieces, start, i = [], 0, 0
+        while i < len(words):
+            match = self._match(text, words, i, trie)
+            if match is None:
+                i += 1
+                continue
+            j, ps = match
+            begin, end = words[i].start(), words[j - 1].end()
+            if begin > start:
+                pieces.append((text[start:begin], None))
+            pieces.append((text[begin:end], ps))
+            start, i = end, j
+        if start < len(text):
+            pieces.append((text[start:], None))
+        return pieces
+
+    def phonemize_batch(self, texts, lang, fallback):
+        """Phonemize texts, sending every span not covered by the lexicon to fallback.
+
+        Args:
+            texts: Texts to phonemize
+            lang: Language code
+            fallback: Function taking a list of spans and returning their phonemes,
+                called once for the whole batch
+
+        Returns:
+            List of phoneme strings, one per text
+        """
+        split = [self.split(text, lang) for text in texts]
+        spans = [span for pieces in split for span, ps in pieces if ps is None and _has_word(span)]
+        phonemes = iter(fallback(spans) if spans else [])
+        results = []
+        for pieces in split:
+            out, space = '', False
+            for span, ps in pieces:
+                if ps is None:
+                    # Spans without letters or digits are only punctuation and whitespace
+                    ps = next(phonemes) if _has_word(span) else ' '.join(span.split())
+                space = space or span[:1].isspace()
+                if ps:
+                    out += (' ' if out and space else '') + ps
+                    space = False
+                space = space or span[-1:].isspace()
+            results.append(out)
+        return results
+
+    @staticmethod
+    def _match(text, words, i, trie):
+        # Longest entry starting at words[i] whose words are only separated by whitespace
+        # and which borders on whitespace, punctuation or the ends of the text
+        if not _is_boundary(text, words[i].start() - 1):
+            return None
+        node, match = trie, None
+        for j in range(i, len(words)):
+            if j > i and not text[words[j - 1].end():words[j].start()].isspace():
+                break
+            node = node.get(words[j].group().lower())
+            if node is None:
+                break
+            if END in node and _is_boundary(text, words[j].end()):
+                match = j + 1, node[END]
+        return match
+
+def _is_boundary(text, index):
+    return index < 0 or index >= len(text) or text[index].isspace() or text[index] in BOUNDARY_PUNCTUATION
+
+def _has_word(span):
+    return any(c.isalnum() for c in span)
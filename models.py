@@ -1,21 +1,43 @@
 import torch
+import torch.nn as nn
+import numpy as np
 import os
 import sys
+import time
 import platform
 import glob
 import warnings
+from torch.nn.utils import remove_weight_norm, parametrize
 from huggingface_hub import hf_hub_download, list_repo_files
 import espeakng_loader
 from phonemizer.backend.espeak.wrapper import EspeakWrapper
 from importlib.util import spec_from_file_location, module_from_spec
 from pathlib import Path
+from artifacts import ArtifactResolver
+from voice_bank import VoiceRegistry
+from weights import (build_from_prepared_weights, checkpoint_source, is_current, load_prepared_weights,
+                     save_prepared_weights)
 
 # Filter out specific warnings
 warnings.filterwarnings("ignore", category=FutureWarning, module="torch.nn.utils.weight_norm")
 warnings.filterwarnings("ignore", category=UserWarning, module="torch.nn.modules.rnn")
 os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
 
-__all__ = ['list_available_voices', 'build_model', 'load_voice', 'generate_speech', 'load_and_validate_voice']
+__all__ = ['list_available_voices', 'build_model', 'load_voice', 'generate_speech', 'load_and_validate_voice',
+           'KokoroEngine', 'prepare_for_inference']
+
+REPO_ID = "hexgrad/Kokoro-82M"
+SAMPLE_RATE = 24000  # Rate of the waveforms the model produces, in Hz
+RESOURCES_DIR = "resources"  # Local cache directory for hub downloads
+PREPARED_WEIGHTS = os.path.join(RESOURCES_DIR, "kokoro-v0_19.prepared.safetensors")  # Memory-mapped by build_model()
+LOCAL_MODULES = ('plbert', 'istftnet', 'kokoro')  # Shipped with this project, imported in this order
+PROBE_TOKENS = list(range(16, 80))  # Fixed utterance used to verify and time inference preparation
+PREPARE_TOLERANCE = 1e-4  # Largest sample difference allowed after inference preparation
+
+# Populated once by resolve_modules()
+_resolved_modules = {}
+# Hub files are recorded in resources/manifest.json and served from it without network calls
+artifacts = ArtifactResolver(REPO_ID, RESOURCES_DIR)
 
 def get_voices_path():
     """Get the path where voice files are stored."""
@@ -164,40 +186,72 @@ def import_module_from_path(module_name, module_path):
         print(f"Error importing module {module_name}: {e}")
         raise e
 
+def resolve_modules():
+    """Resolve and import the plbert, istftnet, kokoro and model definition modules.
+    
+    The plbert.py, istftnet.py and kokoro.py shipped with this project are imported
+    directly; only the model definitions (models.py) and config.json come from the hub,
+    through the artifact manifest. The result is cached. The espeak
+    phonemizers are not built here: kokoro creates each one on first use.
+    
+    Returns:
+        Dict mapping 'plbert', 'istftnet', 'kokoro' and 'models' to the imported modules
+    """
+    if _resolved_modules:
+        return _resolved_modules
+    setup_espeak()
+    
+    project_dir = Path(__file__).parent
+    modules = {}
+    for name in LOCAL_MODULES:
+        print(f"Importing {name} module...")
+        modules[name] = import_module_from_path(name, str(project_dir / f"{name}.py"))
+    
+    # config.json must sit next to the hub models.py, which reads it from its own directory
+    models_py = artifacts.resolve("models.py")
+    artifacts.resolve("config.json")
+    print("Importing models module...")
+    # Registered under its own name so it does not shadow this module in sys.modules
+    modules['models'] = import_module_from_path("kokoro_models", models_py)
+    
+    _resolved_modules.update(modules)
+    return _resolved_modules
+
 def build_model(model_file, device='cpu'):
-    """Build the Kokoro model following official implementation."""
+    """Build the Kokoro model following official implementation.
+    
+    The first build loads the hub checkpoint, prepares the model for inference and saves
+    the prepared weights as safetensors. Later builds wrap the bare model around those
+    weights, memory-mapped, so that processes on one host share a single copy of them.
+    """
     try:
-        setup_espeak()
-        
-        repo_id = "hexgrad/Kokoro-82M"
-      #  Download all required files
-        resources_dir = "resources"   # Your preferred local directory
-
-        model_path = hf_hub_download(repo_id=repo_id, filename="kokoro-v0_19.pth", cache_dir=resources_dir )
-        kokoro_py = hf_hub_download(repo_id=repo_id, filename="kokoro.py", cache_dir=resources_dir )
-        models_py = hf_hub_download(repo_id=repo_id, filename="models.py", cache_dir=resources_dir )
-        istftnet_py = hf_hub_download(repo_id=repo_id, filename="istftnet.py", cache_dir=resources_dir )
-        plbert_py = hf_hub_download(repo_id=repo_id, filename="plbert.py", cache_dir=resources_dir)
-        config_json = hf_hub_download(repo_id=repo_id, filename="config.json", cache_dir=resources_dir )
+        modules = resolve_modules()
+        models_module = modules['models']
+        model_path = artifacts.resolve("kokoro-v0_19.pth")
+        source = checkpoint_source(model_path)
         
-        # Import required modules
-        print("Importing plbert module...")
-        plbert_module = import_module_from_path("plbert", plbert_py)
-        print("Importing istftnet module...")
-        istftnet_module = import_module_from_path("istftnet", istftnet_py)
-        print("Importing models module...")
-        models_module = import_module_from_path("models", models_py)
-        print("Importing kokoro module...")
-        kokoro_module = import_module_from_path("kokoro", kokoro_py)
-        
-        # Test phonemizer
-        from phonemizer import phonemize
-        test_phonemes = phonemize("Hello")
-        print(f"Phonemizer test successful: 'Hello' -> {test_phonemes}")
-        
-        # Build model
-        print("Building model...")
-        model = models_module.build_model(model_path, device)
+        if is_current(PREPARED_WEIGHTS, source):
+            print("Building model from memory-mapped weights...")
+            model = build_from_prepared_weights(models_module.build_model,
+                                                lambda model: prepare_for_inference(model, verify=False),
+                                                PREPARED_WEIGHTS, device)
+        else:
+            print("Building model...")
+            model = models_module.build_model(model_path, device)
+            prepare_for_inference(model)
+            try:
+                os.makedirs(RESOURCES_DIR, exist_ok=True)
+                save_prepared_weights(model, PREPARED_WEIGHTS, source)
+                if str(device) == 'cpu':
+                    # Swap the private weights for the mapped ones, as later builds will have them
+                    load_prepared_weights(model, PREPARED_WEIGHTS)
+                print(f"Saved prepared weights to {PREPARED_WEIGHTS}")
+            except OSError as e:
+                print(f"Could not save prepared weights to {PREPARED_WEIGHTS}: {e}")
+        # Entries of an earlier model are never hit again, and the style conditionings
+        # reference its layers, which would stay alive until evicted
+        modules['kokoro'].encoder_cache.clear()
+        modules['kokoro'].style_cache.clear()
         print(f"Model loaded successfully on {device}")
         return model
         
@@ -207,6 +261,72 @@ def build_model(model_file, device='cpu'):
         traceback.print_exc()
         raise e
 
+def _synthesize_probe(model, kokoro_module, runs=2):
+    """Synthesize the probe utterance with fixed noise; returns (audio, best time in seconds)."""
+    device = next(model.decoder.parameters()).device
+    ref_s = torch.randn(1, 256, generator=torch.Generator().manual_seed(0)).to(device)
+    best = float('inf')
+    for _ in range(runs):
+        # time and compare the full model, encoders and style projections included
+        kokoro_module.encoder_cache.clear()
+        kokoro_module.style_cache.clear()
+        with torch.random.fork_rng():
+            torch.manual_seed(0)
+            start = time.perf_counter()
+            audio = kokoro_module.forward(model, PROBE_TOKENS, ref_s, 1)
+            best = min(best, time.perf_counter() - start)
+    kokoro_module.encoder_cache.clear()
+    kokoro_module.style_cache.clear()
+    return audio, best
+
+def prepare_for_inference(model, verify=True):
+    """Prepare a freshly built model for inference.
+    
+    Folds every weight-norm parametrization (decoder, predictor and text encoder) into
+    plain weights so they are no longer recomputed on each forward, puts every submodule
+    in eval mode and replaces dropout layers with identities.
+    
+    Args:
+        model: Model built by the hub build_model (a Munch of submodules)
+        verify: Synthesize a probe utterance before and after, check that the outputs
+            match and print the measured speedup
+            
+    Returns:
+        The same model, prepared in place
+        
+    Raises:
+        RuntimeError: If the prepared model's output differs from the original
+    """
+    kokoro_module = resolve_modules()['kokoro']
+    if verify:
+        expected, before = _synthesize_probe(model, kokoro_module)
+    
+    folded = 0
+    for component in model.values():
+        component.eval()
+        for module in list(component.modules()):
+            if hasattr(module, 'weight_g'):
+                remove_weight_norm(module)
+                folded += 1
+            elif parametrize.is_parametrized(module, 'weight'):
+                parametrize.remove_parametrizations(module, 'weight')
+                folded += 1
+            for name, child in module.named_children():
+                if isinstance(child, nn.Dropout):
+                    setattr(module, name, nn.Identity())
+    print(f"Folded weight norm into {folded} layers")
+    
+    if verify:
+        actual, after = _synthesize_probe(model, kokoro_module)
+        if expected.shape != actual.shape:
+            raise RuntimeError(f"Prepared model output length changed: {expected.shape} -> {actual.shape}")
+        max_diff = np.abs(expected - actual).max()
+        if max_diff > PREPARE_TOLERANCE:
+            raise RuntimeError(f"Prepared model output differs by up to {max_diff:.2e}")
+        print(f"Inference preparation verified (max difference {max_diff:.2e}), "
+              f"probe synthesis {before * 1000:.0f} ms -> {after * 1000:.0f} ms ({before / after:.2f}x)")
+    return model
+
 def load_voice(voice_name='af_bella', device='cpu'):
     """Load a voice from the local voices directory."""
     try:
@@ -234,9 +354,7 @@ def load_voice(voice_name='af_bella', device='cpu'):
 def generate_speech(model, text, voice=None, lang='a', device='cpu',speed=1):
     """Generate speech using the Kokoro model."""
     try:
-        repo_id = "hexgrad/Kokoro-82M"
-        kokoro_py = hf_hub_download(repo_id=repo_id, filename="kokoro.py")
-        kokoro_module = import_module_from_path("kokoro", kokoro_py)
+        kokoro_module = resolve_modules()['kokoro']
         
         # Generate speech
         audio, phonemes = kokoro_module.generate(model, text, voice, lang=lang,speed=speed)
@@ -274,4 +392,129 @@ def generate_speech(model, text, voice=None, lang='a', device='cpu',speed=1):
         print(f"Error generating speech: {e}")
         import traceback
         traceback.print_exc()
-        return None, None
\ No newline at end of file
+        return None, None
+
+class KokoroEngine:
+    """Long-lived synthesis engine.
+    
+    Owns the model, the resolved kokoro/istftnet/models modules, the phonemizers and
+    the voice registry. Build it once and reuse it: synthesize() then only pays
+    for phonemization and inference.
+    
+    Args:
+        model_file: Path to the model weights
+        device: Device to run on ('cuda' or 'cpu')
+    """
+    
+    def __init__(self, model_file='kokoro-v0_19.pth', device='cpu'):
+        self.device = device
+        self.startup_seconds = {}
+        start = time.perf_counter()
+        self.modules = resolve_modules()
+        self.kokoro = self.modules['kokoro']
+        self.startup_seconds['modules'] = time.perf_counter() - start
+        start = time.perf_counter()
+        self.model = build_model(model_file, device)
+        self.startup_seconds['model'] = time.perf_counter() - start
+        start = time.perf_counter()
+        self.voices = VoiceRegistry(get_voices_path(), device)
+        if not len(self.voices):
+            list_available_voices()  # downloads the official voicepacks on first run
+            self.voices.refresh()
+        self.startup_seconds['voices'] = time.perf_counter() - start
+        print("Engine startup: " + ", ".join(f"{k} {v:.2f}s" for k, v in self.startup_seconds.items()))
+    
+    def startup_stats(self):
+        """Return engine startup timings and the per-language phonemizer initialization times.
+        
+        Phonemizers are created on the first request in each language, so their timings
+        only appear once that language has been used.
+        """
+        return {
+            'startup_seconds': dict(self.startup_seconds),
+            'phonemizers': self.kokoro.phonemizers.stats(),
+        }
+    
+    @property
+    def phonemizers(self):
+        """Phonemizer registry by language code; backends are created on first use."""
+        return self.kokoro.phonemizers
+    
+    def list_voices(self):
+        """Return the sorted voice names, without touching the disk."""
+        return self.voices.names()
+    
+    def load_voice(self, voice_name):
+        """Return the voicepack for voice_name from the voice bank.
+        
+        Recently used voicepacks stay on the device, so switching voices is a lookup.
+        
+        Raises:
+            ValueError: If the requested voice doesn't exist
+        """
+        return self.voices.get(voice_name)
+    
+    def warmup(self, lengths, voice='af_bella', lang='a'):
+        """Synthesize one utterance of each token length and drop the results.
+        
+        The first inference at a given size pays for allocator growth and kernel selection;
+        warming up the lengths served most moves that cost out of the first requests. The
+        phonemizer for lang is created as well.
+        
+        The caches are left as they are: forward_batch() does not use the encoder cache, and
+        the style conditionings it stores are those of a real voice at real lengths.
+        
+        Args:
+            lengths: Token lengths to synthesize, at most 510
+            voice: Voice to use; the first available voice if it doesn't exist
+            lang: Language whose phonemizer is created
+            
+        Returns:
+            Dict mapping each length to its synthesis time in seconds; empty if there are
+            no voices to synthesize with
+        """
+        self.phonemizers[lang]
+        if voice not in self.voices:
+            voices = self.list_voices()
+            if not voices:
+                print(f"Skipping warmup: no voices in {self.voices.voices_dir}")
+                return {}
+            voice = voices[0]
+        voicepack = self.load_voice(voice)
+        seconds = {}
+        for length in lengths:
+            tokens = [PROBE_TOKENS[i % len(PROBE_TOKENS)] for i in range(length)]
+            start = time.perf_counter()
+            self.kokoro.forward_batch(self.model, [tokens], voicepack[length])
+            seconds[length] = time.perf_counter() - start
+        return seconds
+    
+    def synthesize(self, text, voice='af_bella', lang='a', speed=1):
+        """Synthesize text with the given voice.
+        
+        Args:
+            text: Text to synthesize
+            voice: Voice name or an already loaded voicepack tensor
+            lang: Language code ('a' for American English, 'b' for British English)
+            speed: Speaking rate multiplier
+            
+        Returns:
+            Tuple of (audio, phonemes), or (None, None) on failure
+        """
+        voicepack = self.load_voice(voice) if isinstance(voice, str) else voice
+        return generate_speech(self.model, text, voicepack, lang=lang, device=self.device, speed=speed)
+    
+    def stream(self, text, voice='af_bella', lang='a', speed=1):
+        """Synthesize text sentence by sentence, yielding audio as soon as it is ready.
+        
+        Args:
+            text: Text to synthesize, of any length
+            voice: Voice name or an already loaded voicepack tensor
+            lang: Language code ('a' for American English, 'b' for British English)
+            speed: Speaking rate multiplier
+            
+        Yields:
+            Tuple of (audio, phonemes) for each chunk, in order
+        """
+        voicepack = self.load_voice(voice) if isinstance(voice, str) else voice
+        yield from self.kokoro.generate_stream(self.model, text, voicepack, lang=lang, speed=speed)
@@ -0,0 +1,189 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+__all__ = ['PhonemeCache']
+
+SCHEMA_VERSION = 2  # Stored in PRAGMA user_version; stores of an older layout are rebuilt
+
+class PhonemeCache:
+    """Two-level phoneme cache: an in-process LRU in front of a persistent sqlite store.
+
+    Entries are keyed by (normalized text, language) and, on disk, by phonemizer version
+    too, so that processes running different versions can share one store without
+    invalidating each other. Rows of any version leave the store once unused for
+    max_age_days, or least recently used first once it outgrows max_disk_bytes.
+    Hits in either tier skip espeak entirely.
+
+    Disk writes are deferred: new entries and the access times of disk hits are
+    written in one transaction once flush_every of them are pending or flush_seconds
+    have passed, and at exit.
+
+    Args:
+        path: sqlite database for the persistent tier, or None to keep the cache in memory only
+        version: Phonemizer version string (espeak version plus post-processing rules)
+        max_entries: Number of entries kept in the in-memory LRU
+        max_disk_bytes: Size budget of the persistent tier; least recently used rows are
+            evicted beyond it
+        max_age_days: Rows unused for longer are evicted when the store is opened
+        flush_every: Pending disk writes that trigger a flush
+        flush_seconds: Longest time a write stays pending while the cache is in use
+    """
+
+    def __init__(self, path=None, version='', max_entries=10000, max_disk_bytes=64 * 2**20, max_age_days=30,
+                 flush_every=256, flush_seconds=5):
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age_days = max_age_days
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_bytes = 0
+        self._pending = {}  # (text, lang) -> phonemes not yet written to disk
+        self._touched = {}  # (text, lang) -> access time of a disk hit not yet written
+        self._last_flush = time.monotonic()
+
+    def get(self, text, lang):
+        """Return the cached phonemes for text, or None on a miss."""
+        key = (text, lang)
+        with self._lock:
+            ps = self._memory.get(key)
+            if ps is None:
+                ps = self._pending.get(key)
+            if ps is not None:
+                self._remember(key, ps)
+                self.memory_hits += 1
+                return ps
+            db = self._open()
+            if db is not None:
+                row = db.execute('SELECT ps FROM phonemes WHERE version = ? AND lang = ? AND text = ?',
+                                 (self.version, lang, text)).fetchone()
+                if row is not None:
+                    self._touched[key] = time.time()
+                    self._remember(key, row[0])
+                    self.disk_hits += 1
+                    self._maybe_flush()
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, text, lang, ps):
+        """Store the phonemes for text in both tiers."""
+        key = (text, lang)
+        with self._lock:
+            self._remember(key, ps)
+            if self._open() is None:
+                return
+            self._pending[key] = ps
+            self._maybe_flush()
+
+    def flush(self):
+        """Write pending entries and access times to disk."""
+        with self._lock:
+            self._flush()
+
+    def clear(self):
+        """Drop every entry of this version from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._pending.clear()
+            self._touched.clear()
+            db = self._open()
+            if db is not None:
+                db.execute('DELETE FROM phonemes WHERE version = ?', (self.version,))
+                db.commit()
+                self._disk_bytes = self._stored_bytes(db)
+
+    def stats(self):
+        """Return hit/miss counters and the size of both tiers."""
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+                'pending_writes': len(self._pending) + len(self._touched),
+                'disk_bytes': self._disk_bytes,
+            }
+
+    def _remember(self, key, ps):
+        self._memory[key] = ps
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _open(self):
+        # Opened on first use so that importing kokoro does not touch the disk
+        if self._db is None and self.path is not None:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+                db.execute('PRAGMA journal_mode=WAL')
+                db.execute('PRAGMA synchronous=NORMAL')
+                if db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                    db.execute('DROP TABLE IF EXISTS phonemes')
+                    db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                db.execute('CREATE TABLE IF NOT EXISTS phonemes (version TEXT, lang TEXT, text TEXT, ps TEXT, '
+                           'size INTEGER, last_used REAL, PRIMARY KEY (version, lang, text))')
+                db.execute('CREATE INDEX IF NOT EXISTS phonemes_last_used ON phonemes (last_used)')
+                db.execute('DELETE FROM phonemes WHERE last_used < ?', (time.time() - self.max_age_days * 86400,))
+                db.commit()
+                self._disk_bytes = self._stored_bytes(db)
+                self._db = db
+                atexit.register(self.flush)
+            except sqlite3.Error as e:
+                print(f"Error opening phoneme cache {self.path}, using memory only: {e}")
+                self.path = None
+        return self._db
+
+    def _maybe_flush(self):
+        if (len(self._pending) + len(self._touched) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_seconds):
+            self._flush()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if self._db is None or not (self._pending or self._touched):
+            return
+        now = time.time()
+        try:
+            with self._db as db:  # One transaction
+                for (text, lang), ps in self._pending.items():
+                    size = len(text.encode('utf-8')) + len(ps.encode('utf-8'))
+                    if db.execute('INSERT OR IGNORE INTO phonemes VALUES (?, ?, ?, ?, ?, ?)',
+                                  (self.version, lang, text, ps, size, now)).rowcount:
+                        self._disk_bytes += size
+                db.executemany('UPDATE phonemes SET last_used = ? WHERE version = ? AND lang = ? AND text = ?',
+                               [(t, self.version, lang, text) for (text, lang), t in self._touched.items()])
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._evict(db)
+        except sqlite3.Error as e:
+            print(f"Error writing phoneme cache {self.path}: {e}")
+        self._pending.clear()
+        self._touched.clear()
+
+    def _evict(self, db):
+        # Other processes write to the store too: start from its actual size
+        self._disk_bytes = self._stored_bytes(db)
+        # Drop least recently used rows, of any version, until the store is back to 90% of its budget
+        target = self.max_disk_bytes * 0.9
+        for version, lang, text, size in db.execute(
+                'SELECT version, lang, text, size FROM phonemes ORDER BY last_used').fetchall():
+            if self._disk_bytes <= target:
+                break
+            db.execute('DELETE FROM phonemes WHERE version = ? AND lang = ? AND text = ?', (version, lang, text))
+            self._disk_bytes -= size
+
+    @staticmethod
+    def _stored_bytes(db):
+        return db.execute('SELECT COALESCE(SUM(size), 0) FROM phonemes').fetchone()[0]
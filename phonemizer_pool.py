@@ -0,0 +1,206 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from phonemizer.backend.espeak.wrapper import EspeakWrapper
+
+__all__ = ['PhonemizerPool']
+
+MAX_ATTEMPTS = 2  # A request is retried once on a fresh worker if its worker dies
+
+def _phonemize_items(frontend, items, norm):
+    # Group by language so that each language goes to espeak in a single call
+    results = [''] * len(items)
+    by_lang = {}
+    for i, (text, lang) in enumerate(items):
+        text = frontend.normalize_text(text) if norm else text
+        if text:
+            by_lang.setdefault(lang, []).append((i, text))
+    for lang, entries in by_lang.items():
+        indices, texts = zip(*entries)
+        for i, ps in zip(indices, frontend.g2p_batch(list(texts), lang)):
+            results[i] = ps
+    return results
+
+def _worker_main(slot, inbox, outbox, library, data_path):
+    # Runs in a spawned process with its own espeak library and phonemizer registry
+    EspeakWrapper.set_library(library)
+    EspeakWrapper.data_path = data_path
+    # Only the text front-end: importing kokoro would load torch into every worker
+    import frontend
+    while True:
+        job = inbox.get()
+        if job is None:
+            return
+        request_id, items, norm = job
+        start = time.perf_counter()
+        try:
+            result, error = _phonemize_items(frontend, items, norm), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        outbox.put((slot, request_id, result, error, time.perf_counter() - start))
+
+class _Worker:
+    def __init__(self, process, inbox):
+        self.process = process
+        self.inbox = inbox
+        self.pending = {}  # request_id -> (items, norm, future, attempts)
+        self.requests = 0
+        self.texts = 0
+        self.busy_seconds = 0.0
+        self.restarts = 0
+
+class PhonemizerPool:
+    """Pool of worker processes that each own their espeak phonemizers.
+
+    espeak is single-threaded and cannot be shared across threads, so a single process
+    serializes the text front-end of a multi-threaded server. Each request (a batch of
+    (text, lang) pairs) is routed as a whole to the worker with the fewest outstanding
+    requests. Workers that die are respawned and their outstanding requests are retried
+    once on the new process.
+
+    Args:
+        processes: Number of worker processes (default: number of CPUs)
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count() or 1
+        # Workers reuse the espeak library configured in this process by setup_espeak()
+        self._espeak = (str(EspeakWrapper.library()), EspeakWrapper.data_path)
+        self._context = multiprocessing.get_context('spawn')
+        self._outbox = self._context.Queue()
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._closing = False
+        self._workers = [self._spawn(slot) for slot in range(self.processes)]
+        self._monitor = threading.Thread(target=self._run, name='kokoro-phonemizer-pool', daemon=True)
+        self._monitor.start()
+
+    def submit(self, items, norm=True):
+        """Queue a batch of texts for phonemization.
+
+        Args:
+            items: List of (text, lang) pairs
+            norm: Whether to normalize each text before phonemizing it
+
+        Returns:
+            Future resolving to the list of phoneme strings, in the order of items
+        """
+        future = Future()
+        items = list(items)
+        if not items:
+            future.set_result([])
+            return future
+        with self._lock:
+            if self._closing:
+                raise RuntimeError("PhonemizerPool is closed")
+            slot = min(range(len(self._workers)), key=lambda i: len(self._workers[i].pending))
+            self._send(slot, next(self._request_ids), items, norm, future, 1)
+        return future
+
+    def phonemize(self, items, norm=True, timeout=None):
+        """Phonemize a batch of (text, lang) pairs and wait for the result."""
+        return self.submit(items, norm).result(timeout)
+
+    def stats(self):
+        """Return per-worker request counts, throughput and restarts."""
+        with self._lock:
+            return [{
+                'pid': worker.process.pid,
+                'pending': len(worker.pending),
+                'requests': worker.requests,
+                'texts': worker.texts,
+                'busy_seconds': worker.busy_seconds,
+                'texts_per_second': worker.texts / worker.busy_seconds if worker.busy_seconds else 0.0,
+                'restarts': worker.restarts,
+            } for worker in self._workers]
+
+    def close(self):
+        """Stop the workers once the requests already queued are done."""
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+            for worker in self._workers:
+                worker.inbox.put(None)
+        self._monitor.join()
+        for worker in self._workers:
+            worker.process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _spawn(self, slot):
+        inbox = self._context.Queue()
+        process = self._context.Process(target=_worker_main, args=(slot, inbox, self._outbox, *self._espeak),
+                                        name=f'kokoro-phonemizer-{slot}', daemon=True)
+        process.start()
+        return _Worker(process, inbox)
+
+    def _send(self, slot, request_id, items, norm, future, attempts):
+        worker = self._workers[slot]
+        worker.pending[request_id] = (items, norm, future, attempts)
+        worker.inbox.put((request_id, items, norm))
+
+    def _run(self):
+        while True:
+            # Liveness is sampled before draining the outbox, so that everything a dead
+            # worker sent before exiting has been collected by the time it is handled
+            with self._lock:
+                dead = [slot for slot, worker in enumerate(self._workers) if not worker.process.is_alive()]
+            timeout = 0.5
+            while True:
+                try:
+                    message = self._outbox.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                self._complete(*message)
+                timeout = 0
+            with self._lock:
+                self._check_workers(dead)
+                if self._closing and not any(w.pending or w.process.is_alive() for w in self._workers):
+                    return
+
+    def _complete(self, slot, request_id, result, error, seconds):
+        with self._lock:
+            worker = self._workers[slot]
+            request = worker.pending.pop(request_id, None)
+            if request is None:
+                return  # already failed or retried after a crash
+            worker.requests += 1
+            worker.texts += len(request[0])
+            worker.busy_seconds += seconds
+        if error is None:
+            request[2].set_result(result)
+        else:
+            request[2].set_exception(RuntimeError(f"Phonemization failed: {error}"))
+
+    def _check_workers(self, dead):
+        # Called with the lock held: respawn dead workers and retry what they had queued
+        for slot in dead:
+            worker = self._workers[slot]
+            if self._closing and not worker.pending:
+                continue
+            print(f"Phonemizer worker {worker.process.pid} exited with code {worker.process.exitcode}")
+            pending = worker.pending
+            if self._closing:
+                for items, norm, future, attempts in pending.values():
+                    future.set_exception(RuntimeError("Phonemizer worker exited while closing"))
+                worker.pending = {}
+                continue
+            replacement = self._spawn(slot)
+            replacement.requests, replacement.texts = worker.requests, worker.texts
+            replacement.busy_seconds, replacement.restarts = worker.busy_seconds, worker.restarts + 1
+            self._workers[slot] = replacement
+            for request_id, (items, norm, future, attempts) in pending.items():
+                if attempts >= MAX_ATTEMPTS:
+                    future.set_exception(RuntimeError(f"Phonemizer worker crashed {attempts} times on this request"))
+                else:
+                    self._send(slot, request_id, items, norm, future, attempts + 1)
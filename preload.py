@@ -0,0 +1,100 @@
+import threading
+import time
+import traceback
+
+__all__ = ['EnginePreloader']
+
+WARMUP_LENGTHS = (16, 64, 128, 256, 510)  # Token-length buckets synthesized once before serving
+
+class EnginePreloader:
+    """Builds the engine on a background thread and warms it up before the first request.
+
+    Warmup synthesizes one utterance per token-length bucket, so that the first real
+    requests do not pay for allocator growth, kernel selection or phonemizer creation.
+    Requests call wait(): those arriving before the engine is ready queue behind the
+    single build instead of each starting one.
+
+    The state is one of 'idle', 'loading', 'warming', 'ready' or 'failed'.
+
+    Args:
+        factory: Callable returning a new KokoroEngine
+        warmup_lengths: Token lengths to synthesize once the engine is built (empty to skip)
+        warmup_voice: Voice used for warmup
+    """
+
+    def __init__(self, factory, warmup_lengths=WARMUP_LENGTHS, warmup_voice='af_bella'):
+        self.factory = factory
+        self.warmup_lengths = tuple(warmup_lengths)
+        self.warmup_voice = warmup_voice
+        self.engine = None
+        self.state = 'idle'
+        self.error = None
+        self._warmup_seconds = {}
+        self._started = None
+        self._finished = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def start(self):
+        """Start the build in the background; does nothing if it has already started."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = 'loading'
+            self._started = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name='kokoro-preload', daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        """Return the engine once it is ready, starting the build if needed.
+
+        Returns:
+            The engine, or None if it is still not ready after timeout seconds
+
+        Raises:
+            RuntimeError: If the build or the warmup failed
+        """
+        self.start()
+        if not self._done.wait(timeout):
+            return None
+        if self.state == 'failed':
+            raise RuntimeError(f"Model failed to load: {self.error}")
+        return self.engine
+
+    def status(self):
+        """Return the state, seconds spent loading so far, warmup timings and the error if any."""
+        with self._lock:
+            end = self._finished or time.perf_counter()
+            return {
+                'state': self.state,
+                'seconds': end - self._started if self._started is not None else 0.0,
+                'warmup_seconds': dict(self._warmup_seconds),
+                'error': self.error,
+            }
+
+    def _run(self):
+        try:
+            engine = self.factory()
+            with self._lock:
+                self.state = 'warming'
+            for length in self.warmup_lengths:
+                seconds = engine.warmup([length], self.warmup_voice)
+                with self._lock:
+                    self._warmup_seconds.update(seconds)
+            with self._lock:
+                self.engine = engine
+                self.state = 'ready'
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                self.error = f"{type(e).__name__}: {e}"
+                self.state = 'failed'
+        with self._lock:
+            self._finished = time.perf_counter()
+        print(f"Engine {self.state} after {self._finished - self._started:.1f}s")
+        self._done.set()
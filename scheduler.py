@@ -0,0 +1,168 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import torch
+
+__all__ = ['BatchScheduler']
+
+MAX_TOKENS = 510  # Longest token sequence the model accepts in one forward pass
+
+class BatchScheduler:
+    """Dynamic micro-batching scheduler for concurrent synthesis requests.
+
+    Requests arriving within a short window are grouped into token-length buckets,
+    so that padding waste stays bounded, and each bucket is synthesized with one
+    batched forward pass on a single worker thread. Results are routed back to
+    per-request futures.
+
+    Args:
+        engine: KokoroEngine that owns the model, the kokoro module and the voices
+        max_wait_ms: How long to wait for more requests after the first one arrives
+        max_batch_size: Maximum number of requests synthesized in one forward pass
+        bucket_width: Width of a token-length bucket, in tokens
+        phonemizer_pool: Optional PhonemizerPool; without one, requests take turns on the
+            phonemizers of this process
+    """
+
+    def __init__(self, engine, max_wait_ms=10, max_batch_size=8, bucket_width=64, phonemizer_pool=None):
+        self.engine = engine
+        self.phonemizer_pool = phonemizer_pool
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.bucket_width = bucket_width
+        self._queue = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()  # Nothing is queued behind the stop marker
+        self._phonemize_lock = threading.Lock()  # espeak is not safe to share across threads
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._padded_tokens = 0
+        self._total_tokens = 0
+        self._worker = threading.Thread(target=self._run, name='kokoro-batch-scheduler', daemon=True)
+        self._worker.start()
+
+    def submit(self, tokens, ref_s, speed=1):
+        """Queue one token sequence for synthesis.
+
+        Args:
+            tokens: Token ids, at most 510 of them
+            ref_s: Style vector for this sequence, shape (1, 256)
+            speed: Speaking rate multiplier
+
+        Returns:
+            Future resolving to the waveform as a NumPy array
+
+        Raises:
+            RuntimeError: If the scheduler is closed
+        """
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError('BatchScheduler is closed')
+            self._queue.put((tokens, ref_s, speed, future))
+        return future
+
+    def synthesize(self, text, voice='af_bella', lang='a', speed=1):
+        """Phonemize text, synthesize it as part of a batch and wait for the result.
+
+        Args:
+            text: Text to synthesize
+            voice: Voice name or an already loaded voicepack tensor
+            lang: Language code ('a' for American English, 'b' for British English)
+            speed: Speaking rate multiplier
+
+        Returns:
+            Tuple of (audio, phonemes), or (None, None) if the text has no phonemes
+        """
+        kokoro = self.engine.kokoro
+        voicepack = self.engine.load_voice(voice) if isinstance(voice, str) else voice
+        ps = self._phonemize(text, lang)
+        tokens = kokoro.tokenize(ps)
+        if not len(tokens):
+            return None, None
+        if len(tokens) > MAX_TOKENS:
+            tokens = tokens[:MAX_TOKENS]
+            ps = ps[:MAX_TOKENS]  # phonemize() only keeps vocabulary symbols, one token each
+            print(f'Truncated to {MAX_TOKENS} tokens')
+        audio = self.submit(tokens, voicepack[len(tokens)], speed).result()
+        return audio, ps
+
+    def stats(self):
+        """Return queue depth, batch-size histogram and padding ratio.
+
+        The padding ratio is the share of padded token slots over every batch so far.
+        """
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batch_sizes': dict(sorted(self._batch_sizes.items())),
+                'padding_ratio': self._padded_tokens / self._total_tokens if self._total_tokens else 0.0,
+            }
+
+    def close(self):
+        """Stop the worker thread once the requests already queued are done.
+
+        Later submissions raise RuntimeError instead of waiting for a worker that is gone.
+        """
+        with self._close_lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._worker.join()
+
+    def _phonemize(self, text, lang):
+        kokoro = self.engine.kokoro
+        if self.phonemizer_pool is None:
+            with self._phonemize_lock:
+                return kokoro.phonemize(text, lang)
+        text = kokoro.normalize_text(text)
+        ps = kokoro.phoneme_cache.get(text, lang)
+        if ps is None:
+            ps = self.phonemizer_pool.phonemize([(text, lang)], norm=False)[0]
+            kokoro.phoneme_cache.put(text, lang, ps)
+        return ps
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            pending = [request]
+            deadline = time.monotonic() + self.max_wait
+            while len(pending) < self.max_batch_size:
+                try:
+                    request = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._dispatch(pending)
+                    return
+                pending.append(request)
+            self._dispatch(pending)
+
+    def _dispatch(self, pending):
+        buckets = {}
+        for request in pending:
+            buckets.setdefault(len(request[0]) // self.bucket_width, []).append(request)
+        for bucket in buckets.values():
+            self._forward(bucket)
+
+    def _forward(self, batch):
+        tokens_list, refs, speeds, futures = zip(*batch)
+        try:
+            audios = self.engine.kokoro.forward_batch(self.engine.model, list(tokens_list), torch.cat(refs), list(speeds))
+        except Exception as e:
+            print(f"Error in batched synthesis: {e}")
+            for future in futures:
+                future.set_exception(e)
+            return
+        lengths = [len(tokens) for tokens in tokens_list]
+        with self._stats_lock:
+            self._batch_sizes[len(batch)] += 1
+            self._padded_tokens += max(lengths) * len(lengths) - sum(lengths)
+            self._total_tokens += max(lengths) * len(lengths)
+        for future, audio in zip(futures, audios):
+            future.set_result(audio)
@@ -0,0 +1,342 @@
+import argparse
+import json
+import queue
+import struct
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import torch
+
+from models import SAMPLE_RATE, KokoroEngine
+from preload import EnginePreloader
+from websocket_protocol import WebSocket, WebSocketClosed, accept_key
+
+__all__ = ['SynthesisServer', 'pcm16', 'wav_header']
+
+MAX_BODY_BYTES = 1 << 20
+MAX_TEXT_LENGTH = 100_000
+SPEED_RANGE = (0.5, 2.0)
+
+def wav_header(sample_rate=SAMPLE_RATE, data_size=None):
+    """RIFF header of a mono 16-bit PCM WAV file.
+
+    Without data_size, the sizes are set to their maximum, as usual for a stream whose length
+    is not known when the header is sent; players read such a file up to its end.
+    """
+    if data_size is None:
+        data_size = 0xFFFFFFFF - 36
+    return (b'RIFF' + struct.pack('<I', 36 + data_size) + b'WAVE'
+            + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+            + b'data' + struct.pack('<I', data_size))
+
+def pcm16(audio):
+    """Little-endian 16-bit PCM bytes of a float waveform in [-1, 1]."""
+    return (np.clip(audio, -1, 1) * 32767).astype('<i2').tobytes()
+
+FLUSH = object()  # Marks a flush in the queue of WebSocket segments
+
+class RequestError(Exception):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class SynthesisServer(ThreadingHTTPServer):
+    """HTTP synthesis service streaming audio with chunked transfer encoding.
+
+    Endpoints:
+        GET /health: engine readiness, as reported by EnginePreloader.status()
+        GET /voices: available voice names
+        POST /synthesize: JSON {"text", "voice", "lang", "speed", "format"}, format being
+            "wav" (a streaming WAV header, then PCM) or "pcm" (raw 16-bit little-endian PCM
+            at 24 kHz). Audio is sent sentence by sentence as soon as it is synthesized.
+        GET /stream?voice=&lang=&speed=: WebSocket for text that arrives incrementally, such
+            as the tokens of a language model. The client sends JSON messages
+            {"type": "text", "text": fragment}, {"type": "flush"} (synthesize everything
+            received so far) and {"type": "end"} (flush, then close). Text is cut into
+            clauses by kokoro.ClauseSegmenter and each one is synthesized as soon as it is
+            complete, while more text arrives. The server sends {"type": "start"} with the
+            sample rate, binary messages of 16-bit PCM, {"type": "segment"} before the audio
+            of each clause, {"type": "flushed"} once a flush is done, then {"type": "done"}.
+            A clause that finds no free slot within queue_timeout is skipped with
+            {"type": "error", "text": clause}.
+
+    Args:
+        address: (host, port) to listen on
+        preloader: EnginePreloader providing the engine; it is started here
+        max_concurrent: Requests synthesized at once; the others wait for a free slot
+        queue_timeout: Seconds a request waits for the engine or for a slot before a 503
+        request_timeout: Seconds a synthesis may stream before it is cut off
+        socket_timeout: Seconds a connection may block on a read or write; a WebSocket whose
+            client sends nothing for that long is closed
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, preloader, max_concurrent=2, queue_timeout=30, request_timeout=300,
+                 socket_timeout=30):
+        super().__init__(address, SynthesisHandler)
+        self.preloader = preloader
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.socket_timeout = socket_timeout
+        preloader.start()
+
+class SynthesisHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # chunked transfer encoding and keep-alive
+
+    def setup(self):
+        self.timeout = self.server.socket_timeout
+        super().setup()
+
+    def do_GET(self):
+        try:
+            if urlsplit(self.path).path == '/stream':
+                self._serve_websocket()
+            elif self.path == '/health':
+                status = self.server.preloader.status()
+                self._send_json(HTTPStatus.OK if status['state'] == 'ready' else HTTPStatus.SERVICE_UNAVAILABLE, status)
+            elif self.path == '/voices':
+                self._send_json(HTTPStatus.OK, {'voices': self._engine().list_voices()})
+            else:
+                raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown path {self.path}")
+        except RequestError as e:
+            self._send_error(e)
+
+    def do_POST(self):
+        if self.path != '/synthesize':
+            self._send_error(RequestError(HTTPStatus.NOT_FOUND, f"Unknown path {self.path}"))
+            return
+        try:
+            request = self._read_request()
+            engine = self._engine()
+            if request['voice'] not in engine.voices:
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"Voice '{request['voice']}' not found")
+            if not self.server.slots.acquire(timeout=self.server.queue_timeout):
+                raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many concurrent requests", retry_after=1)
+        except RequestError as e:
+            self._send_error(e)
+            return
+        try:
+            self._stream(engine, request)
+        finally:
+            self.server.slots.release()
+
+    def _read_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True  # the body is left unread
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Request body over {MAX_BODY_BYTES} bytes")
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"Invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Expected a JSON object")
+        request = self._validate(body)
+        if not isinstance(request['text'], str) or not request['text'].strip():
+            raise RequestError(HTTPStatus.BAD_REQUEST, "text is required")
+        if len(request['text']) > MAX_TEXT_LENGTH:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"text is longer than {MAX_TEXT_LENGTH} characters")
+        if request['format'] not in ('wav', 'pcm'):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "format must be 'wav' or 'pcm'")
+        return request
+
+    def _validate(self, body):
+        request = {
+            'text': body.get('text'),
+            'voice': body.get('voice', 'af_bella'),
+            'lang': body.get('lang', 'a'),
+            'speed': body.get('speed', 1),
+            'format': body.get('format', 'wav'),
+        }
+        if request['lang'] not in ('a', 'b'):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "lang must be 'a' (American) or 'b' (British English)")
+        if not isinstance(request['speed'], (int, float)) or not SPEED_RANGE[0] <= request['speed'] <= SPEED_RANGE[1]:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"speed must be between {SPEED_RANGE[0]} and {SPEED_RANGE[1]}")
+        return request
+
+    def _serve_websocket(self):
+        if self.headers.get('Upgrade', '').lower() != 'websocket' or not self.headers.get('Sec-WebSocket-Key'):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Expected a WebSocket upgrade")
+        params = dict(parse_qsl(urlsplit(self.path).query))
+        try:
+            params['speed'] = float(params.get('speed', 1))
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "speed must be a number")
+        request = self._validate(params)
+        engine = self._engine()
+        if request['voice'] not in engine.voices:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"Voice '{request['voice']}' not found")
+        self.send_response(HTTPStatus.SWITCHING_PROTOCOLS)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept_key(self.headers['Sec-WebSocket-Key']))
+        self.end_headers()
+        self.close_connection = True
+        websocket = WebSocket(self.rfile, self.wfile)
+        segments = queue.Queue()
+        cancelled = threading.Event()
+        synthesizer = threading.Thread(target=self._synthesize_segments,
+                                       args=(engine, request, websocket, segments, cancelled), daemon=True)
+        synthesizer.start()
+        segmenter = engine.kokoro.ClauseSegmenter()
+        try:
+            websocket.send_text(json.dumps({'type': 'start', 'sample_rate': SAMPLE_RATE, 'format': 'pcm_s16le'}))
+            while True:
+                try:
+                    message = json.loads(websocket.receive())
+                    kind = message['type']
+                except (ValueError, TypeError, KeyError):
+                    websocket.send_text(json.dumps({'type': 'error', 'error': 'expected a JSON message with a type'}))
+                    continue
+                if kind == 'text' and isinstance(message.get('text'), str):
+                    for segment in segmenter.feed(message['text']):
+                        segments.put(segment)
+                elif kind in ('flush', 'end'):
+                    for segment in segmenter.flush():
+                        segments.put(segment)
+                    segments.put(FLUSH if kind == 'flush' else None)
+                    if kind == 'end':
+                        break
+                else:
+                    websocket.send_text(json.dumps({'type': 'error', 'error': f"unknown message {kind!r}"}))
+        except WebSocketClosed:
+            cancelled.set()  # the client is gone: drop what is left
+            segments.put(None)
+        synthesizer.join()
+        websocket.close()
+
+    def _synthesize_segments(self, engine, request, websocket, segments, cancelled):
+        # Runs on its own thread, so that audio streams back while the client is still sending text
+        try:
+            for segment in iter(segments.get, None):
+                if cancelled.is_set():
+                    return
+                if segment is FLUSH:
+                    websocket.send_text(json.dumps({'type': 'flushed'}))
+                    continue
+                websocket.send_text(json.dumps({'type': 'segment', 'text': segment}))
+                if not self.server.slots.acquire(timeout=self.server.queue_timeout):
+                    # Like the 503 of an HTTP request: the client can send the text again later
+                    websocket.send_text(json.dumps({'type': 'error', 'error': "Too many concurrent requests",
+                                                    'text': segment}))
+                    continue
+                try:
+                    deadline = time.perf_counter() + self.server.request_timeout
+                    for audio, _ in engine.stream(segment, request['voice'], request['lang'], request['speed']):
+                        if cancelled.is_set():
+                            return
+                        websocket.send_binary(pcm16(audio))
+                        if time.perf_counter() > deadline:
+                            self.log_error("Segment cut off after %.0fs (request timeout)", self.server.request_timeout)
+                            break
+                finally:
+                    self.server.slots.release()
+            websocket.send_text(json.dumps({'type': 'done'}))
+        except WebSocketClosed:
+            cancelled.set()
+        except Exception as e:
+            self.log_error("Synthesis failed: %s", e)
+            cancelled.set()
+            try:
+                websocket.send_text(json.dumps({'type': 'error', 'error': str(e)}))
+            except WebSocketClosed:
+                pass
+            websocket.close(1011)
+
+    def _engine(self):
+        try:
+            engine = self.server.preloader.wait(timeout=self.server.queue_timeout)
+        except RuntimeError as e:
+            raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+        if engine is None:
+            raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, "Model is still loading", retry_after=5)
+        return engine
+
+    def _stream(self, engine, request):
+        # Headers go out right away; once they are sent an error can only cut the stream short,
+        # which clients see as a missing final chunk
+        start = time.perf_counter()
+        deadline = start + self.server.request_timeout
+        self.send_response(HTTPStatus.OK)
+        if request['format'] == 'wav':
+            self.send_header('Content-Type', 'audio/wav')
+        else:
+            self.send_header('Content-Type', f'audio/L16; rate={SAMPLE_RATE}; channels=1')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('X-Sample-Rate', str(SAMPLE_RATE))
+        self.end_headers()
+        chunks = engine.stream(request['text'], request['voice'], request['lang'], request['speed'])
+        first = None
+        try:
+            if request['format'] == 'wav':
+                self._write_chunk(wav_header())
+            for audio, _ in chunks:
+                self._write_chunk(pcm16(audio))
+                if first is None:
+                    first = time.perf_counter() - start
+                if time.perf_counter() > deadline:
+                    self.log_error("Synthesis cut off after %.0fs (request timeout)", self.server.request_timeout)
+                    self.close_connection = True
+                    return
+            self._write_chunk(b'')
+            self.log_message("Streamed %r: first audio %.0f ms, total %.0f ms", request['text'][:40],
+                             (first or 0) * 1000, (time.perf_counter() - start) * 1000)
+        except (BrokenPipeError, ConnectionResetError, TimeoutError):
+            self.close_connection = True  # client went away or stopped reading
+        except Exception as e:
+            self.log_error("Synthesis failed: %s", e)
+            self.close_connection = True
+        finally:
+            chunks.close()
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, error):
+        headers = [('Retry-After', str(error.retry_after))] if error.retry_after else []
+        self._send_json(error.status, {'error': str(error)}, headers)
+
+def main():
+    parser = argparse.ArgumentParser(description='Kokoro TTS streaming HTTP server')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8880, help='Port to listen on (default: 8880)')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help='Device to run on (default: cuda if available)')
+    parser.add_argument('--max-concurrent', type=int, default=2, help='Requests synthesized at once (default: 2)')
+    parser.add_argument('--queue-timeout', type=float, default=30,
+                        help='Seconds a request may wait for the model or a free slot (default: 30)')
+    parser.add_argument('--request-timeout', type=float, default=300,
+                        help='Seconds a synthesis may stream before it is cut off (default: 300)')
+    args = parser.parse_args()
+
+    preloader = EnginePreloader(lambda: KokoroEngine("kokoro-v0_19.pth", args.device))
+    server = SynthesisServer((args.host, args.port), preloader, max_concurrent=args.max_concurrent,
+                             queue_timeout=args.queue_timeout, request_timeout=args.request_timeout)
+    print(f"Serving on http://{args.host}:{args.port} (POST /synthesize, GET /health, GET /voices)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""ArtifactResolver manifest handling, with a stand-in for the hub."""
+import json
+import os
+
+import pytest
+
+import artifacts
+from artifacts import MANIFEST_FILENAME, ArtifactResolver
+
+REPO_ID = 'org/model'
+
+class FakeHub:
+    # Files of the remote repository; downloads land in cache_dir/<filename>
+    def __init__(self, files):
+        self.files = files
+        self.calls = []
+
+    def download(self, repo_id, filename, cache_dir, local_files_only=False):
+        self.calls.append((filename, local_files_only))
+        path = os.path.join(cache_dir, filename)
+        if not os.path.exists(path):
+            if local_files_only or filename not in self.files:
+                raise FileNotFoundError(filename)
+            with open(path, 'wb') as f:
+                f.write(self.files[filename])
+        return path
+
+@pytest.fixture
+def hub(monkeypatch):
+    hub = FakeHub({'config.json': b'{"n_token": 178}', 'model.pth': b'weights'})
+    monkeypatch.setattr(artifacts, 'hf_hub_download', hub.download)
+    return hub
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path)
+
+def test_resolved_files_are_served_from_the_manifest(hub, cache_dir):
+    resolver = ArtifactResolver(REPO_ID, cache_dir, offline=False)
+    path = resolver.resolve('config.json')
+    assert open(path, 'rb').read() == b'{"n_token": 178}'
+    assert resolver.network_calls == 1
+    entry = resolver.entries()['config.json']
+    assert entry['sha256'] == artifacts.file_sha256(path) and entry['size'] == os.path.getsize(path)
+    hub.calls.clear()
+    # A new resolver (a new process) reads the manifest and never calls the hub
+    reopened = ArtifactResolver(REPO_ID, cache_dir, offline=True)
+    assert reopened.resolve('config.json') == path
+    assert hub.calls == [] and reopened.network_calls == 0
+
+def test_files_already_in_the_hub_cache_need_no_network(hub, cache_dir):
+    with open(os.path.join(cache_dir, 'model.pth'), 'wb') as f:
+        f.write(b'weights')
+    resolver = ArtifactResolver(REPO_ID, cache_dir, offline=True)
+    assert resolver.resolve('model.pth') == os.path.join(cache_dir, 'model.pth')
+    assert hub.calls == [('model.pth', True)]
+
+def test_offline_resolver_reports_missing_files(hub, cache_dir):
+    with pytest.raises(FileNotFoundError, match='hub is disabled'):
+        ArtifactResolver(REPO_ID, cache_dir, offline=True).resolve('config.json')
+
+def test_deleted_file_is_fetched_again(hub, cache_dir):
+    resolver = ArtifactResolver(REPO_ID, cache_dir, offline=False)
+    os.remove(resolver.resolve('model.pth'))
+    assert open(resolver.resolve('model.pth'), 'rb').read() == b'weights'
+    assert resolver.network_calls == 2
+
+def test_same_content_with_a_new_mtime_is_kept(hub, cache_dir):
+    resolver = ArtifactResolver(REPO_ID, cache_dir, offline=False)
+    path = resolver.resolve('model.pth')
+    mtime = os.stat(path).st_mtime_ns + 10**9
+    os.utime(path, ns=(mtime, mtime))
+    hub.calls.clear()
+    reopened = ArtifactResolver(REPO_ID, cache_dir, offline=True)
+    assert reopened.resolve('model.pth') == path
+    assert hub.calls == []
+    assert ArtifactResolver(REPO_ID, cache_dir).entries()['model.pth']['mtime_ns'] == mtime
+
+def test_verify_all_detects_modified_files(hub, cache_dir):
+    resolver = ArtifactResolver(REPO_ID, cache_dir, offline=False)
+    resolver.resolve('config.json')
+    path = resolver.resolve('model.pth')
+    with open(path, 'wb') as f:
+        f.write(b'WEIGHTS')
+    assert resolver.verify_all() == {'config.json': True, 'model.pth': False}
+
+def test_manifest_of_another_repository_is_ignored(hub, cache_dir):
+    ArtifactResolver(REPO_ID, cache_dir, offline=False).resolve('config.json')
+    with open(os.path.join(cache_dir, MANIFEST_FILENAME)) as f:
+        assert json.load(f)['repo_id'] == REPO_ID
+    assert ArtifactResolver('org/other', cache_dir).entries() == {}
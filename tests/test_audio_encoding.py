@@ -0,0 +1,63 @@
+"""In-memory audio encoding, decoded back with soundfile."""
+import io
+import shutil
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import audio_encoding
+from audio_encoding import available_formats, encode_audio, mime_type, register_encoder
+from models import SAMPLE_RATE
+
+PCM16_STEP = 1 / 32767
+
+@pytest.fixture
+def audio():
+    t = np.arange(SAMPLE_RATE // 2) / SAMPLE_RATE
+    return (0.5 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+def decode(data):
+    decoded, sample_rate = sf.read(io.BytesIO(data), dtype='float32')
+    return decoded, sample_rate
+
+@pytest.mark.parametrize('format', ['wav', 'flac'])
+def test_lossless_formats_round_trip(audio, format):
+    decoded, sample_rate = decode(encode_audio(audio, SAMPLE_RATE, format))
+    assert sample_rate == SAMPLE_RATE
+    np.testing.assert_allclose(decoded, audio, rtol=0, atol=PCM16_STEP)
+
+def test_wav_is_16_bit_pcm(audio):
+    info = sf.info(io.BytesIO(encode_audio(audio, SAMPLE_RATE, 'wav')))
+    assert (info.format, info.subtype, info.channels) == ('WAV', 'PCM_16', 1)
+    assert mime_type('wav') == 'audio/wav'
+
+@pytest.mark.parametrize('format', [f for f in ['ogg', 'mp3'] if f in available_formats()])
+def test_lossy_formats_decode_at_the_sample_rate(audio, format):
+    data = encode_audio(audio, SAMPLE_RATE, format)
+    try:
+        decoded, sample_rate = decode(data)
+    except sf.LibsndfileError:
+        pytest.skip(f'this libsndfile cannot decode {format}')
+    assert sample_rate == SAMPLE_RATE
+    # Encoders may pad the end with up to a frame of silence
+    assert len(audio) <= len(decoded) < len(audio) + 4096
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg is not installed')
+def test_ffmpeg_encoder_clips_and_converts_to_16_bit(audio):
+    encode = audio_encoding._ffmpeg_encoder(shutil.which('ffmpeg'), ['-f', 'wav'])
+    decoded, sample_rate = decode(encode(np.concatenate([audio, [2.0, -2.0]]), SAMPLE_RATE))
+    assert sample_rate == SAMPLE_RATE
+    np.testing.assert_allclose(decoded[:len(audio)], audio, rtol=0, atol=PCM16_STEP)
+    np.testing.assert_allclose(decoded[-2:], [1, -1], atol=PCM16_STEP)
+
+def test_unknown_format_is_rejected(audio):
+    with pytest.raises(ValueError, match="Unsupported audio format 'xyz'"):
+        encode_audio(audio, SAMPLE_RATE, 'xyz')
+
+def test_registered_encoder_is_used(audio, monkeypatch):
+    monkeypatch.setattr(audio_encoding, '_encoders', dict(audio_encoding._encoders))
+    register_encoder('pcm', lambda audio, sample_rate: (audio * 32767).astype('<i2').tobytes(), 'audio/L16')
+    assert available_formats()[-1] == 'pcm' and mime_type('pcm') == 'audio/L16'
+    pcm = np.frombuffer(encode_audio(audio, SAMPLE_RATE, 'pcm'), dtype='<i2')
+    np.testing.assert_allclose(pcm / 32767, audio, rtol=0, atol=PCM16_STEP)
@@ -0,0 +1,122 @@
+"""Batch file reading and run_batch resume, skip and error handling, with a stand-in for the model."""
+import json
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+import tts_demo
+from tts_demo import MANIFEST_FILE, read_batch, run_batch
+
+SILENT = '#'  # Character the fake phonemizer has no phonemes for
+
+class FakeEngine:
+    # Each character is one token and each token one sample; only the voices given exist
+    def __init__(self, voices=('af_bella',)):
+        self.model = None
+        self.voices = voices
+        self.synthesized = []
+        self.kokoro = SimpleNamespace(
+            phonemize_batch=lambda texts, lang: [text.replace(SILENT, '') for text in texts],
+            tokenize=lambda ps: [ord(c) for c in ps],
+            forward_batch=self.forward_batch)
+
+    def forward_batch(self, model, tokens_list, ref_s, speed):
+        self.synthesized += [''.join(map(chr, tokens)) for tokens in tokens_list]
+        return [np.full(len(tokens), 0.5, np.float32) for tokens in tokens_list]
+
+    def load_voice(self, name):
+        if name not in self.voices:
+            raise ValueError(f"Voice {name} not found")
+        return torch.zeros(511, 1, 256)
+
+def items(*texts):
+    return [{'id': f'item{i}', 'text': text, 'voice': 'af_bella', 'speed': 1.0, 'lang': 'a'}
+            for i, text in enumerate(texts)]
+
+def manifest(output_dir):
+    with open(output_dir / MANIFEST_FILE, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_read_batch_formats(tmp_path):
+    (tmp_path / 'items.jsonl').write_text('{"id": "a", "text": " Hi. ", "speed": 1.5}\n\n{"text": "Two."}\n')
+    (tmp_path / 'items.csv').write_text('id,text,voice\na,Hi.,bf_emma\n,Two.,\n')
+    (tmp_path / 'texts').mkdir()
+    (tmp_path / 'texts' / 'b.txt').write_text('Two.')
+    (tmp_path / 'texts' / 'a.txt').write_text('Hi.')
+    jsonl = read_batch(tmp_path / 'items.jsonl', 'af_bella', 'a')
+    assert [(i['id'], i['text'], i['speed'], i['voice']) for i in jsonl] == [
+        ('a', 'Hi.', 1.5, 'af_bella'), ('2', 'Two.', 1.0, 'af_bella')]
+    csv = read_batch(tmp_path / 'items.csv', 'af_bella', 'b')
+    assert [(i['id'], i['voice'], i['lang']) for i in csv] == [('a', 'bf_emma', 'b'), ('2', 'af_bella', 'b')]
+    assert [(i['id'], i['text']) for i in read_batch(tmp_path / 'texts', 'af_bella', 'a')] == [
+        ('a', 'Hi.'), ('b', 'Two.')]
+
+@pytest.mark.parametrize('content, error', [
+    ('{"id": "a", "text": "Hi."}\n{"id": "a", "text": "Again."}\n', 'Duplicate id a'),
+    ('{"id": "a", "text": "  "}\n', 'Item a .* has no text'),
+    ('{"id": "a", "text": "Hi.", "speed": "fast"}\n', 'could not convert'),
+    ('{"id": "a", \n', 'Expecting'),
+    ('\n', 'No items'),
+])
+def test_read_batch_rejects_bad_files(tmp_path, content, error):
+    (tmp_path / 'items.jsonl').write_text(content)
+    with pytest.raises(ValueError, match=error):
+        read_batch(tmp_path / 'items.jsonl', 'af_bella', 'a')
+
+def test_bad_batch_fails_before_the_model_is_built(tmp_path, monkeypatch, capsys):
+    (tmp_path / 'items.jsonl').write_text('{"text": ""}\n')
+    def build(*args):
+        raise AssertionError('model built for a batch that cannot run')
+    monkeypatch.setattr(tts_demo, 'KokoroEngine', build)
+    monkeypatch.setattr(sys, 'argv', ['tts_demo.py', '--batch', str(tmp_path / 'items.jsonl')])
+    tts_demo.main()
+    assert 'Error reading batch: Item 1' in capsys.readouterr().out
+
+def test_items_are_written_with_a_manifest_line_each(tmp_path):
+    engine = FakeEngine()
+    run_batch(engine, items('A longer one.', 'Hi.'), tmp_path, 'wav', workers=2)
+    assert sorted(engine.synthesized) == ['A longer one.', 'Hi.']
+    results = {r['id']: r for r in manifest(tmp_path)}
+    assert [results[i]['status'] for i in ('item0', 'item1')] == ['ok', 'ok']
+    assert results['item1']['tokens'] == 3 and results['item1']['file'] == 'item1.wav'
+    assert results['item0']['duration_seconds'] == round(len('A longer one.') / tts_demo.SAMPLE_RATE, 3)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['item0.wav', 'item1.wav', MANIFEST_FILE]
+
+def test_resume_skips_items_already_done(tmp_path):
+    run_batch(FakeEngine(), items('One.', 'Two.'), tmp_path, 'wav', workers=1)
+    (tmp_path / 'item1.wav').unlink()  # recorded as done, but its file is gone
+    with open(tmp_path / MANIFEST_FILE, 'a', encoding='utf-8') as f:
+        f.write('{"id": "item2", "status": "o')  # cut short by an interruption
+    engine = FakeEngine()
+    run_batch(engine, items('One.', 'Two.', 'Three.'), tmp_path, 'wav', workers=1)
+    assert sorted(engine.synthesized) == ['Three.', 'Two.']
+    engine = FakeEngine()
+    run_batch(engine, items('One.', 'Two.', 'Three.'), tmp_path, 'wav', workers=1)
+    assert engine.synthesized == []
+
+def test_no_resume_synthesizes_everything_again(tmp_path):
+    run_batch(FakeEngine(), items('One.', 'Two.'), tmp_path, 'wav', workers=1)
+    engine = FakeEngine()
+    run_batch(engine, items('One.', 'Two.'), tmp_path, 'wav', workers=1, resume=False)
+    assert sorted(engine.synthesized) == ['One.', 'Two.']
+    assert len(manifest(tmp_path)) == 4
+
+def test_failed_items_are_recorded_and_retried_on_resume(tmp_path):
+    batch = items('Fine.', SILENT * 3, 'Other voice.')
+    batch[2]['voice'] = 'missing'
+    engine = FakeEngine()
+    run_batch(engine, batch, tmp_path, 'wav', workers=2)
+    assert engine.synthesized == ['Fine.']
+    results = {r['id']: r for r in manifest(tmp_path)}
+    assert results['item0']['status'] == 'ok'
+    assert (results['item1']['status'], results['item1']['error']) == ('error', 'ValueError: text has no phonemes')
+    assert results['item2']['error'] == 'ValueError: Voice missing not found'
+    assert not (tmp_path / 'item1.wav').exists() and not list(tmp_path.glob('.*.tmp'))
+
+    engine = FakeEngine(voices=('af_bella', 'missing'))
+    batch[1]['text'] = 'Spoken now.'
+    run_batch(engine, batch, tmp_path, 'wav', workers=2)
+    assert sorted(engine.synthesized) == ['Other voice.', 'Spoken now.']
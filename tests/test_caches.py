@@ -0,0 +1,18 @@
+"""Cache keys of the model caches in kokoro."""
+import gc
+import weakref
+
+import torch
+
+from benchmark import kokoro
+
+def test_cache_token_is_stable_per_module_and_never_reused():
+    module = torch.nn.Linear(2, 2)
+    token = kokoro.cache_token(module)
+    assert kokoro.cache_token(module) == token
+    freed = weakref.ref(module)
+    del module
+    gc.collect()
+    assert freed() is None, 'cache_token keeps the module alive'
+    # Unlike id(), a module created after the first one was freed never gets its token
+    assert kokoro.cache_token(torch.nn.Linear(2, 2)) != token
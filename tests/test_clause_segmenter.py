@@ -0,0 +1,44 @@
+"""ClauseSegmenter on text arriving in fragments."""
+import pytest
+
+from benchmark import kokoro
+
+def segment(fragments, **kwargs):
+    # Segments returned by each feed(), then by flush()
+    segmenter = kokoro.ClauseSegmenter(**kwargs)
+    return [segmenter.feed(f) for f in fragments], segmenter.flush()
+
+def test_sentence_ends_once_the_following_whitespace_arrives():
+    assert segment(['Hello there.', ' How', ' are you? I am fine']) == (
+        [[], ['Hello there.'], ['How are you?']], ['I am fine'])
+
+def test_decimal_point_split_across_fragments_does_not_end_a_sentence():
+    assert segment(['It costs 3.', '5 dollars. Next']) == ([[], ['It costs 3.5 dollars.']], ['Next'])
+
+@pytest.mark.parametrize('text', ['Dr. Smith met J. Doe. ', 'Mrs. Jones vs. Mr. Brown. ', 'St. Louis, Jr. said. '])
+def test_titles_and_initials_do_not_end_sentences(text):
+    assert segment([text]) == ([[text.strip()]], [])
+
+def test_line_break_ends_a_segment():
+    assert segment(['line one\n', 'line two']) == ([['line one'], []], ['line two'])
+
+def test_clause_boundary_ends_a_segment_past_min_chars():
+    text = 'This is a rather long clause that goes on, and a short one, then more'
+    assert segment([text], min_chars=40) == (
+        [['This is a rather long clause that goes on,']], ['and a short one, then more'])
+    assert segment(['Short, clause'], min_chars=40) == ([[]], ['Short, clause'])
+
+def test_text_without_boundaries_is_cut_at_a_space_before_max_chars():
+    (segments,), rest = segment(['word ' * 30], max_chars=50)
+    assert segments and all(len(s) <= 50 and set(s.split(' ')) == {'word'} for s in segments)
+    assert ' '.join(segments + rest) == ('word ' * 30).strip()
+
+def test_flush_returns_everything_buffered_and_empties_the_buffer():
+    segmenter = kokoro.ClauseSegmenter()
+    assert segmenter.feed('One. Two') == ['One.']
+    assert segmenter.flush() == ['Two']
+    assert segmenter.flush() == []
+    assert segmenter.feed('Three. ') == ['Three.']
+
+def test_whitespace_only_input_yields_nothing():
+    assert segment(['  ', '\n\n ']) == ([[], []], [])
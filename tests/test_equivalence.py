@@ -0,0 +1,36 @@
+"""Equivalence checks of optimized code paths against the implementations they replaced.
+
+The reference implementations live in benchmark.py, which times the same pairs.
+These checks need espeak (kokoro queries its version on import) but no model weights.
+"""
+import numpy as np
+import pytest
+import torch
+
+from benchmark import (DEFAULT_TOKEN_LENGTHS, dense_alignment, gather_alignment, kokoro, normalize_corpus,
+                       phonemize_corpus, reference_normalize_text)
+
+@pytest.mark.parametrize('n', DEFAULT_TOKEN_LENGTHS)
+def test_gather_alignment_matches_dense_alignment(n):
+    torch.manual_seed(n)
+    n += 2  # forward() pads every sequence with a boundary token on each side
+    d = torch.randn(1, n, 640)
+    t_en = torch.randn(1, 512, n)
+    pred_dur = torch.randint(1, 12, (n,))
+    for expected, actual in zip(dense_alignment(d, t_en, pred_dur), gather_alignment(d, t_en, pred_dur)):
+        assert torch.equal(expected, actual)
+
+@pytest.fixture(scope='module')
+def normalize_texts():
+    return normalize_corpus(5000, np.random.default_rng(0)) + phonemize_corpus(200)
+
+def test_normalizer_matches_sequential_rules(normalize_texts):
+    mismatches = [t for t in normalize_texts if kokoro.normalize_text(t) != reference_normalize_text(t)]
+    assert mismatches == [], f'{len(mismatches)} of {len(normalize_texts)} texts differ'
+
+def test_normalize_batch_matches_sequential_rules(normalize_texts):
+    assert kokoro.normalize_batch(normalize_texts) == [reference_normalize_text(t) for t in normalize_texts]
+
+def test_normalizer_stream_matches_sequential_rules(normalize_texts):
+    lines = '\n'.join(normalize_texts).split('\n')
+    assert list(kokoro.normalizer.stream(lines)) == [reference_normalize_text(l) for l in lines]
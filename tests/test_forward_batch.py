@@ -0,0 +1,74 @@
+"""forward_batch() against forward() on a small random-weight model.
+
+The model definitions come from the hub models.py, which must already be cached (or
+downloadable); the test is skipped otherwise. No checkpoint is needed.
+"""
+import numpy as np
+import pytest
+import torch
+from munch import Munch
+from transformers import AlbertConfig
+
+import models
+
+TOKEN_LENGTHS = [5, 12, 30]
+# Largest difference allowed, relative to the peak amplitude of the item. The model runs
+# in double precision: in single precision, the random-weight generator amplifies the
+# rounding differences between the padded and unpadded computations to about 1e-3
+TOLERANCE = 1e-7
+
+@pytest.fixture(scope='module')
+def float64():
+    default = torch.get_default_dtype()
+    torch.set_default_dtype(torch.float64)
+    yield
+    torch.set_default_dtype(default)
+
+@pytest.fixture(scope='module')
+def modules():
+    # Imported the way build_model() does, so that the decoder and kokoro share one istftnet
+    try:
+        return models.resolve_modules()
+    except Exception as e:
+        pytest.skip(f'hub models.py unavailable: {e}')
+
+@pytest.fixture(scope='module')
+def model(modules, float64):
+    hub = modules['models']
+    torch.manual_seed(0)
+    bert = modules['plbert'].CustomAlbert(AlbertConfig(vocab_size=178, hidden_size=32, num_attention_heads=2,
+                                                       intermediate_size=64, num_hidden_layers=2))
+    predictor = hub.ProsodyPredictor(style_dim=128, d_hid=64, nlayers=2, max_dur=50, dropout=0.2)
+    # A couple of frames per token keeps the decoder's input short
+    torch.nn.init.constant_(predictor.duration_proj.linear_layer.bias, -3.0)
+    torch.nn.init.normal_(predictor.duration_proj.linear_layer.weight, std=0.01)
+    model = Munch(
+        bert=bert,
+        bert_encoder=torch.nn.Linear(32, 64),
+        predictor=predictor,
+        # The decoder's widths are fixed: it takes 512 text encoder channels
+        text_encoder=hub.TextEncoder(channels=512, kernel_size=5, depth=2, n_symbols=178),
+        decoder=modules['istftnet'].Decoder(dim_in=512, style_dim=128, dim_out=80),
+    )
+    return models.prepare_for_inference(model, verify=False)
+
+@pytest.fixture
+def no_source_noise(monkeypatch):
+    # The decoder's harmonic source draws random phases and noise per batch shape: without
+    # them, an item decodes to the same samples alone and within a batch
+    monkeypatch.setattr(torch, 'rand', lambda *size, **kwargs: torch.zeros(*size, **kwargs))
+    monkeypatch.setattr(torch, 'randn_like', torch.zeros_like)
+
+def test_forward_batch_matches_forward(modules, model, float64, no_source_noise):
+    kokoro = modules['kokoro']
+    rng = np.random.default_rng(0)
+    tokens_list = [rng.integers(1, 178, n).tolist() for n in TOKEN_LENGTHS]
+    ref_s = torch.randn(len(tokens_list), 256, generator=torch.Generator().manual_seed(0))
+    kokoro.encoder_cache.clear()
+    kokoro.style_cache.clear()
+    batch = kokoro.forward_batch(model, tokens_list, ref_s, speed=1)
+    for i, tokens in enumerate(tokens_list):
+        expected = kokoro.forward(model, tokens, ref_s[i:i + 1], 1)
+        assert batch[i].shape == expected.shape
+        np.testing.assert_allclose(batch[i], expected, rtol=0, atol=TOLERANCE * np.abs(expected).max(),
+                                   err_msg=f'item {i} ({len(tokens)} tokens)')
@@ -0,0 +1,101 @@
+"""PhonemeCache tiers, eviction, versioning and persistence."""
+import pytest
+
+import phoneme_cache
+from phoneme_cache import PhonemeCache
+
+class Clock:
+    # Wall clock advancing one second per reading, so that access times are strictly ordered
+    def __init__(self):
+        self.now = 1e9
+        self.monotonic = phoneme_cache.time.monotonic
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(phoneme_cache, 'time', clock)
+    return clock
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'phonemes.sqlite')
+
+def entry_size(text, ps):
+    return len(text.encode('utf-8')) + len(ps.encode('utf-8'))
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = PhonemeCache(max_entries=2)
+    cache.put('one', 'a', '1')
+    cache.put('two', 'a', '2')
+    assert cache.get('one', 'a') == '1'
+    cache.put('three', 'a', '3')
+    assert cache.get('two', 'a') is None
+    assert cache.get('one', 'a') == '1' and cache.get('three', 'a') == '3'
+
+def test_entries_persist_across_reopen(path):
+    cache = PhonemeCache(path, version='v1')
+    cache.put('hello', 'a', 'həlˈoʊ')
+    cache.flush()
+    reopened = PhonemeCache(path, version='v1')
+    assert reopened.get('hello', 'a') == 'həlˈoʊ'
+    assert reopened.get('hello', 'b') is None
+    assert reopened.stats()['disk_hits'] == 1
+
+def test_writes_are_deferred_until_flush(path):
+    cache = PhonemeCache(path, version='v1', flush_every=3, flush_seconds=3600)
+    cache.put('one', 'a', '1')
+    cache.put('two', 'a', '2')
+    assert cache.stats()['pending_writes'] == 2
+    assert PhonemeCache(path, version='v1').get('one', 'a') is None
+    cache.put('three', 'a', '3')
+    assert cache.stats()['pending_writes'] == 0
+    assert PhonemeCache(path, version='v1').get('one', 'a') == '1'
+
+def test_versions_share_the_store_without_invalidating_each_other(path):
+    old = PhonemeCache(path, version='v1')
+    old.put('hello', 'a', 'old')
+    old.flush()
+    new = PhonemeCache(path, version='v2')
+    assert new.get('hello', 'a') is None
+    new.put('hello', 'a', 'new')
+    new.flush()
+    assert PhonemeCache(path, version='v1').get('hello', 'a') == 'old'
+    assert PhonemeCache(path, version='v2').get('hello', 'a') == 'new'
+
+def test_disk_tier_evicts_least_recently_used_rows_of_any_version(path, clock):
+    budget = 3 * entry_size('text0', 'ps0')
+    old = PhonemeCache(path, version='v1', max_disk_bytes=budget, flush_every=1)
+    old.put('text0', 'a', 'ps0')
+    cache = PhonemeCache(path, version='v2', max_disk_bytes=budget, flush_every=1)
+    cache.put('text1', 'a', 'ps1')
+    cache.put('text2', 'a', 'ps2')
+    # A disk hit refreshes text1, so text2 is now the least recently used row of v2
+    assert PhonemeCache(path, version='v2', flush_every=1).get('text1', 'a') == 'ps1'
+    cache.put('text3', 'a', 'ps3')
+    reopened = PhonemeCache(path, version='v2')
+    assert [reopened.get(f'text{i}', 'a') for i in (1, 2, 3)] == ['ps1', None, 'ps3']
+    assert PhonemeCache(path, version='v1').get('text0', 'a') is None
+    assert reopened.stats()['disk_bytes'] <= budget
+
+def test_rows_unused_for_max_age_are_evicted_on_open(path, clock):
+    cache = PhonemeCache(path, version='v1', flush_every=1)
+    cache.put('stale', 'a', 's')
+    clock.now += 2 * 86400
+    cache.put('fresh', 'a', 'f')
+    reopened = PhonemeCache(path, version='v1', max_age_days=1)
+    assert reopened.get('stale', 'a') is None
+    assert reopened.get('fresh', 'a') == 'f'
+
+def test_clear_keeps_other_versions(path):
+    other = PhonemeCache(path, version='v1')
+    other.put('hello', 'a', 'old')
+    other.flush()
+    cache = PhonemeCache(path, version='v2')
+    cache.put('hello', 'a', 'new')
+    cache.clear()
+    assert cache.get('hello', 'a') is None
+    assert PhonemeCache(path, version='v1').get('hello', 'a') == 'old'
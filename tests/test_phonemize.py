@@ -0,0 +1,32 @@
+"""Phonemization of words the lexicon covers, in the forms it leaves to espeak."""
+import pytest
+
+from benchmark import kokoro
+from phoneme_cache import PhonemeCache
+
+KOKORO = {'a': 'kˈoʊkəɹoʊ', 'b': 'kˈəʊkəɹəʊ'}
+
+@pytest.fixture(autouse=True)
+def memory_phoneme_cache(monkeypatch):
+    monkeypatch.setattr(kokoro, 'phoneme_cache', PhonemeCache())
+
+@pytest.mark.parametrize('text, expected', [
+    ('Kokoro speaks.', 'kˈəʊkəɹəʊ'),
+    ("Kokoro's voice", 'kˈəʊkəɹəʊz'),
+    ('Mr. Kokoro-san', 'mˈɪstə kˈəʊkəɹəʊsˌan'),
+])
+def test_kokoro_pronunciation_en_gb(text, expected):
+    assert kokoro.phonemize(text, 'b').startswith(expected)
+
+@pytest.mark.parametrize('text, expected', [
+    ('Kokoro speaks.', 'kˈoʊkəɹoʊ'),
+    ("Kokoro's voice", 'kˈoʊkəɹoʊz'),
+    ('Mr. Kokoro-san', 'mˈɪstɚ kˈoʊkəɹoʊsˌæn'),
+])
+def test_kokoro_pronunciation_en_us(text, expected):
+    assert kokoro.phonemize(text, 'a').startswith(expected)
+
+@pytest.mark.parametrize('lang', ['a', 'b'])
+def test_espeak_output_is_fixed_without_the_lexicon(lang):
+    assert kokoro.espeak_phonemize_batch(['Kokoro', "Kokoro's", 'Kokoro-san'], lang) == [
+        KOKORO[lang], KOKORO[lang] + 'z', KOKORO[lang] + ('sˌæn' if lang == 'a' else 'sˌan')]
@@ -0,0 +1,89 @@
+"""BatchScheduler grouping, timing and result routing, with a stand-in for the model."""
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+from scheduler import BatchScheduler
+
+FAIL = 0  # Token that makes the fake forward_batch raise
+
+class FakeKokoro:
+    # Records the token lengths of every batch; each waveform is the item's tokens
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def forward_batch(self, model, tokens_list, ref_s, speed):
+        assert ref_s.shape == (len(tokens_list), 256)
+        with self.lock:
+            self.batches.append(sorted(len(t) for t in tokens_list))
+        if any(FAIL in t for t in tokens_list):
+            raise ValueError('bad batch')
+        return [np.array(t) * s for t, s in zip(tokens_list, speed)]
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+    def make(**kwargs):
+        engine = SimpleNamespace(kokoro=FakeKokoro(), model=None)
+        schedulers.append(BatchScheduler(engine, **kwargs))
+        return schedulers[-1]
+    yield make
+    for scheduler in schedulers:
+        scheduler.close()
+
+def submit(scheduler, length, token=1, speed=1):
+    return scheduler.submit([token] * length, torch.zeros(1, 256), speed)
+
+def test_requests_are_bucketed_by_token_length(make_scheduler):
+    scheduler = make_scheduler(max_wait_ms=1000, max_batch_size=4, bucket_width=64)
+    futures = [submit(scheduler, n) for n in (10, 100, 20, 70)]
+    for future in futures:
+        future.result(timeout=5)
+    assert sorted(scheduler.engine.kokoro.batches) == [[10, 20], [70, 100]]
+    assert scheduler.stats()['batch_sizes'] == {2: 2}
+
+def test_batch_is_dispatched_when_full(make_scheduler):
+    scheduler = make_scheduler(max_wait_ms=10_000, max_batch_size=2)
+    start = time.monotonic()
+    futures = [submit(scheduler, 5), submit(scheduler, 6)]
+    for future in futures:
+        future.result(timeout=5)
+    assert time.monotonic() - start < 5
+    assert scheduler.engine.kokoro.batches == [[5, 6]]
+
+def test_batch_waits_at_most_max_wait(make_scheduler):
+    scheduler = make_scheduler(max_wait_ms=50, max_batch_size=8)
+    start = time.monotonic()
+    submit(scheduler, 5).result(timeout=5)
+    assert 0.05 <= time.monotonic() - start < 5
+    # A request arriving after the wait goes into a batch of its own
+    submit(scheduler, 6).result(timeout=5)
+    assert scheduler.engine.kokoro.batches == [[5], [6]]
+
+def test_results_reach_their_own_request(make_scheduler):
+    scheduler = make_scheduler(max_wait_ms=1000, max_batch_size=3)
+    futures = [submit(scheduler, n, token=n, speed=n) for n in (3, 4, 5)]
+    for n, future in zip((3, 4, 5), futures):
+        np.testing.assert_array_equal(future.result(timeout=5), [n * n] * n)
+
+def test_errors_fail_only_the_requests_of_their_batch(make_scheduler):
+    scheduler = make_scheduler(max_wait_ms=1000, max_batch_size=3, bucket_width=64)
+    failing = [submit(scheduler, 10, token=FAIL), submit(scheduler, 20)]
+    ok = submit(scheduler, 100)
+    for future in failing:
+        with pytest.raises(ValueError, match='bad batch'):
+            future.result(timeout=5)
+    assert len(ok.result(timeout=5)) == 100
+
+def test_close_finishes_queued_requests_then_refuses_new_ones(make_scheduler):
+    scheduler = make_scheduler(max_wait_ms=1000, max_batch_size=8)
+    future = submit(scheduler, 5)
+    scheduler.close()
+    assert future.done() and len(future.result()) == 5
+    with pytest.raises(RuntimeError, match='closed'):
+        submit(scheduler, 5)
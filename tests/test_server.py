@@ -0,0 +1,63 @@
+"""Server-side PCM framing and WebSocket segment synthesis, with a stand-in for the engine."""
+import io
+import json
+import queue
+import struct
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import soundfile as sf
+
+from server import SynthesisHandler, pcm16, wav_header
+from test_websocket_protocol import server_frames
+from websocket_protocol import OP_TEXT, WebSocket
+
+REQUEST = {'voice': 'af_bella', 'lang': 'a', 'speed': 1}
+
+def test_pcm16_clips_and_scales_to_little_endian_int16():
+    pcm = pcm16(np.array([0, 0.5, -0.5, 1, -1, 2, -2], dtype=np.float32))
+    assert np.frombuffer(pcm, '<i2').tolist() == [0, 16383, -16383, 32767, -32767, 32767, -32767]
+
+def test_wav_header_with_pcm_reads_back():
+    audio = np.sin(np.linspace(0, 100, 2400)).astype(np.float32) * 0.5
+    data = pcm16(audio)
+    decoded, sample_rate = sf.read(io.BytesIO(wav_header(24000, len(data)) + data), dtype='float32')
+    assert sample_rate == 24000
+    # pcm16 truncates after scaling by 32767 and soundfile divides by 32768: within two steps
+    np.testing.assert_allclose(decoded, audio, rtol=0, atol=2 / 32767)
+
+def test_streaming_wav_header_has_maximal_sizes():
+    header = wav_header(24000)
+    assert len(header) == 44
+    assert struct.unpack('<I', header[40:44])[0] == 0xFFFFFFFF - 36
+
+def synthesize_segments(segments, slots, queue_timeout=0.05):
+    # Runs the WebSocket synthesizer thread's loop and returns the frames it sent
+    handler = SynthesisHandler.__new__(SynthesisHandler)  # no connection
+    handler.server = SimpleNamespace(slots=slots, queue_timeout=queue_timeout, request_timeout=60)
+    handler.log_error = lambda *args: None
+    engine = SimpleNamespace(stream=lambda text, *args: iter([(np.zeros(len(text), np.float32), text)]))
+    inbox = queue.Queue()
+    for segment in segments + [None]:
+        inbox.put(segment)
+    wfile = io.BytesIO()
+    handler._synthesize_segments(engine, REQUEST, WebSocket(io.BytesIO(), wfile), inbox, threading.Event())
+    return [json.loads(payload) if opcode == OP_TEXT else payload
+            for _, opcode, payload in server_frames(wfile.getvalue())]
+
+def test_segments_are_synthesized_in_a_slot():
+    slots = threading.BoundedSemaphore(1)
+    assert synthesize_segments(['Hi.', 'There.'], slots) == [
+        {'type': 'segment', 'text': 'Hi.'}, b'\0' * 6, {'type': 'segment', 'text': 'There.'}, b'\0' * 12,
+        {'type': 'done'}]
+    assert slots.acquire(blocking=False), 'slot not released'
+
+def test_segment_without_a_free_slot_gets_an_error_frame():
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()  # taken by another request for longer than queue_timeout
+    assert synthesize_segments(['Hi.'], slots) == [
+        {'type': 'segment', 'text': 'Hi.'},
+        {'type': 'error', 'error': 'Too many concurrent requests', 'text': 'Hi.'},
+        {'type': 'done'}]
+    slots.release()
@@ -0,0 +1,29 @@
+"""Vocab encoding and decoding against the symbol dictionary it is built from."""
+import numpy as np
+
+from frontend import VOCAB, Vocab, get_vocab
+
+PHONEMES = ['həlˈoʊ wˈɜːld!', 'kˈoʊkəɹoʊ', '', 'ðə kwˈɪk bɹˈaʊn fˈɑːks', '“ʔ”… ¿ɐ?']
+
+def reference_encode(text):
+    # The dictionary lookup that Vocab replaces: unknown symbols are dropped
+    return [VOCAB[c] for c in text if c in VOCAB]
+
+def test_every_symbol_round_trips():
+    vocab = Vocab(get_vocab())
+    symbols = ''.join(VOCAB)
+    np.testing.assert_array_equal(vocab.encode(symbols), list(VOCAB.values()))
+    assert vocab.decode(vocab.encode(symbols)) == symbols
+
+def test_unknown_symbols_are_dropped():
+    vocab = Vocab(VOCAB)
+    text = 'àb' + chr(0x10FFFF) + '中c'
+    assert vocab.encode(text).tolist() == reference_encode(text) == [VOCAB['a'], VOCAB['b'], VOCAB['c']]
+    assert vocab.filter(text) == 'abc'
+
+def test_batch_encoding_matches_single_texts():
+    vocab = Vocab(VOCAB)
+    encoded = vocab.encode_batch(PHONEMES)
+    assert [ids.tolist() for ids in encoded] == [reference_encode(t) for t in PHONEMES]
+    assert vocab.decode_batch(encoded) == [vocab.filter(t) for t in PHONEMES]
+    assert vocab.encode_batch([]) == []
@@ -0,0 +1,63 @@
+"""Voice bank files and the registry serving voices from them."""
+import os
+
+import pytest
+import torch
+
+from voice_bank import BANK_FILENAME, VoiceBank, VoiceRegistry, build_voice_bank
+
+def write_voice(voices_dir, name, seed):
+    voice = torch.randn(511, 1, 256, generator=torch.Generator().manual_seed(seed))
+    torch.save(voice, os.path.join(voices_dir, f'{name}.pt'))
+    return voice
+
+@pytest.fixture
+def voices(tmp_path):
+    return {name: write_voice(tmp_path, name, seed) for seed, name in enumerate(['af_bella', 'am_adam', 'bf_emma'])}
+
+def test_bank_round_trips_every_voicepack(tmp_path, voices):
+    bank = VoiceBank(build_voice_bank(tmp_path))
+    assert bank.names() == sorted(voices)
+    for name, voice in voices.items():
+        array = bank.array(name)
+        assert array.ctypes.data % 64 == 0
+        assert torch.equal(torch.from_numpy(array), voice)
+    assert bank.is_current(tmp_path)
+
+def test_bank_rejects_other_files(tmp_path):
+    path = tmp_path / BANK_FILENAME
+    path.write_bytes(b'not a bank')
+    with pytest.raises(ValueError, match='not a voice bank'):
+        VoiceBank(str(path))
+
+def test_registry_serves_voices_from_the_bank(tmp_path, voices):
+    registry = VoiceRegistry(str(tmp_path))
+    assert registry.names() == sorted(voices) and 'am_adam' in registry
+    assert torch.equal(registry.get('am_adam'), voices['am_adam'])
+    assert registry.get('am_adam') is registry.get('am_adam')
+    with pytest.raises(ValueError, match="Voice 'nobody' not found"):
+        registry.get('nobody')
+
+def test_registry_keeps_the_most_recently_used_voices(tmp_path, voices):
+    registry = VoiceRegistry(str(tmp_path), max_loaded=2)
+    for name in ['af_bella', 'am_adam', 'af_bella', 'bf_emma']:
+        registry.get(name)
+    assert registry.loaded() == ['af_bella', 'bf_emma']
+
+def test_registry_rebuilds_the_bank_when_voices_change(tmp_path, voices):
+    registry = VoiceRegistry(str(tmp_path))
+    added = write_voice(tmp_path, 'bm_george', 10)
+    changed = write_voice(tmp_path, 'af_bella', 11)
+    # Same size as before: only the modification time tells the change apart
+    mtime = os.stat(tmp_path / 'af_bella.pt').st_mtime_ns + 10**9
+    os.utime(tmp_path / 'af_bella.pt', ns=(mtime, mtime))
+    os.remove(tmp_path / 'bf_emma.pt')
+    registry.refresh()
+    assert registry.names() == ['af_bella', 'am_adam', 'bm_george']
+    assert torch.equal(registry.get('bm_george'), added)
+    assert torch.equal(registry.get('af_bella'), changed)
+
+def test_registry_rebuilds_a_damaged_bank(tmp_path, voices):
+    (tmp_path / BANK_FILENAME).write_bytes(b'garbage')
+    registry = VoiceRegistry(str(tmp_path))
+    assert torch.equal(registry.get('bf_emma'), voices['bf_emma'])
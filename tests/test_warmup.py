@@ -0,0 +1,39 @@
+"""KokoroEngine.warmup() voice selection and caches, with a stand-in for the model."""
+from types import SimpleNamespace
+
+import torch
+
+from models import KokoroEngine
+from voice_bank import VoiceRegistry
+
+def make_engine(voices_dir, voice_names=()):
+    for name in voice_names:
+        torch.save(torch.full((511, 1, 256), float(len(name))), voices_dir / f'{name}.pt')
+    calls = []
+    encoder_cache = SimpleNamespace(cleared=False)
+    encoder_cache.clear = lambda: setattr(encoder_cache, 'cleared', True)
+    engine = KokoroEngine.__new__(KokoroEngine)  # no model build
+    engine.model = None
+    engine.voices = VoiceRegistry(str(voices_dir))
+    engine.kokoro = SimpleNamespace(
+        phonemizers={'a': None},
+        encoder_cache=encoder_cache,
+        forward_batch=lambda model, tokens_list, ref_s, speed=1: calls.append((len(tokens_list[0]), ref_s)))
+    return engine, calls
+
+def test_warmup_synthesizes_each_length_with_the_requested_voice(tmp_path):
+    engine, calls = make_engine(tmp_path, ['af', 'bf_emma'])
+    assert set(engine.warmup([16, 64], voice='bf_emma')) == {16, 64}
+    assert [length for length, _ in calls] == [16, 64]
+    assert all(torch.all(ref_s == len('bf_emma')) for _, ref_s in calls)
+    assert not engine.kokoro.encoder_cache.cleared
+
+def test_warmup_falls_back_to_the_first_voice(tmp_path):
+    engine, calls = make_engine(tmp_path, ['af', 'bf_emma'])
+    engine.warmup([16], voice='missing')
+    assert torch.all(calls[0][1] == len('af'))
+
+def test_warmup_without_voices_is_skipped(tmp_path):
+    engine, calls = make_engine(tmp_path)
+    assert engine.warmup([16], voice='af_bella') == {}
+    assert calls == []
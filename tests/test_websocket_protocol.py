@@ -0,0 +1,100 @@
+"""RFC 6455 framing of the server-side WebSocket, over in-memory streams."""
+import io
+import os
+import struct
+
+import pytest
+
+from websocket_protocol import (MAX_MESSAGE_BYTES, OP_BINARY, OP_CLOSE, OP_CONTINUATION, OP_PING, OP_PONG, OP_TEXT,
+                                WebSocket, WebSocketClosed, accept_key)
+
+def client_frame(opcode, payload=b'', fin=True, masked=True):
+    # A frame as a client sends it: masked with a random key
+    header = bytes([(0x80 if fin else 0) | opcode])
+    mask_bit = 0x80 if masked else 0
+    if len(payload) < 126:
+        header += bytes([mask_bit | len(payload)])
+    elif len(payload) < 1 << 16:
+        header += bytes([mask_bit | 126]) + struct.pack('>H', len(payload))
+    else:
+        header += bytes([mask_bit | 127]) + struct.pack('>Q', len(payload))
+    if not masked:
+        return header + payload
+    mask = os.urandom(4)
+    return header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+def server_frames(data):
+    # (fin, opcode, payload) of every frame the server wrote; server frames are never masked
+    frames, stream = [], io.BytesIO(data)
+    while header := stream.read(2):
+        assert not header[1] & 0x80, 'server frames must not be masked'
+        length = header[1] & 0x7F
+        if length == 126:
+            length, = struct.unpack('>H', stream.read(2))
+        elif length == 127:
+            length, = struct.unpack('>Q', stream.read(8))
+        frames.append((bool(header[0] & 0x80), header[0] & 0x0F, stream.read(length)))
+    return frames
+
+def connect(*frames):
+    wfile = io.BytesIO()
+    return WebSocket(io.BytesIO(b''.join(frames)), wfile), wfile
+
+def test_accept_key_matches_rfc_example():
+    assert accept_key('dGhlIHNhbXBsZSBub25jZQ==') == 's3pPLMBiTxaQ9kYGzzhZRbK+xOo='
+
+def test_masked_text_and_binary_messages_are_decoded():
+    websocket, _ = connect(client_frame(OP_TEXT, 'héllo'.encode('utf-8')), client_frame(OP_BINARY, b'\x00\xff' * 100))
+    assert websocket.receive() == 'héllo'
+    assert websocket.receive() == b'\x00\xff' * 100
+
+def test_fragmented_message_is_reassembled():
+    websocket, _ = connect(client_frame(OP_TEXT, b'{"type": ', fin=False), client_frame(OP_PING, b'hi'),
+                           client_frame(OP_CONTINUATION, b'"end"}'))
+    assert websocket.receive() == '{"type": "end"}'
+
+def test_ping_is_answered_with_pong():
+    websocket, wfile = connect(client_frame(OP_PING, b'probe'), client_frame(OP_TEXT, b'x'))
+    assert websocket.receive() == 'x'
+    assert server_frames(wfile.getvalue()) == [(True, OP_PONG, b'probe')]
+
+@pytest.mark.parametrize('size', [0, 125, 126, 65535, 65536])
+def test_server_frames_use_the_shortest_length_encoding(size):
+    websocket, wfile = connect()
+    websocket.send_binary(b'a' * size)
+    data = wfile.getvalue()
+    assert len(data) - size == (2 if size < 126 else 4 if size < 1 << 16 else 10)
+    assert server_frames(data) == [(True, OP_BINARY, b'a' * size)]
+
+def test_close_handshake_echoes_the_client_code():
+    websocket, wfile = connect(client_frame(OP_CLOSE, struct.pack('>H', 1001)))
+    with pytest.raises(WebSocketClosed, match='closed by the client'):
+        websocket.receive()
+    assert server_frames(wfile.getvalue()) == [(True, OP_CLOSE, struct.pack('>H', 1001))]
+    with pytest.raises(WebSocketClosed):
+        websocket.send_text('late')
+    websocket.close()  # a second close sends nothing
+    assert len(server_frames(wfile.getvalue())) == 1
+
+def test_server_close_sends_its_code_once():
+    websocket, wfile = connect()
+    websocket.close(1011)
+    websocket.close()
+    assert server_frames(wfile.getvalue()) == [(True, OP_CLOSE, struct.pack('>H', 1011))]
+
+@pytest.mark.parametrize('frame, code', [
+    (client_frame(OP_TEXT, b'plain', masked=False), 1002),
+    (client_frame(OP_CONTINUATION, b'orphan'), 1002),
+    (client_frame(OP_BINARY, b'\0' * (MAX_MESSAGE_BYTES + 1)), 1009),
+])
+def test_protocol_errors_close_the_connection(frame, code):
+    websocket, wfile = connect(frame)
+    with pytest.raises(WebSocketClosed):
+        websocket.receive()
+    assert server_frames(wfile.getvalue()) == [(True, OP_CLOSE, struct.pack('>H', code))]
+
+def test_connection_lost_mid_frame():
+    websocket, _ = connect(client_frame(OP_TEXT, b'cut short')[:-3])
+    with pytest.raises(WebSocketClosed):
+        websocket.receive()
+    assert websocket.closed
@@ -1,38 +1,167 @@
 import torch
 from typing import Optional, Tuple, List
-from models import build_model, load_voice, generate_speech, list_available_voices
+from models import KokoroEngine, list_available_voices, SAMPLE_RATE
 import argparse
+import csv
+import json
+import os
+import re
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from tqdm.auto import tqdm
 import soundfile as sf
 from pathlib import Path
+from audio_encoding import available_formats, encode_audio
+from scheduler import BatchScheduler, MAX_TOKENS
 
 # Constants
-SAMPLE_RATE = 22050
 DEFAULT_MODEL_PATH = 'kokoro-v0_19.pth'
 DEFAULT_OUTPUT_FILE = 'output.wav'
 DEFAULT_LANGUAGE = 'a'  # TODO: Document why this is 'a' or make configurable
 DEFAULT_TEXT = "Hello, welcome to this text-to-speech test."
+DEFAULT_BATCH_OUTPUT_DIR = 'batch_output'
+MANIFEST_FILE = 'manifest.jsonl'  # One result line per item, appended as items complete
 
 # Configure tqdm for better Windows console support
 tqdm.monitor_interval = 0  # Disable monitor thread to prevent encoding issues
 
-def load_and_validate_voice(voice_name: str, device: str) -> torch.Tensor:
-    """Load and validate the requested voice.
+def read_batch(path: str, voice: str, lang: str) -> List[dict]:
+    """Read batch items from a JSONL or CSV file, or from a directory of .txt files.
+    
+    JSONL lines and CSV rows hold id and text, and optionally voice, speed and lang; a text
+    file gives one item named after the file. Missing ids are numbered by position.
     
-    Args:
-        voice_name: Name of the voice to load
-        device: Device to load the voice on ('cuda' or 'cpu')
-        
     Returns:
-        Loaded voice tensor
+        List of dicts with id, text, voice, speed and lang
         
     Raises:
-        ValueError: If the requested voice doesn't exist
+        ValueError: If there are no items, an item has no text or two items share an id
     """
-    available_voices = list_available_voices()
-    if voice_name not in available_voices:
-        raise ValueError(f"Voice '{voice_name}' not found. Available voices: {', '.join(available_voices)}")
-    return load_voice(voice_name, device)
+    path = Path(path)
+    if path.is_dir():
+        rows = [{'id': p.stem, 'text': p.read_text(encoding='utf-8')} for p in sorted(path.glob('*.txt'))]
+    elif path.suffix.lower() == '.csv':
+        with open(path, encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    items, seen = [], set()
+    for number, row in enumerate(rows, 1):
+        item = {
+            'id': str(row.get('id') or number),
+            'text': (row.get('text') or '').strip(),
+            'voice': row.get('voice') or voice,
+            'speed': float(row.get('speed') or 1),
+            'lang': row.get('lang') or lang,
+        }
+        if not item['text']:
+            raise ValueError(f"Item {item['id']} of {path} has no text")
+        if item['id'] in seen:
+            raise ValueError(f"Duplicate id {item['id']} in {path}")
+        seen.add(item['id'])
+        items.append(item)
+    if not items:
+        raise ValueError(f"No items in {path}")
+    return items
+
+def completed_ids(output_dir: Path) -> set:
+    """Ids recorded as done in the manifest of output_dir whose audio file still exists."""
+    manifest = output_dir / MANIFEST_FILE
+    if not manifest.exists():
+        return set()
+    done = set()
+    with open(manifest, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interruption
+            if result.get('status') == 'ok' and (output_dir / result['file']).exists():
+                done.add(result['id'])
+    return done
+
+def output_name(item_id: str, format: str) -> str:
+    return re.sub(r'[^\w.-]', '_', item_id) + f'.{format}'
+
+def synthesize_item(engine, scheduler, item, tokens):
+    # Items that fit one forward pass are batched by the scheduler with others of similar
+    # length; longer ones are synthesized sentence by sentence
+    if len(tokens) == 0:
+        raise ValueError("text has no phonemes")
+    if len(tokens) <= MAX_TOKENS:
+        return scheduler.submit(tokens, engine.load_voice(item['voice'])[len(tokens)], item['speed']).result()
+    return np.concatenate([audio for audio, _ in engine.stream(item['text'], item['voice'], item['lang'], item['speed'])])
+
+def run_batch(engine, items, output_dir: Path, format: str, workers: int, resume: bool = True) -> None:
+    """Synthesize batch items shortest first through a worker pool, writing one audio file per
+    item and a manifest line with its duration and timings.
+    
+    With resume, items already recorded as done in the manifest are skipped.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    done = completed_ids(output_dir) if resume else set()
+    pending = [item for item in items if item['id'] not in done]
+    print(f"{len(items)} items, {len(items) - len(pending)} already done, {len(pending)} to synthesize")
+    if not pending:
+        return
+    
+    # Phonemize everything up front, one espeak call per language, to sort by token length:
+    # neighbours in the queue then land in the same scheduler batches with little padding
+    kokoro = engine.kokoro
+    start = time.perf_counter()
+    phonemes = {}
+    for lang in {item['lang'] for item in pending}:
+        group = [item for item in pending if item['lang'] == lang]
+        for item, ps in zip(group, kokoro.phonemize_batch([item['text'] for item in group], lang)):
+            phonemes[item['id']] = ps
+    tokens = {item_id: kokoro.tokenize(ps) for item_id, ps in phonemes.items()}
+    pending.sort(key=lambda item: len(tokens[item['id']]))
+    print(f"Phonemized in {time.perf_counter() - start:.1f}s")
+    
+    scheduler = BatchScheduler(engine, max_batch_size=workers)
+    
+    def process(item):
+        item_start = time.perf_counter()
+        result = {'id': item['id'], 'voice': item['voice'], 'speed': item['speed'], 'lang': item['lang'],
+                  'tokens': len(tokens[item['id']])}
+        try:
+            audio = synthesize_item(engine, scheduler, item, tokens[item['id']])
+            synthesis_seconds = time.perf_counter() - item_start
+            name = output_name(item['id'], format)
+            # Written under a temporary name first, so an interruption never leaves a partial file
+            tmp_path = output_dir / f".{name}.tmp"
+            tmp_path.write_bytes(encode_audio(audio, SAMPLE_RATE, format))
+            os.replace(tmp_path, output_dir / name)
+            result.update(status='ok', file=name, duration_seconds=round(len(audio) / SAMPLE_RATE, 3),
+                          synthesis_seconds=round(synthesis_seconds, 3),
+                          total_seconds=round(time.perf_counter() - item_start, 3))
+        except Exception as e:
+            result.update(status='error', error=f"{type(e).__name__}: {e}")
+        return result
+    
+    ok = audio_seconds = 0
+    start = time.perf_counter()
+    try:
+        with open(output_dir / MANIFEST_FILE, 'a', encoding='utf-8') as manifest, \
+                ThreadPoolExecutor(workers) as pool, tqdm(total=len(pending), desc="Synthesizing") as pbar:
+            for result in pool.map(process, pending):
+                manifest.write(json.dumps(result, ensure_ascii=False) + '\n')
+                manifest.flush()
+                if result['status'] == 'ok':
+                    ok += 1
+                    audio_seconds += result['duration_seconds']
+                else:
+                    tqdm.write(f"Error in item {result['id']}: {result['error']}")
+                pbar.update(1)
+    finally:
+        scheduler.close()
+    elapsed = time.perf_counter() - start
+    print(f"\n{ok}/{len(pending)} items synthesized in {elapsed:.1f}s "
+          f"({audio_seconds:.0f}s of audio, {audio_seconds / elapsed:.1f}x realtime)")
+    print(f"Scheduler: {scheduler.stats()}")
+    print(f"Results in {output_dir.absolute() / MANIFEST_FILE}")
 
 def main() -> None:
     try:
@@ -44,6 +173,11 @@ def main() -> None:
         parser.add_argument('--model', type=str, default=DEFAULT_MODEL_PATH, help=f'Path to model file (default: {DEFAULT_MODEL_PATH})')
         parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT_FILE, help=f'Output WAV file (default: {DEFAULT_OUTPUT_FILE})')
         parser.add_argument('--lang', type=str, default=DEFAULT_LANGUAGE, help=f'Language code (default: {DEFAULT_LANGUAGE})')
+        parser.add_argument('--batch', type=str, help='JSONL or CSV file (id, text, voice, speed, lang) or directory of .txt files to synthesize')
+        parser.add_argument('--output-dir', type=str, default=DEFAULT_BATCH_OUTPUT_DIR, help=f'Batch output directory (default: {DEFAULT_BATCH_OUTPUT_DIR})')
+        parser.add_argument('--format', type=str, default='wav', choices=available_formats(), help='Batch audio format (default: wav)')
+        parser.add_argument('--workers', type=int, default=8, help='Batch items in flight, also the largest batch (default: 8)')
+        parser.add_argument('--no-resume', action='store_true', help='Synthesize again the items already in the batch manifest')
         args = parser.parse_args()
 
         if args.list_voices:
@@ -53,6 +187,16 @@ def main() -> None:
                 print(f"- {voice}")
             return
 
+        # Read the batch before the model is built, so a bad file fails fast
+        if args.batch:
+            if args.workers < 1:
+                parser.error("--workers must be at least 1")
+            try:
+                items = read_batch(args.batch, args.voice, args.lang)
+            except (OSError, ValueError) as e:
+                print(f"Error reading batch: {e}")
+                return
+        
         # Set up device
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         print(f"Using device: {device}")
@@ -60,13 +204,17 @@ def main() -> None:
         # Build model and load voice with progress indication
         print("\nLoading model...")
         with tqdm(total=1, desc="Building model") as pbar:
-            model = build_model(args.model, device)
+            engine = KokoroEngine(args.model, device)
             pbar.update(1)
+        
+        if args.batch:
+            run_batch(engine, items, Path(args.output_dir), args.format, args.workers, resume=not args.no_resume)
+            return
             
         print("\nLoading voice...")
         with tqdm(total=1, desc="Loading voice") as pbar:
             try:
-                voice = load_and_validate_voice(args.voice, device)
+                voice = engine.load_voice(args.voice)
                 pbar.update(1)
             except ValueError as e:
                 print(f"Error: {e}")
@@ -83,7 +231,7 @@ def main() -> None:
         
         print(f"\nGenerating speech for: '{text}'")
         with tqdm(total=1, desc="Generating speech") as pbar:
-            audio, phonemes = generate_speech(model, text, voice, lang=args.lang, device=device)
+            audio, phonemes = engine.synthesize(text, voice, lang=args.lang)
             pbar.update(1)
         
         if audio is not None:
@@ -108,8 +256,8 @@ def main() -> None:
         traceback.print_exc()
     finally:
         # Cleanup
-        if 'model' in locals():
-            del model
+        if 'engine' in locals():
+            del engine
         if 'voice' in locals():
             del voice
         torch.cuda.empty_cache()
@@ -0,0 +1,181 @@
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+__all__ = ['VoiceBank', 'VoiceRegistry', 'build_voice_bank']
+
+BANK_FILENAME = 'voices.bank'
+MAGIC = b'KVBANK1\0'
+ALIGNMENT = 64  # Every voicepack starts on a 64-byte boundary of the file
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _voice_sources(voices_dir):
+    """Map voice name -> (path, size, mtime) of every .pt voicepack in voices_dir."""
+    sources = {}
+    for entry in os.scandir(voices_dir):
+        if entry.name.endswith('.pt') and entry.is_file():
+            stat = entry.stat()
+            sources[os.path.splitext(entry.name)[0]] = (entry.path, stat.st_size, stat.st_mtime_ns)
+    return sources
+
+def build_voice_bank(voices_dir, bank_path=None):
+    """Pack every voices_dir/*.pt voicepack into a single memory-mappable bank file.
+
+    The file holds a magic string, the length of a JSON header, the header (voice name ->
+    offset, shape, dtype and the size/mtime of its source file), then the raw arrays.
+    It is written to a temporary file first and renamed, so readers never see half a bank.
+
+    Args:
+        voices_dir: Directory holding the .pt voicepacks
+        bank_path: Output file (default: voices_dir/voices.bank)
+
+    Returns:
+        Path of the bank file
+    """
+    bank_path = bank_path or os.path.join(voices_dir, BANK_FILENAME)
+    arrays, index = {}, {}
+    for name, (path, size, mtime) in sorted(_voice_sources(voices_dir).items()):
+        arrays[name] = torch.load(path, weights_only=True, map_location='cpu').numpy()
+        index[name] = {'shape': list(arrays[name].shape), 'dtype': arrays[name].dtype.str,
+                       'source': [size, mtime]}
+    # Offsets are relative to the aligned end of the header, so they do not depend on its length
+    offset = 0
+    for name, array in arrays.items():
+        index[name]['offset'] = offset
+        offset = _align(offset + array.nbytes)
+    header = json.dumps(index).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header))
+    tmp_path = f"{bank_path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+        for name, array in arrays.items():
+            f.seek(data_start + index[name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, bank_path)
+    print(f"Packed {len(arrays)} voices into {bank_path}")
+    return bank_path
+
+class VoiceBank:
+    """Read-only view of a voice bank file.
+
+    The file is memory-mapped copy-on-write: opening it only parses the index, and a
+    voicepack is paged in from disk the first time it is used.
+
+    Args:
+        path: Bank file written by build_voice_bank()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a voice bank")
+            header_length, = struct.unpack('<Q', f.read(8))
+            self.index = json.loads(f.read(header_length).decode('utf-8'))
+        self.data_start = _align(len(MAGIC) + 8 + header_length)
+        self._map = np.memmap(path, dtype=np.uint8, mode='c') if self.index else None
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def names(self):
+        return sorted(self.index)
+
+    def array(self, name):
+        """Return the voicepack as a NumPy view of the mapped file."""
+        entry = self.index[name]
+        return np.ndarray(entry['shape'], dtype=np.dtype(entry['dtype']), buffer=self._map,
+                          offset=self.data_start + entry['offset'])
+
+    def is_current(self, voices_dir):
+        """Whether the bank holds exactly the voicepacks of voices_dir, unchanged."""
+        sources = _voice_sources(voices_dir)
+        return sources.keys() == self.index.keys() and all(
+            [size, mtime] == self.index[name]['source'] for name, (_, size, mtime) in sources.items())
+
+class VoiceRegistry:
+    """Voices of a directory, served from its voice bank.
+
+    Listing and membership tests only read the in-memory index. Voicepacks are kept on the
+    target device in a bounded LRU, so switching between recently used voices is a
+    dictionary lookup; evicted voices are copied again from the memory-mapped bank.
+
+    Args:
+        voices_dir: Directory holding the .pt voicepacks and the bank built from them
+        device: Device the voicepacks are moved to
+        max_loaded: Number of voicepacks kept on the device
+    """
+
+    def __init__(self, voices_dir, device='cpu', max_loaded=8):
+        self.voices_dir = voices_dir
+        self.device = device
+        self.max_loaded = max_loaded
+        self.bank_path = os.path.join(voices_dir, BANK_FILENAME)
+        self.bank = None
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Rescan voices_dir and rebuild the bank if voicepacks were added, removed or changed."""
+        with self._lock:
+            os.makedirs(self.voices_dir, exist_ok=True)
+            bank = None
+            if os.path.exists(self.bank_path):
+                try:
+                    bank = VoiceBank(self.bank_path)
+                except (OSError, ValueError) as e:
+                    print(f"Error reading voice bank {self.bank_path}, rebuilding it: {e}")
+            if bank is None or not bank.is_current(self.voices_dir):
+                # Unmap the old bank first: Windows cannot replace a file that is mapped
+                bank = self.bank = None
+                self._loaded.clear()
+                bank = VoiceBank(build_voice_bank(self.voices_dir, self.bank_path))
+            self.bank = bank
+            self._names = bank.names()
+            self._loaded.clear()
+
+    def names(self):
+        """Sorted voice names."""
+        return list(self._names)
+
+    def __contains__(self, name):
+        return name in self.bank
+
+    def __len__(self):
+        return len(self.bank)
+
+    def get(self, name):
+        """Return the voicepack tensor for name on the registry's device.
+
+        Raises:
+            ValueError: If the voice doesn't exist
+        """
+        with self._lock:
+            voice = self._loaded.get(name)
+            if voice is not None:
+                self._loaded.move_to_end(name)
+                return voice
+            if name not in self.bank:
+                raise ValueError(f"Voice '{name}' not found. Available voices: {', '.join(self._names)}")
+            voice = torch.from_numpy(self.bank.array(name)).to(self.device)
+            self._loaded[name] = voice
+            if len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+            return voice
+
+    def loaded(self):
+        """Names of the voicepacks currently held on the device, least recently used first."""
+        with self._lock:
+            return list(self._loaded)
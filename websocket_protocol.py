@@ -0,0 +1,131 @@
+import base64
+import hashlib
+import struct
+import threading
+
+import numpy as np
+
+__all__ = ['WebSocket', 'WebSocketClosed', 'accept_key']
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'  # Fixed by RFC 6455 for the handshake
+OP_CONTINUATION, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+MAX_MESSAGE_BYTES = 1 << 20
+
+def accept_key(key):
+    """Sec-WebSocket-Accept value answering a client's Sec-WebSocket-Key."""
+    return base64.b64encode(hashlib.sha1((key + GUID).encode('ascii')).digest()).decode('ascii')
+
+class WebSocketClosed(Exception):
+    """The connection was closed, by a close frame or by the socket going away."""
+
+class WebSocket:
+    """Server side of an RFC 6455 WebSocket over the streams of an upgraded HTTP connection.
+
+    Only what a synthesis session needs: text and binary messages (fragmented or not),
+    ping/pong and the closing handshake, without extensions. Sending is thread-safe, so one
+    thread can stream audio while another reads the client's messages.
+
+    Args:
+        rfile: Buffered stream to read client frames from
+        wfile: Stream to write server frames to
+    """
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.closed = False
+        self._send_lock = threading.Lock()
+
+    def receive(self):
+        """Return the next message, a str for text and bytes for binary messages.
+
+        Pings are answered on the way.
+
+        Raises:
+            WebSocketClosed: If the client closed the connection or it went away
+        """
+        message, message_opcode = b'', None
+        while True:
+            fin, opcode, payload = self._read_frame()
+            if opcode == OP_PING:
+                self._send_frame(OP_PONG, payload)
+            elif opcode == OP_PONG:
+                pass
+            elif opcode == OP_CLOSE:
+                self.close(struct.unpack('>H', payload[:2])[0] if len(payload) >= 2 else 1000)
+                raise WebSocketClosed("closed by the client")
+            else:
+                if (opcode == OP_CONTINUATION) != (message_opcode is not None):
+                    self.close(1002)
+                    raise WebSocketClosed("unexpected continuation frame")
+                message_opcode = message_opcode if opcode == OP_CONTINUATION else opcode
+                message += payload
+                if len(message) > MAX_MESSAGE_BYTES:
+                    self.close(1009)
+                    raise WebSocketClosed(f"message over {MAX_MESSAGE_BYTES} bytes")
+                if fin:
+                    return message.decode('utf-8') if message_opcode == OP_TEXT else message
+
+    def send_text(self, text):
+        self._send_frame(OP_TEXT, text.encode('utf-8'))
+
+    def send_binary(self, data):
+        self._send_frame(OP_BINARY, data)
+
+    def close(self, code=1000):
+        """Send a close frame, unless one was already sent."""
+        with self._send_lock:
+            if self.closed:
+                return
+            self.closed = True
+            try:
+                self._write(OP_CLOSE, struct.pack('>H', code))
+            except OSError:
+                pass
+
+    def _read_frame(self):
+        try:
+            header = self._read_exactly(2)
+            fin, opcode = header[0] & 0x80, header[0] & 0x0F
+            masked, length = header[1] & 0x80, header[1] & 0x7F
+            if length == 126:
+                length, = struct.unpack('>H', self._read_exactly(2))
+            elif length == 127:
+                length, = struct.unpack('>Q', self._read_exactly(8))
+            if not masked or length > MAX_MESSAGE_BYTES:
+                self.close(1002 if not masked else 1009)
+                raise WebSocketClosed("unmasked or oversized client frame")
+            mask = self._read_exactly(4)
+            payload = np.frombuffer(self._read_exactly(length), np.uint8)
+        except OSError as e:  # includes timeouts and resets
+            self.closed = True
+            raise WebSocketClosed(str(e)) from e
+        unmasked = (payload ^ np.resize(np.frombuffer(mask, np.uint8), length)).tobytes()
+        return fin, opcode, unmasked
+
+    def _read_exactly(self, n):
+        data = self.rfile.read(n)
+        if len(data) < n:
+            raise ConnectionResetError("connection closed mid-frame")
+        return data
+
+    def _send_frame(self, opcode, payload):
+        with self._send_lock:
+            if self.closed:
+                raise WebSocketClosed("already closed")
+            try:
+                self._write(opcode, payload)
+            except OSError as e:
+                self.closed = True
+                raise WebSocketClosed(str(e)) from e
+
+    def _write(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('>BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+        self.wfile.write(header + payload)
+        self.wfile.flush()
@@ -0,0 +1,127 @@
+import contextlib
+import io
+import os
+
+import torch
+import torch.nn as nn
+from safetensors import safe_open
+from safetensors.torch import load_file, save_file
+
+__all__ = ['build_from_prepared_weights', 'checkpoint_source', 'is_current', 'load_prepared_weights',
+           'save_prepared_weights']
+
+FORMAT_VERSION = '1'  # Bump when the layout of the prepared weights changes
+
+def checkpoint_source(path):
+    """Identify a checkpoint file by name, size and mtime, to detect stale prepared weights."""
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def _empty_checkpoint():
+    # In-memory checkpoint without weights, for building the bare model with the hub build_model
+    buffer = io.BytesIO()
+    torch.save({'net': {}}, buffer)
+    buffer.seek(0)
+    return buffer
+
+@contextlib.contextmanager
+def _meta_parameters():
+    # Parameters registered inside the block live on the meta device: they take no memory
+    # until load_prepared_weights() assigns the real tensors. Buffers are left alone, since
+    # the non-persistent ones (not in the state dict) must keep their values.
+    register_parameter = nn.Module.register_parameter
+
+    def register_meta_parameter(module, name, param):
+        if param is not None and not param.is_meta:
+            param = nn.Parameter(param.to('meta'), requires_grad=param.requires_grad)
+        register_parameter(module, name, param)
+
+    nn.Module.register_parameter = register_meta_parameter
+    try:
+        yield
+    finally:
+        nn.Module.register_parameter = register_parameter
+
+def is_current(path, source):
+    """Whether path holds prepared weights saved from the checkpoint identified by source."""
+    if not os.path.exists(path):
+        return False
+    try:
+        with safe_open(path, framework='pt') as f:
+            metadata = f.metadata() or {}
+    except Exception as e:
+        print(f"Ignoring unreadable prepared weights {path}: {e}")
+        return False
+    return metadata.get('format') == FORMAT_VERSION and metadata.get('source') == source
+
+def save_prepared_weights(model, path, source):
+    """Save the weights of a model prepared by prepare_for_inference() as safetensors.
+
+    Tensors are keyed '<component>.<state dict key>'. The file is written to a temporary
+    path first and renamed, so other processes never map half a file.
+
+    Args:
+        model: Prepared model (a Munch of submodules)
+        path: Output .safetensors file
+        source: checkpoint_source() of the checkpoint the model was built from
+    """
+    tensors, storages = {}, set()
+    for key, component in model.items():
+        for name, tensor in component.state_dict().items():
+            tensor = tensor.detach().cpu().contiguous()
+            # safetensors refuses tensors that share memory; store such a tensor as a copy
+            if tensor.untyped_storage().data_ptr() in storages:
+                tensor = tensor.clone()
+            storages.add(tensor.untyped_storage().data_ptr())
+            tensors[f"{key}.{name}"] = tensor
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    save_file(tensors, tmp_path, metadata={'format': FORMAT_VERSION, 'source': source})
+    os.replace(tmp_path, path)
+
+def load_prepared_weights(model, path):
+    """Load weights saved by save_prepared_weights() into a CPU model of the same structure.
+
+    The model's parameters and buffers become views of the memory-mapped file, so every
+    process loading it shares one physical copy through the page cache.
+
+    Args:
+        model: Model prepared by prepare_for_inference(), with any weights (or meta ones)
+        path: File written by save_prepared_weights()
+
+    Raises:
+        RuntimeError: If the file does not hold every parameter of the model
+    """
+    states = {key: {} for key in model}
+    for name, tensor in load_file(path, device='cpu').items():
+        key, name = name.split('.', 1)
+        states[key][name] = tensor
+    for key, component in model.items():
+        component.load_state_dict(states[key], assign=True)
+        if any(param.is_meta for param in component.parameters()):
+            raise RuntimeError(f"{path} is missing weights of {key}")
+
+def build_from_prepared_weights(build_model, prepare, path, device='cpu'):
+    """Build a model around weights saved by save_prepared_weights(), without loading the checkpoint.
+
+    The bare model is built with meta parameters, so no memory is spent on weights that
+    are replaced right away, then prepared and given the memory-mapped weights. Modules
+    must not be created on other threads meanwhile.
+
+    Args:
+        build_model: The hub build_model(checkpoint, device)
+        prepare: Function preparing a model for inference in place, without running it
+        path: File written by save_prepared_weights()
+        device: Device to run on; weights are shared between processes only on the CPU
+
+    Returns:
+        The prepared model
+    """
+    with _meta_parameters():
+        # device None leaves every tensor where it is created
+        model = build_model(_empty_checkpoint(), None)
+    prepare(model)
+    load_prepared_weights(model, path)
+    if str(device) != 'cpu':
+        for component in model.values():
+            component.to(device)
+    return model